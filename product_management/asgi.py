@@ -1,5 +1,8 @@
 """
 ASGI config for product_management project.
+
+Serves the inventory event stream (``products.sse``) next to Django;
+it needs an ASGI server.
 """
 
 import os
@@ -7,4 +10,9 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'product_management.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Imported once Django is set up.
+from products.sse import mount  # noqa: E402
+
+application = mount(django_application)
@@ -0,0 +1,121 @@
+"""
+SQLite backend for several worker processes writing to one file.
+
+Each new connection applies ``PRAGMAS`` (overridden per database by its
+``PRAGMAS`` setting):
+
+- ``journal_mode=wal`` lets readers carry on while a write is in progress
+  and writers append instead of rewriting pages in place.
+- ``synchronous=normal`` syncs at checkpoints instead of every commit. In
+  WAL mode this cannot corrupt the database; a power loss may drop the
+  last commits.
+- ``busy_timeout`` makes a connection wait for a lock instead of failing
+  with "database is locked" straight away.
+- ``mmap_size``, ``cache_size`` and ``temp_store`` keep reads, the page
+  cache and temporary sort tables in memory.
+
+Transactions (``atomic()``) begin with ``BEGIN IMMEDIATE``, taking the
+write lock up front. A plain ``BEGIN`` defers it to the first write, and a
+transaction that has already read cannot wait for the lock then: it fails
+at once if another connection committed in between.
+"""
+
+import threading
+
+from django.db import OperationalError
+from django.db.backends.sqlite3 import base
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+PRAGMAS = {
+    'journal_mode': 'wal',
+    'synchronous': 'normal',
+    'busy_timeout': 5000,
+    'mmap_size': 256 * 1024 * 1024,
+    # Negative sizes are in KiB: 64 MiB.
+    'cache_size': -64 * 1024,
+    'temp_store': 'memory',
+}
+
+_thread_locks = {}
+_thread_locks_guard = threading.Lock()
+
+
+def _thread_lock(name):
+    with _thread_locks_guard:
+        return _thread_locks.setdefault(name, threading.Lock())
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    holds_write_lock = False
+    write_lock_file = None
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        for name, value in self.pragmas.items():
+            conn.execute(f'PRAGMA {name} = {value}')
+        return conn
+
+    @property
+    def pragmas(self):
+        return dict(PRAGMAS, **self.settings_dict.get('PRAGMAS', {}))
+
+    def _start_transaction_under_autocommit(self):
+        self._acquire_write_lock()
+        try:
+            self.cursor().execute('BEGIN IMMEDIATE')
+        except Exception:
+            self._release_write_lock()
+            raise
+
+    def _commit(self):
+        try:
+            super()._commit()
+        finally:
+            self._release_write_lock()
+
+    def _rollback(self):
+        try:
+            super()._rollback()
+        finally:
+            self._release_write_lock()
+
+    def _close(self):
+        try:
+            super()._close()
+        finally:
+            self._release_write_lock()
+            if self.write_lock_file is not None:
+                self.write_lock_file.close()
+                self.write_lock_file = None
+
+    def _acquire_write_lock(self):
+        # Writers queue on a lock instead of polling SQLite's: the busy
+        # handler sleeps longer the longer it has waited, so under a burst
+        # late writers keep losing to new ones and the lock sits idle
+        # between polls. Threads of this process wait on a thread lock,
+        # with busy_timeout as the limit; one thread per process then
+        # waits on an flock() of a file next to the database, which the
+        # kernel hands over as soon as it is released.
+        if not _thread_lock(self.settings_dict['NAME']).acquire(
+                timeout=self.pragmas['busy_timeout'] / 1000):
+            raise OperationalError('database is locked')
+        self.holds_write_lock = True
+        if fcntl is not None and not self.is_in_memory_db():
+            try:
+                if self.write_lock_file is None:
+                    self.write_lock_file = open(f"{self.settings_dict['NAME']}-writelock", 'a')
+                fcntl.flock(self.write_lock_file, fcntl.LOCK_EX)
+            except Exception:
+                self._release_write_lock()
+                raise
+
+    def _release_write_lock(self):
+        if self.holds_write_lock:
+            self.holds_write_lock = False
+            if self.write_lock_file is not None:
+                fcntl.flock(self.write_lock_file, fcntl.LOCK_UN)
+            _thread_lock(self.settings_dict['NAME']).release()
@@ -1,16 +1,72 @@
 import os
 
+import environ
+
+env = environ.Env()
+
+
 def get_database_config():
     """
-    Configure SQLite database for local development.
+    Configure the databases from the environment.
+
+    ``DATABASE_ENGINE=postgresql`` connects to PostgreSQL with the
+    ``DATABASE_*`` settings; otherwise SQLite is used (``SQLITE_PATH``),
+    with the tuned backend in ``product_management.backends.sqlite3`` when
+    ``SQLITE_TUNING`` is set. ``DATABASE_REPLICAS`` adds read replicas named
+    ``replica1``, ``replica2``, ...: comma-separated ``host[:port]`` entries
+    sharing the primary's credentials for PostgreSQL, or database files
+    for SQLite.
     """
     BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-    
-    config = {
-        'default': {
+
+    if env('DATABASE_ENGINE', default='sqlite') == 'postgresql':
+        primary = {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': env('DATABASE_NAME', default='product_management'),
+            'USER': env('DATABASE_USER', default=''),
+            'PASSWORD': env('DATABASE_PASSWORD', default=''),
+            'HOST': env('DATABASE_HOST', default='localhost'),
+            'PORT': env('DATABASE_PORT', default='5432'),
+            # Keep connections open between requests, and check them
+            # before reuse so a restarted server does not fail a request.
+            'CONN_MAX_AGE': env.int('DATABASE_CONN_MAX_AGE', default=60),
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                'connect_timeout': env.int('DATABASE_CONNECT_TIMEOUT', default=5),
+            },
+        }
+        if env.bool('DATABASE_TRANSACTION_POOLING', default=False):
+            # Transaction pooling (PgBouncer, RDS Proxy) hands each
+            # transaction a different server connection, so server-side
+            # cursors cannot outlive one.
+            primary['DISABLE_SERVER_SIDE_CURSORS'] = True
+        replicas = [
+            _postgresql_replica(primary, entry) for entry in env.list('DATABASE_REPLICAS', default=[])
+        ]
+    else:
+        primary = {
             'ENGINE': 'django.db.backends.sqlite3',
-            'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+            'NAME': env('SQLITE_PATH', default=os.path.join(BASE_DIR, 'db.sqlite3')),
+            # A file rather than an in-memory database, so tests running
+            # several threads get SQLite's real locking.
+            'TEST': {'NAME': os.path.join(BASE_DIR, 'test_db.sqlite3')},
         }
-    }
+        if env.bool('SQLITE_TUNING', default=False):
+            primary['ENGINE'] = 'product_management.backends.sqlite3'
+            primary['PRAGMAS'] = {
+                'busy_timeout': env.int('SQLITE_BUSY_TIMEOUT', default=5000),
+            }
+        replicas = [dict(primary, NAME=path) for path in env.list('DATABASE_REPLICAS', default=[])]
+
+    config = {'default': primary}
+    for number, replica in enumerate(replicas, 1):
+        # Tests read the replicas' data from the test primary.
+        replica['TEST'] = {'MIRROR': 'default'}
+        config[f'replica{number}'] = replica
 
     return config
+
+
+def _postgresql_replica(primary, entry):
+    host, _, port = entry.partition(':')
+    return dict(primary, HOST=host, PORT=port or primary['PORT'], OPTIONS=dict(primary['OPTIONS']))
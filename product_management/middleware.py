@@ -0,0 +1,198 @@
+"""
+Opt-in per-request instrumentation, and read-replica routing.
+
+``RequestTimingMiddleware`` counts SQL queries and database time, splits
+view time from response rendering (DRF serialization to JSON, template
+rendering) and reports the numbers in a ``Server-Timing`` header and one
+structured log line per request. It is sync-only on purpose: under ASGI
+Django runs it in the same thread as sync views and thread-sensitive ORM
+calls, so the query wrapper sees every query the request makes.
+
+``ReplicaRoutingMiddleware`` decides per request whether reads may go to
+a replica (``product_management.routers``).
+"""
+
+import hashlib
+import json
+import logging
+import random
+import re
+import time
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+from .routers import replica_reads
+
+logger = logging.getLogger('product_management.timing')
+
+_WHITESPACE = re.compile(r'\s+')
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r'\b\d+(?:\.\d+)?\b')
+_VALUE_LIST = re.compile(r'\((?:\s*(?:%s|\?)\s*,)+\s*(?:%s|\?)\s*\)')
+
+
+def fingerprint(sql):
+    """
+    Normalize a SQL statement so queries that differ only in literal
+    values, or in the length of an IN (...) list, share one fingerprint.
+    """
+    sql = _WHITESPACE.sub(' ', sql).strip()
+    sql = _STRING_LITERAL.sub('?', sql)
+    sql = _NUMBER_LITERAL.sub('?', sql)
+    return _VALUE_LIST.sub('(...)', sql)
+
+
+class QueryTimer:
+    """
+    Database execute wrapper that accumulates query count and time.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.slowest_duration = 0.0
+        self.slowest_sql = None
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.count += 1
+            self.duration += elapsed
+            if elapsed >= self.slowest_duration:
+                self.slowest_duration = elapsed
+                self.slowest_sql = sql
+
+
+class RequestTimingMiddleware:
+    """
+    Enabled with ``REQUEST_TIMING_ENABLED``; ``REQUEST_TIMING_SAMPLE_RATE``
+    (0.0-1.0) limits it to a share of requests. When disabled Django drops
+    the middleware at startup, so it costs nothing.
+    """
+
+    def __init__(self, get_response):
+        if not settings.REQUEST_TIMING_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.sample_rate = settings.REQUEST_TIMING_SAMPLE_RATE
+
+    def __call__(self, request):
+        if self.sample_rate < 1 and random.random() >= self.sample_rate:
+            return self.get_response(request)
+
+        timer = QueryTimer()
+        request._timing = {}
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(timer))
+            response = self.get_response(request)
+        end = time.perf_counter()
+
+        self.report(request, response, timer, start, end)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if hasattr(request, '_timing'):
+            request._timing['view_start'] = time.perf_counter()
+
+    def process_template_response(self, request, response):
+        timing = getattr(request, '_timing', None)
+        if timing is not None:
+            timing['view_end'] = time.perf_counter()
+
+            def rendered(response):
+                timing['render_end'] = time.perf_counter()
+            response.add_post_render_callback(rendered)
+        return response
+
+    def report(self, request, response, timer, start, end):
+        timing = request._timing
+        view_start = timing.get('view_start', start)
+        view_end = timing.get('view_end', end)
+        metrics = {
+            'db': timer.duration,
+            'view': view_end - view_start,
+            'render': timing.get('render_end', view_end) - view_end,
+            'total': end - start,
+        }
+
+        slowest = None
+        if timer.slowest_sql is not None:
+            slowest = fingerprint(timer.slowest_sql)
+
+        header = [
+            f'db;dur={metrics["db"] * 1000:.2f};desc="{timer.count} queries"',
+            f'view;dur={metrics["view"] * 1000:.2f}',
+            f'render;dur={metrics["render"] * 1000:.2f}',
+            f'total;dur={metrics["total"] * 1000:.2f}',
+        ]
+        if slowest is not None:
+            digest = hashlib.sha1(slowest.encode()).hexdigest()[:12]
+            header.append(f'slowest-query;dur={timer.slowest_duration * 1000:.2f};desc="{digest}"')
+        response['Server-Timing'] = ', '.join(header)
+
+        logger.info(json.dumps({
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'queries': timer.count,
+            'db_ms': round(metrics['db'] * 1000, 2),
+            'view_ms': round(metrics['view'] * 1000, 2),
+            'render_ms': round(metrics['render'] * 1000, 2),
+            'total_ms': round(metrics['total'] * 1000, 2),
+            'slowest_query_ms': round(timer.slowest_duration * 1000, 2),
+            'slowest_query': slowest,
+        }))
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Lets GET, HEAD and OPTIONS requests read from the replicas. Any other request
+    sets a ``REPLICA_PIN_COOKIE`` for ``REPLICA_PIN_SECONDS``, during
+    which the client reads from the primary, so it sees its own writes
+    despite replication lag. Not used when no replicas are configured.
+    """
+    async_capable = True
+    sync_capable = True
+    safe_methods = ('GET', 'HEAD', 'OPTIONS')
+
+    def __init__(self, get_response):
+        if not settings.REPLICA_DATABASES:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with replica_reads(self.use_replicas(request)):
+            response = self.get_response(request)
+        return self.pin(request, response)
+
+    async def __acall__(self, request):
+        with replica_reads(self.use_replicas(request)):
+            response = await self.get_response(request)
+        return self.pin(request, response)
+
+    def use_replicas(self, request):
+        return (request.method in self.safe_methods
+                and settings.REPLICA_PIN_COOKIE not in request.COOKIES)
+
+    def pin(self, request, response):
+        if request.method not in self.safe_methods:
+            response.set_cookie(
+                settings.REPLICA_PIN_COOKIE, '1',
+                max_age=settings.REPLICA_PIN_SECONDS,
+                httponly=True,
+                samesite='Lax',
+            )
+        return response
@@ -0,0 +1,62 @@
+"""
+Read-replica routing.
+
+Replicas (``REPLICA_DATABASES``, configured from ``DATABASE_REPLICAS``)
+only serve reads that ``ReplicaRoutingMiddleware`` marks as safe for the
+current request: GET and HEAD requests from clients that have not written
+anything in the last ``REPLICA_PIN_SECONDS``. Such a request reads from
+one replica, picked at random when it starts, so its count, rows and ETag
+agree even if the replicas lag by different amounts. Everything else,
+including management commands, signal handlers and the reads inside a
+write request, uses the primary, so code only reads from a replica where
+it was allowed to.
+"""
+
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+
+# The replica reads go to, or None for the primary.
+_replica = ContextVar('replica', default=None)
+
+
+@contextmanager
+def replica_reads(allowed=True):
+    """
+    Let reads in this block go to one replica (or, with ``allowed=False``,
+    force them to the primary). A block inside another replica block keeps
+    its replica. Propagates to ``sync_to_async`` threads.
+    """
+    alias = None
+    if allowed and settings.REPLICA_DATABASES:
+        alias = _replica.get() or random.choice(settings.REPLICA_DATABASES)
+    token = _replica.set(alias)
+    try:
+        yield
+    finally:
+        _replica.reset(token)
+
+
+def use_primary():
+    """
+    Read from the primary inside this block, e.g. to build data that is
+    cached under the primary's current data versions.
+    """
+    return replica_reads(False)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        return _replica.get() or 'default'
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == 'default'
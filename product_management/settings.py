@@ -1,5 +1,7 @@
+import importlib.util
 import os
 import environ
+from django.core.exceptions import ImproperlyConfigured
 
 env = environ.Env()
 
@@ -31,8 +33,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'product_management.middleware.RequestTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
+    'product_management.middleware.ReplicaRoutingMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -42,13 +46,17 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# WhiteNoise is sync-only: under ASGI it would push every request through
+# a thread. The ASGI profile turns it off and leaves /static/ to nginx.
+if not env.bool('WHITENOISE_ENABLED', default=True):
+    MIDDLEWARE.remove('whitenoise.middleware.WhiteNoiseMiddleware')
+
 ROOT_URLCONF = 'product_management.urls'
 
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         'DIRS': [os.path.join(BASE_DIR, 'templates')],
-        'APP_DIRS': True,
         'OPTIONS': {
             'context_processors': [
                 'django.template.context_processors.debug',
@@ -56,6 +64,15 @@ TEMPLATES = [
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
             ],
+            # Compile each template once per process instead of on every
+            # render (replaces APP_DIRS, which cannot be combined with
+            # explicit loaders). runserver clears it when a template changes.
+            'loaders': [
+                ('django.template.loaders.cached.Loader', [
+                    'django.template.loaders.filesystem.Loader',
+                    'django.template.loaders.app_directories.Loader',
+                ]),
+            ],
         },
     },
 ]
@@ -66,6 +83,34 @@ from .database import get_database_config
 
 DATABASES = get_database_config()
 
+# Read replicas and read-your-writes stickiness, see
+# product_management.routers.
+DATABASE_ROUTERS = ['product_management.routers.ReplicaRouter']
+REPLICA_DATABASES = [alias for alias in DATABASES if alias != 'default']
+REPLICA_PIN_COOKIE = 'replica_pin'
+REPLICA_PIN_SECONDS = env.int('REPLICA_PIN_SECONDS', default=10)
+
+# Cache backend, e.g. locmemcache:// for a single process or
+# rediscache://host:6379/1 / dbcache://product_cache to share cached
+# snapshots and data versions across gunicorn workers.
+CACHES = {
+    'default': env.cache('CACHE_URL', default='locmemcache://'),
+}
+# Each worker would keep its own data versions, so a write in one would not
+# invalidate the snapshots cached by the others. WEB_CONCURRENCY is
+# gunicorn's worker count.
+if (env.int('WEB_CONCURRENCY', default=1) > 1
+        and CACHES['default']['BACKEND'] == 'django.core.cache.backends.locmem.LocMemCache'):
+    raise ImproperlyConfigured('CACHE_URL must be a shared cache when WEB_CONCURRENCY > 1')
+
+# How long versioned snapshots (dashboard, dashboard_stats) are kept.
+# They are invalidated by data-version bumps, so this only bounds memory.
+SNAPSHOT_CACHE_TIMEOUT = env.int('SNAPSHOT_CACHE_TIMEOUT', default=3600)
+
+# Serve API list pages from .values() rows instead of model instances
+# (products.fast_serializers); the JSON is identical either way.
+FAST_SERIALIZATION = env.bool('FAST_SERIALIZATION', default=True)
+
 AUTH_PASSWORD_VALIDATORS = [
     {'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator'},
     {'NAME': 'django.contrib.auth.password_validation.MinimumLengthValidator'},
@@ -90,9 +135,28 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 REST_FRAMEWORK = {
     'DEFAULT_FILTER_BACKENDS': ['django_filters.rest_framework.DjangoFilterBackend'],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
-    'PAGE_SIZE': 10
+    'PAGE_SIZE': 10,
+    # orjson-backed JSON (stdlib fallback); same output as DRF's JSONRenderer.
+    'DEFAULT_RENDERER_CLASSES': [
+        'products.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'products.renderers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
 }
 
+# application/msgpack for internal clients when msgpack is installed.
+if importlib.util.find_spec('msgpack') is not None:
+    REST_FRAMEWORK['DEFAULT_RENDERER_CLASSES'].append('products.renderers.MessagePackRenderer')
+    REST_FRAMEWORK['DEFAULT_PARSER_CLASSES'].append('products.renderers.MessagePackParser')
+
+# 'cursor' pages large lists by stable keys (no COUNT/OFFSET); 'page' uses
+# page numbers everywhere. Small tables such as categories always use pages.
+PAGINATION_MODE = env('PAGINATION_MODE', default='cursor')
+
 CORS_ALLOWED_ORIGINS = env.list('CORS_ALLOWED_ORIGINS', default=[])
 CORS_ALLOW_ALL_ORIGINS = env.bool('CORS_ALLOW_ALL_ORIGINS', default=True)
 
@@ -104,9 +168,64 @@ CRISPY_TEMPLATE_PACK = "bootstrap5"
 LOGIN_URL = '/admin/login/'
 LOGIN_REDIRECT_URL = '/'
 
+# Products at or below this stock level count as low stock.
+LOW_STOCK_THRESHOLD = env.int('LOW_STOCK_THRESHOLD', default=10)
+
+# Inventory event stream (/api/events/inventory/, ASGI only). The default
+# broker only reaches clients connected to the same process; use
+# products.events.RedisBroker when running several workers.
+INVENTORY_EVENTS_BROKER = env('INVENTORY_EVENTS_BROKER', default='products.events.InProcessBroker')
+INVENTORY_EVENTS_REDIS_URL = env('INVENTORY_EVENTS_REDIS_URL', default='redis://localhost:6379/0')
+INVENTORY_EVENTS_REDIS_CHANNEL = env('INVENTORY_EVENTS_REDIS_CHANNEL', default='inventory-events')
+
+# Columnar snapshot of the sales facts (products.snapshot), appended to by
+# manage.py snapshot_sales. Sale items younger than the lag are left for
+# the next run, in case an older transaction has yet to commit.
+SALES_SNAPSHOT_DIR = env('SALES_SNAPSHOT_DIR', default=os.path.join(BASE_DIR, 'snapshots', 'sales'))
+SALES_SNAPSHOT_LAG_SECONDS = env.int('SALES_SNAPSHOT_LAG_SECONDS', default=60)
+
+# Request instrumentation (Server-Timing header + structured log line)
+REQUEST_TIMING_ENABLED = env.bool('REQUEST_TIMING_ENABLED', default=False)
+REQUEST_TIMING_SAMPLE_RATE = env.float('REQUEST_TIMING_SAMPLE_RATE', default=1.0)
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'product_management.timing': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+    },
+}
+
+# Sessions: django.contrib.sessions.backends.cached_db serves session
+# reads from CACHE_URL and saves a database query per page view.
+SESSION_ENGINE = env('SESSION_ENGINE', default='django.contrib.sessions.backends.db')
+
 # Message Settings
 MESSAGE_STORAGE = 'django.contrib.messages.storage.session.SessionStorage'
 
 # File Upload Settings
 FILE_UPLOAD_MAX_MEMORY_SIZE = 5242880  # 5MB
 FILE_UPLOAD_PERMISSIONS = 644
+
+# Background tasks (products.tasks): 'thread' runs them in a pool of
+# TASK_WORKERS threads in each process, 'database' queues them in the
+# database for manage.py run_tasks, 'inline' runs them right after commit.
+# Stock SQLite fails a request's write while a task thread holds the write
+# lock instead of waiting for it (see SQLITE_TUNING), so it runs them inline,
+# except slow ones such as image renditions and retries of failed ones.
+TASK_BACKEND = env(
+    'TASK_BACKEND',
+    default='inline' if DATABASES['default']['ENGINE'] == 'django.db.backends.sqlite3' else 'thread'
+)
+TASK_WORKERS = env.int('TASK_WORKERS', default=2)
+TASK_QUEUE_SIZE = env.int('TASK_QUEUE_SIZE', default=1000)
+# Database tasks still running after this long are taken to have lost
+# their worker and are run again.
+TASK_LEASE_SECONDS = env.int('TASK_LEASE_SECONDS', default=300)
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Category, Product, Customer, Sale, SaleItem
+from .models import Category, Product, Customer, Sale, SaleItem, QueuedTask
 
 @admin.register(Category)
 class CategoryAdmin(admin.ModelAdmin):
@@ -37,3 +37,9 @@ class SaleItemAdmin(admin.ModelAdmin):
     list_display = ('sale', 'product', 'quantity', 'unit_price', 'total_price')
     list_filter = ('sale', 'product')
     readonly_fields = ('total_price',)
+
+@admin.register(QueuedTask)
+class QueuedTaskAdmin(admin.ModelAdmin):
+    list_display = ('id', 'name', 'status', 'attempts', 'run_after', 'created_at')
+    list_filter = ('status', 'name')
+    readonly_fields = ('started_at', 'last_error', 'created_at')
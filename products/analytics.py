@@ -0,0 +1,285 @@
+"""
+Sales time series for ``/api/analytics/sales/``.
+
+Each request runs one grouped query, summing completed sales per day (or
+hour) and per category, product or customer. NumPy folds the days into
+weeks or months, places every row on a dense period axis and aligns the
+series, with gaps as zeros. Grouping by the stored day instead of by
+month or week in SQL keeps date functions out of the query, which SQLite
+would run in Python for every row.
+
+Day, week and month series without customers read the daily rollup
+tables (``products.rollups``), so multi-year charts sum one row per day
+(and product) instead of every sale. Hourly and per-customer series read
+the sales themselves. Results are cached per parameter set until the
+data they were built from changes.
+"""
+
+import datetime
+
+import numpy as np
+from django.db.models import Count, Sum
+from django.db.models.functions import ExtractHour, TruncDate
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+
+from .cache import cached_snapshot
+from .exports import parse_since
+from .models import Category, Customer, DailyProductSales, DailySales, Product, Sale, SaleItem
+
+# Bucket unit, period step and default window (in periods) per granularity.
+GRANULARITIES = {
+    'hour': ('h', 1, 48),
+    'day': ('D', 1, 30),
+    'week': ('D', 7, 26),
+    'month': ('M', 1, 12),
+}
+
+GROUP_BY = ('category', 'product', 'customer')
+
+# Longest period axis a request may ask for, e.g. about 7 months of hours.
+MAX_PERIODS = 5000
+
+# Series returned by default and at most; the rest are summed into "Other".
+DEFAULT_TOP = 10
+MAX_TOP = 100
+
+# 1970-01-01 was a Thursday.
+EPOCH_WEEKDAY = 3
+EPOCH_ORDINAL = datetime.date(1970, 1, 1).toordinal()
+
+
+class Source:
+    """
+    Where a kind of series is read from: ``queryset`` rows are grouped by
+    ``key``/``label`` and the period of ``date`` and summed into ``amount``
+    and a second metric, ``count``, reported under ``count_name``.
+    """
+
+    def __init__(self, queryset, date, amount, count, count_name, key=None, label=None, models=()):
+        self.queryset = queryset
+        self.date = date
+        self.amount = amount
+        self.count = count
+        self.count_name = count_name
+        self.key = key
+        self.label = label
+        self.models = models
+
+
+def get_source(granularity, group_by):
+    completed_sales = Sale.objects.filter(status='completed')
+    completed_items = SaleItem.objects.filter(sale__status='completed')
+    if granularity != 'hour' and group_by is None:
+        return Source(DailySales.objects.all(), 'date', Sum('total_amount'), Sum('sales_count'), 'sales',
+                      models=(DailySales,))
+    if granularity != 'hour' and group_by == 'category':
+        return Source(DailyProductSales.objects.all(), 'date', Sum('total_amount'), Sum('quantity'), 'quantity',
+                      'category_id', 'category__name', (DailyProductSales, Category))
+    if granularity != 'hour' and group_by == 'product':
+        return Source(DailyProductSales.objects.all(), 'date', Sum('total_amount'), Sum('quantity'), 'quantity',
+                      'product_id', 'product__name', (DailyProductSales, Product))
+    if group_by is None:
+        return Source(completed_sales, 'sale_date', Sum('total_amount'), Count('id'), 'sales',
+                      models=(Sale,))
+    if group_by == 'customer':
+        return Source(completed_sales, 'sale_date', Sum('total_amount'), Count('id'), 'sales',
+                      'customer_id', 'customer__name', (Sale, Customer))
+    if group_by == 'category':
+        return Source(completed_items, 'sale__sale_date', Sum('total_price'), Sum('quantity'), 'quantity',
+                      'product__category_id', 'product__category__name', (Sale, SaleItem, Category))
+    return Source(completed_items, 'sale__sale_date', Sum('total_price'), Sum('quantity'), 'quantity',
+                  'product_id', 'product__name', (Sale, SaleItem, Product))
+
+
+def parse_query(params):
+    """
+    Validate the request's ``granularity``, ``group_by``, ``from``, ``to``
+    and ``top`` parameters. ``from`` and ``to`` are ISO dates or datetimes
+    and are widened to whole periods; without them the series ends with
+    the current period. Raises ``ValidationError``.
+    """
+    granularity = params.get('granularity') or 'day'
+    if granularity not in GRANULARITIES:
+        raise ValidationError({'granularity': [f'Must be one of: {", ".join(GRANULARITIES)}.']})
+    step, default_periods = GRANULARITIES[granularity][1:]
+
+    group_by = params.get('group_by') or None
+    if group_by is not None and group_by not in GROUP_BY:
+        raise ValidationError({'group_by': [f'Must be one of: {", ".join(GROUP_BY)}.']})
+
+    bounds = {}
+    for name in ('from', 'to'):
+        try:
+            value = parse_since(params.get(name))
+        except ValueError as exc:
+            raise ValidationError({name: [str(exc)]})
+        if value is not None:
+            bounds[name] = _bucket(np.datetime64(timezone.localtime(value).replace(tzinfo=None)), granularity)
+    end = bounds.get('to', _bucket(np.datetime64(timezone.localtime().replace(tzinfo=None)), granularity))
+    start = bounds.get('from', end - step * (default_periods - 1))
+    if start > end:
+        raise ValidationError({'from': ['Must not be after "to".']})
+    if (end - start).astype(np.int64) // step + 1 > MAX_PERIODS:
+        raise ValidationError({'granularity': [
+            f'More than {MAX_PERIODS} periods requested; use a coarser granularity or a shorter range.'
+        ]})
+
+    try:
+        top = int(params.get('top') or DEFAULT_TOP)
+    except ValueError:
+        raise ValidationError({'top': ['Must be an integer.']})
+    if not 1 <= top <= MAX_TOP:
+        raise ValidationError({'top': [f'Must be between 1 and {MAX_TOP}.']})
+
+    return {'granularity': granularity, 'group_by': group_by, 'start': start, 'end': end, 'top': top}
+
+
+def source_models(query):
+    """Models the series for ``query`` are built from, for caching."""
+    return get_source(query['granularity'], query['group_by']).models
+
+
+def cached_sales_series(query):
+    """``sales_series()`` for a ``parse_query()`` result, cached."""
+    return cached_snapshot(
+        'analytics:sales', source_models(query), lambda: sales_series(**query),
+        query['granularity'], query['group_by'], str(query['start']), str(query['end']), query['top']
+    )
+
+
+def sales_series(granularity, group_by, start, end, top=DEFAULT_TOP):
+    """
+    Completed sales from period ``start`` to ``end`` (``datetime64``
+    bucket starts, inclusive) as dense series: one per group (the ``top``
+    groups by amount, then the rest as "Other"), or a single one without
+    ``group_by``.
+    """
+    source = get_source(granularity, group_by)
+    axis = period_axis(granularity, start, end)
+    step = GRANULARITIES[granularity][1]
+    days, hours, keys, labels, amounts, counts = _fetch(source, granularity, axis[0], axis[-1] + step)
+    stamps = days if hours is None else days.astype('datetime64[h]') + hours
+    return dense_series(
+        granularity, group_by, axis, stamps, keys, np.rint(amounts * 100).astype(np.int64),
+        counts, source.count_name, top, lambda group_keys, rows: [labels[row] for row in rows]
+    )
+
+
+def period_axis(granularity, start, end):
+    """Every period start from ``start`` to ``end``, inclusive."""
+    return np.arange(start, end + GRANULARITIES[granularity][1], GRANULARITIES[granularity][1])
+
+
+def dense_series(granularity, group_by, axis, stamps, keys, cents, counts, count_name, top, labels):
+    """
+    Sum rows into the response of ``sales_series()``. Each row has a time
+    (``stamps``, ``datetime64`` within the periods of ``axis``), a group
+    key, an amount in cents and a count. ``labels(keys, rows)`` returns
+    the labels of the groups shown, given their keys and the index of a
+    row of each.
+    """
+    columns = np.searchsorted(axis, _bucket(stamps, granularity))
+    group_keys, first, groups = np.unique(keys, return_index=True, return_inverse=True)
+    groups = groups.reshape(-1)
+    if group_by is None:
+        # A single series, even without any sales.
+        shown, height = np.zeros(1, dtype=np.int64), 1
+    else:
+        totals = np.bincount(groups, weights=cents, minlength=len(group_keys))
+        shown = np.argsort(-totals, kind='stable')[:top]
+        height = len(shown) + (len(group_keys) > top)
+    # Output row of every group; groups past ``top`` share the last one.
+    series_rows = np.full(max(len(group_keys), 1), len(shown))
+    series_rows[shown] = np.arange(len(shown))
+
+    cells = series_rows[groups] * len(axis) + columns
+    amount_matrix = _dense_sum(cells, cents, height, len(axis))
+    count_matrix = _dense_sum(cells, counts, height, len(axis))
+
+    if group_by is None:
+        heads = [(None, 'All sales')]
+    else:
+        shown_keys = group_keys[shown].tolist()
+        heads = list(zip(shown_keys, labels(shown_keys, first[shown].tolist())))
+        if height > len(shown):
+            heads.append((None, 'Other'))
+    series = []
+    for row, (key, label) in enumerate(heads):
+        series.append({
+            'key': key,
+            'label': label,
+            'total_amount': int(amount_matrix[row].sum()) / 100,
+            f'total_{count_name}': int(count_matrix[row].sum()),
+            'amount': (amount_matrix[row] / 100).tolist(),
+            count_name: count_matrix[row].tolist(),
+        })
+    return {
+        'granularity': granularity,
+        'group_by': group_by,
+        'periods': _period_labels(axis, granularity),
+        'series': series,
+    }
+
+
+def _fetch(source, granularity, start, stop):
+    """
+    Run the grouped query for periods from ``start`` up to ``stop`` and
+    return its columns as arrays: the day, the hour (None unless hourly),
+    group keys and labels, amounts and counts.
+    """
+    if source.date == 'date':
+        # A rollup: already one row per day.
+        period = {}
+    else:
+        period = {'day': TruncDate(source.date)}
+        if granularity == 'hour':
+            period['hour'] = ExtractHour(source.date)
+    group = [source.key, source.label] if source.key else []
+    rows = source.queryset.filter(**{
+        f'{source.date}__gte': _to_python(start, source.date == 'date'),
+        f'{source.date}__lt': _to_python(stop, source.date == 'date'),
+    }).annotate(**period).values(*(period or [source.date]), *group).annotate(
+        amount_sum=source.amount, count_sum=source.count
+    ).order_by().values_list(*(period or [source.date]), *group, 'amount_sum', 'count_sum')
+
+    columns = list(zip(*rows)) or [()] * (max(len(period), 1) + len(group) + 2)
+    days = (np.fromiter(map(datetime.date.toordinal, columns[0]), np.int64, len(columns[0]))
+            - EPOCH_ORDINAL).astype('datetime64[D]')
+    hours = np.array(columns[1], dtype=np.int64) if 'hour' in period else None
+    if group:
+        keys = np.array(columns[-4], dtype=np.int64)
+        labels = columns[-3]
+    else:
+        keys, labels = np.zeros(len(days), dtype=np.int64), ()
+    amounts = np.array(columns[-2], dtype=np.float64)
+    counts = np.array(columns[-1], dtype=np.int64)
+    return days, hours, keys, labels, amounts, counts
+
+
+def _dense_sum(cells, values, height, width):
+    return np.bincount(cells, weights=values, minlength=height * width).round().astype(np.int64).reshape(
+        height, width
+    )
+
+
+def _bucket(stamps, granularity):
+    """Start of the period each ``datetime64`` in ``stamps`` falls in."""
+    stamps = stamps.astype(f'datetime64[{GRANULARITIES[granularity][0]}]')
+    if granularity == 'week':
+        # Weeks start on Monday.
+        stamps = stamps - (stamps.astype(np.int64) + EPOCH_WEEKDAY) % 7
+    return stamps
+
+
+def _to_python(stamp, is_date):
+    value = stamp.astype('datetime64[s]').astype(datetime.datetime)
+    if is_date:
+        return value.date()
+    return timezone.make_aware(value)
+
+
+def _period_labels(axis, granularity):
+    if granularity == 'hour':
+        return np.datetime_as_string(axis, unit='m').tolist()
+    return np.datetime_as_string(axis.astype('datetime64[D]')).tolist()
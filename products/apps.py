@@ -9,5 +9,7 @@ class ProductsConfig(AppConfig):
         """
         Import signal handlers when the app is ready
         """
-        # Import signal handlers here if needed in the future
-        pass
+        from django.db.models.signals import post_migrate
+        from . import signals  # noqa: F401
+        from .search import install_after_migrate
+        post_migrate.connect(install_after_migrate, sender=self)
@@ -0,0 +1,144 @@
+"""
+Async variants of the read-heavy endpoints, for ASGI deployments.
+
+    /async/                              DashboardView
+    /api/async/products/                 ProductViewSet.list
+    /api/async/products/<id>/            ProductViewSet.retrieve
+    /api/async/products/low_stock/       ProductViewSet.low_stock
+    /api/async/sales/dashboard_stats/    SaleViewSet.dashboard_stats
+
+They answer with the same JSON (or HTML) as the synchronous views, and
+share their cached snapshots and conditional GET validators; the JSON
+endpoints only render JSON.
+
+Django 4.2's async ORM runs every query on the single thread the request
+uses for sync code, so awaiting several queries still runs them one after
+another. The dashboards' independent queries go through
+``gather_queries()`` instead, which runs each on its own worker thread
+and database connection at the same time. DRF's filter backends and
+paginators are synchronous, so the product list runs the regular viewset
+in a worker thread.
+"""
+
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.views import redirect_to_login
+from django.db import close_old_connections
+from django.http import HttpResponse
+from django.shortcuts import render
+from django.utils import timezone
+from rest_framework import status
+
+from .cache import acached_snapshot
+from .conditional import (
+    aconditional_response, alist_validators, object_validators, version_validators,
+)
+from .fast_serializers import ValuesSerializer
+from .models import Product
+from .renderers import FastJSONRenderer
+from .views import (
+    DASHBOARD_MODELS, DASHBOARD_STATS_MODELS, DashboardView, ProductViewSet, SaleViewSet,
+    dashboard_parts, dashboard_stats_parts,
+)
+
+_product_list = ProductViewSet.as_view({'get': 'list'})
+
+
+async def gather_queries(*functions):
+    """
+    Run blocking ``functions`` concurrently, each in a worker thread with
+    its own database connection, and return their results in order.
+    """
+    return await asyncio.gather(*(
+        sync_to_async(_closing_connections(function), thread_sensitive=False)()
+        for function in functions
+    ))
+
+
+async def dashboard(request):
+    if not await sync_to_async(lambda: request.user.is_authenticated)():
+        return redirect_to_login(request.get_full_path())
+    context = await acached_snapshot(
+        'dashboard', DASHBOARD_MODELS, lambda: _build(dashboard_parts()),
+        timezone.localdate().isoformat(), settings.LOW_STOCK_THRESHOLD
+    )
+    return await sync_to_async(render)(request, DashboardView.template_name, context)
+
+
+async def dashboard_stats(request):
+    etag, last_modified = await sync_to_async(version_validators)(request, DASHBOARD_STATS_MODELS)
+
+    async def respond():
+        return _json(await acached_snapshot(
+            'dashboard_stats', DASHBOARD_STATS_MODELS,
+            lambda: _build(dashboard_stats_parts(SaleViewSet.queryset.all()))
+        ))
+    return await aconditional_response(request, etag, last_modified, respond)
+
+
+async def product_list(request):
+    return await sync_to_async(_closing_connections(_render_list), thread_sensitive=False)(request)
+
+
+async def product_detail(request, pk):
+    try:
+        product = await ProductViewSet.queryset.aget(pk=pk)
+    except Product.DoesNotExist:
+        return _json({'detail': 'Not found.'}, status.HTTP_404_NOT_FOUND)
+    etag, last_modified = object_validators(request, product, ProductViewSet.last_modified_fields)
+
+    async def respond():
+        serializer = ProductViewSet.serializer_class(product, context={'request': request})
+        return _json(serializer.data)
+    return await aconditional_response(request, etag, last_modified, respond)
+
+
+async def low_stock(request):
+    try:
+        threshold = int(request.GET.get('threshold', settings.LOW_STOCK_THRESHOLD))
+    except ValueError:
+        return _json({'threshold': ['A valid integer is required.']}, status.HTTP_400_BAD_REQUEST)
+    products = ProductViewSet.queryset.filter(stock__lte=threshold)
+    etag, last_modified = await alist_validators(
+        request, products, ProductViewSet.last_modified_fields
+    )
+
+    async def respond():
+        serializer = ValuesSerializer(ProductViewSet.serializer_class, {'request': request})
+        return _json(serializer.serialize([row async for row in serializer.values(products)]))
+    return await aconditional_response(
+        request, etag, last_modified, respond, check_last_modified=False
+    )
+
+
+async def _build(parts):
+    data = {}
+    for part in await gather_queries(*parts):
+        data.update(part)
+    return data
+
+
+def _render_list(request):
+    response = _product_list(request)
+    if hasattr(response, 'render'):
+        response.render()
+    return response
+
+
+def _closing_connections(function):
+    # Worker threads outlive the request, so give their connections the
+    # same CONN_MAX_AGE treatment the request thread gets.
+    def run(*args, **kwargs):
+        try:
+            return function(*args, **kwargs)
+        finally:
+            close_old_connections()
+    return run
+
+
+def _json(data, status_code=status.HTTP_200_OK):
+    return HttpResponse(
+        FastJSONRenderer().render(data), status=status_code, content_type='application/json'
+    )
@@ -0,0 +1,641 @@
+"""
+Endpoint benchmarks: latency percentiles, throughput and SQL query counts
+for every route in ``products/urls.py``.
+
+Requests go through Django's test client in-process (the WSGI handler,
+or the ASGI handler with ``ASGITransport``), or over HTTP to a running
+gunicorn/uvicorn instance when a base URL is given. In-process runs count
+queries with a database execute wrapper (``request_queries()``); HTTP
+runs read the count from
+the ``Server-Timing`` header, so enable ``REQUEST_TIMING_ENABLED`` on the
+server to get it.
+
+Results are plain dicts that serialize to the JSON baseline format read
+back by ``compare()``.
+
+``sale_burst()`` measures the sale write path alone, from several worker
+processes at once, to check that SQLite sustains bursts of checkouts.
+"""
+
+import asyncio
+import contextvars
+import http.client
+import json
+import math
+import multiprocessing
+import platform
+import random
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import timedelta
+from urllib.parse import urlsplit
+
+import django
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import OperationalError, connection, connections
+from django.db.backends.signals import connection_created
+from django.test import AsyncClient, Client
+from django.utils import timezone
+
+from .models import Category, Customer, Product, Sale, SaleItem
+
+# Dataset sizes for ``--scale``.
+SCALES = {
+    'small': {'products': 500, 'customers': 1000, 'sales': 5000},
+    'medium': {'products': 5000, 'customers': 20000, 'sales': 200000},
+    'large': {'products': 50000, 'customers': 200000, 'sales': 2000000},
+}
+
+# Metrics compared against a baseline, and whether higher is better.
+COMPARED_METRICS = {
+    'p50_ms': False,
+    'p95_ms': False,
+    'p99_ms': False,
+    'throughput_rps': True,
+}
+
+BENCHMARK_USERNAME = 'benchmark'
+BULK_SALES_PER_REQUEST = 10
+
+_QUERY_COUNT = 'queries"'
+
+
+class Route:
+    def __init__(self, name, path, method='GET', body=None, login=False, variant_of=None):
+        self.name = name
+        self.path = path
+        self.method = method
+        self.body = body
+        self.login = login
+        # For async variants, the synchronous route they stand in for.
+        self.variant_of = variant_of
+
+
+def build_routes():
+    """
+    Return the routes to benchmark, with ids taken from the current data.
+    HTML views need a logged-in user; API routes are requested anonymously.
+    """
+    product = Product.objects.order_by('name', 'id').first()
+    category = Category.objects.order_by('-product_count', 'id').first()
+    customer = Customer.objects.filter(sales__isnull=False).order_by('id').first()
+    sale = Sale.objects.order_by('-id').first()
+    sale_item = SaleItem.objects.order_by('-id').first()
+    if not all([product, category, customer, sale, sale_item]):
+        raise ValueError('The database needs categories, products, customers and sales.')
+
+    search = product.name.split()[0]
+    since = (timezone.localdate() - timedelta(days=7)).isoformat()
+    # Writes buy one unit of the best-stocked product so they rarely run out.
+    stocked = Product.objects.order_by('-stock', 'id').first()
+    new_sale = {
+        'customer': customer.id,
+        'status': 'pending',
+        'items': [{'product': stocked.id, 'quantity': 1}],
+    }
+
+    return [
+        Route('dashboard', '/', login=True),
+        Route('product_list', '/products/', login=True),
+        Route('product_list_search', f'/products/?search={search}', login=True),
+        Route('product_create_form', '/products/create/', login=True),
+        Route('product_edit_form', f'/products/{product.id}/edit/', login=True),
+        Route('category_list', '/categories/', login=True),
+        Route('customer_list', '/customers/', login=True),
+        Route('sale_list', '/sales/', login=True),
+        Route('api_categories', '/api/categories/'),
+        Route('api_category_detail', f'/api/categories/{category.id}/'),
+        Route('api_category_products', f'/api/categories/{category.id}/products/'),
+        Route('api_products', '/api/products/'),
+        Route('api_product_detail', f'/api/products/{product.id}/'),
+        Route('api_product_search', f'/api/products/?search={search}'),
+        Route('api_products_low_stock', '/api/products/low_stock/'),
+        Route('api_products_export', f'/api/products/export/?since={since}'),
+        Route('api_customers', '/api/customers/'),
+        Route('api_customer_detail', f'/api/customers/{customer.id}/'),
+        Route('api_customer_purchase_history', f'/api/customers/{customer.id}/purchase_history/'),
+        Route('api_sales', '/api/sales/'),
+        Route('api_sale_detail', f'/api/sales/{sale.id}/'),
+        Route('api_sales_dashboard_stats', '/api/sales/dashboard_stats/'),
+        Route('api_sales_export', f'/api/sales/export/?since={since}'),
+        Route('api_sale_create', '/api/sales/', method='POST', body=new_sale),
+        Route('api_sales_bulk', '/api/sales/bulk/', method='POST',
+              body=[new_sale] * BULK_SALES_PER_REQUEST),
+        Route('api_sale_items', '/api/sale-items/'),
+        Route('api_sale_item_detail', f'/api/sale-items/{sale_item.id}/'),
+        Route('api_sale_items_export', f'/api/sale-items/export/?since={since}'),
+        Route('async_dashboard', '/async/', login=True, variant_of='dashboard'),
+        Route('api_async_products', '/api/async/products/', variant_of='api_products'),
+        Route('api_async_product_detail', f'/api/async/products/{product.id}/',
+              variant_of='api_product_detail'),
+        Route('api_async_products_low_stock', '/api/async/products/low_stock/',
+              variant_of='api_products_low_stock'),
+        Route('api_async_sales_dashboard_stats', '/api/async/sales/dashboard_stats/',
+              variant_of='api_sales_dashboard_stats'),
+    ]
+
+
+def session_cookie():
+    """
+    Log the benchmark user in and return its session cookie value.
+    """
+    user, created = get_user_model().objects.get_or_create(username=BENCHMARK_USERNAME)
+    if created:
+        user.set_unusable_password()
+        user.save()
+    client = Client()
+    client.force_login(user)
+    return client.cookies[settings.SESSION_COOKIE_NAME].value
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        with self.lock:
+            self.count += 1
+        return execute(sql, params, many, context)
+
+
+# The execute wrapper of the request being measured, if any.
+_request_wrapper = contextvars.ContextVar('benchmark_query_wrapper', default=None)
+
+
+@contextmanager
+def request_queries(wrapper):
+    """
+    Pass the queries of requests made in the block through ``wrapper``
+    (an execute wrapper). Async views query from ``sync_to_async``
+    threads, whose connections a wrapper installed on this thread's would
+    miss, so queries are attributed through a context variable, which
+    ``sync_to_async`` and ``async_to_sync`` carry into those threads.
+    """
+    connection_created.connect(_install_request_wrapper)
+    for conn in connections.all():
+        _install_request_wrapper(connection=conn)
+    token = _request_wrapper.set(wrapper)
+    try:
+        yield
+    finally:
+        _request_wrapper.reset(token)
+
+
+def _wrap_request_query(execute, sql, params, many, context):
+    wrapper = _request_wrapper.get()
+    if wrapper is None:
+        return execute(sql, params, many, context)
+    return wrapper(execute, sql, params, many, context)
+
+
+def _install_request_wrapper(sender=None, connection=None, **kwargs):
+    if _wrap_request_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_wrap_request_query)
+
+
+class InProcessTransport:
+    """
+    Sends requests through the test client. Each thread gets its own
+    clients and, through Django, its own database connections.
+    """
+    name = 'in-process'
+
+    def __init__(self, cookie):
+        self.cookie = cookie
+        self.local = threading.local()
+        self.host = self.host_name()
+
+    @staticmethod
+    def host_name():
+        return next(
+            (host.lstrip('.') for host in settings.ALLOWED_HOSTS if host != '*'), 'testserver'
+        )
+
+    def client(self, login):
+        key = 'user' if login else 'anonymous'
+        client = getattr(self.local, key, None)
+        if client is None:
+            client = Client(raise_request_exception=False, SERVER_NAME=self.host)
+            if login:
+                client.cookies[settings.SESSION_COOKIE_NAME] = self.cookie
+            setattr(self.local, key, client)
+        return client
+
+    def request(self, route):
+        client = self.client(route.login)
+        counter = QueryCounter()
+        start = time.perf_counter()
+        with request_queries(counter):
+            if route.method == 'POST':
+                response = client.post(route.path, json.dumps(route.body),
+                                       content_type='application/json')
+            else:
+                response = client.get(route.path)
+            # Drain streamed exports so the whole body is timed.
+            if response.streaming:
+                _drain(response)
+            else:
+                response.content
+        elapsed = time.perf_counter() - start
+        return elapsed, response.status_code, counter.count
+
+
+class ASGITransport:
+    """
+    Sends requests through Django's ASGI handler with the async test
+    client, all on one event loop in a background thread, as an ASGI
+    server worker would.
+    """
+    name = 'asgi'
+
+    def __init__(self, cookie):
+        self.cookie = cookie
+        self.host = InProcessTransport.host_name()
+        self.loop = asyncio.new_event_loop()
+        threading.Thread(target=self.loop.run_forever, daemon=True).start()
+        self.clients = {}
+
+    def client(self, login):
+        if login not in self.clients:
+            client = AsyncClient(raise_request_exception=False, SERVER_NAME=self.host)
+            if login:
+                client.cookies[settings.SESSION_COOKIE_NAME] = self.cookie
+            self.clients[login] = client
+        return self.clients[login]
+
+    def request(self, route):
+        return asyncio.run_coroutine_threadsafe(self.arequest(route), self.loop).result()
+
+    async def arequest(self, route):
+        client = self.client(route.login)
+        counter = QueryCounter()
+        start = time.perf_counter()
+        with request_queries(counter):
+            if route.method == 'POST':
+                response = await client.post(route.path, json.dumps(route.body),
+                                             content_type='application/json')
+            else:
+                response = await client.get(route.path)
+            if response.streaming:
+                if response.is_async:
+                    async for _ in response.streaming_content:
+                        pass
+                else:
+                    await sync_to_async(_drain)(response)
+            else:
+                response.content
+        elapsed = time.perf_counter() - start
+        return elapsed, response.status_code, counter.count
+
+
+class HTTPTransport:
+    """
+    Sends requests to a running server over keep-alive connections, one per
+    thread.
+    """
+    name = 'http'
+
+    def __init__(self, base_url, cookie):
+        url = urlsplit(base_url)
+        self.scheme = url.scheme
+        self.netloc = url.netloc
+        self.prefix = url.path.rstrip('/')
+        self.cookie = cookie
+        self.local = threading.local()
+
+    def connection(self):
+        conn = getattr(self.local, 'connection', None)
+        if conn is None:
+            factory = http.client.HTTPSConnection if self.scheme == 'https' else http.client.HTTPConnection
+            conn = self.local.connection = factory(self.netloc, timeout=60)
+        return conn
+
+    def request(self, route):
+        headers = {'Accept-Encoding': 'identity'}
+        if route.login:
+            headers['Cookie'] = f'{settings.SESSION_COOKIE_NAME}={self.cookie}'
+        body = None
+        if route.method == 'POST':
+            body = json.dumps(route.body)
+            headers['Content-Type'] = 'application/json'
+
+        start = time.perf_counter()
+        conn = self.connection()
+        try:
+            conn.request(route.method, self.prefix + route.path, body=body, headers=headers)
+            response = conn.getresponse()
+            response.read()
+        except (OSError, http.client.HTTPException):
+            conn.close()
+            self.local.connection = None
+            raise
+        elapsed = time.perf_counter() - start
+        return elapsed, response.status, _server_timing_queries(response.getheader('Server-Timing'))
+
+
+def run(transport, routes, requests=50, concurrency=1, warmup=5, log=None):
+    """
+    Benchmark each route in turn and return the results keyed by route name.
+    """
+    log = log or (lambda message: None)
+    results = {}
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for route in routes:
+            for _ in range(warmup):
+                _timed(transport, route)
+            start = time.perf_counter()
+            samples = list(pool.map(lambda _: _timed(transport, route), range(requests)))
+            wall = time.perf_counter() - start
+            results[route.name] = summarize(route, samples, wall)
+            log(format_result(route.name, results[route.name]))
+    return results
+
+
+def summarize(route, samples, wall):
+    # Failed requests run different code paths; latencies, throughput and
+    # queries are taken from successes only.
+    succeeded = [
+        (elapsed, queries) for elapsed, status, queries in samples
+        if status is not None and status < 400
+    ]
+    latencies = sorted(elapsed for elapsed, queries in succeeded)
+    errors = len(samples) - len(succeeded)
+    queries = [queries for elapsed, queries in succeeded if queries is not None]
+    return {
+        'method': route.method,
+        'path': route.path,
+        'requests': len(samples),
+        'errors': errors,
+        'p50_ms': _ms(percentile(latencies, 50)),
+        'p95_ms': _ms(percentile(latencies, 95)),
+        'p99_ms': _ms(percentile(latencies, 99)),
+        'mean_ms': _ms(sum(latencies) / len(latencies) if latencies else None),
+        'throughput_rps': round(len(latencies) / wall, 2) if wall else None,
+        'queries': max(queries) if queries else None,
+    }
+
+
+def percentile(values, percent):
+    """
+    Nearest-rank percentile of an already sorted list.
+    """
+    if not values:
+        return None
+    rank = max(math.ceil(percent / 100 * len(values)), 1)
+    return values[rank - 1]
+
+
+def baseline(results, transport, requests, concurrency, scale=None, seed=None, end_date=None):
+    """
+    The JSON baseline of a run. ``seed`` and ``end_date`` identify the
+    dataset when the run generated one.
+    """
+    return {
+        'created_at': timezone.now().isoformat(),
+        'config': {
+            'transport': transport.name,
+            'requests': requests,
+            'concurrency': concurrency,
+            'scale': scale,
+            'seed': seed,
+            'end_date': end_date and end_date.isoformat(),
+            'database': connection.vendor,
+            'pagination_mode': settings.PAGINATION_MODE,
+            'python': platform.python_version(),
+            'django': django.get_version(),
+        },
+        'dataset': {
+            'products': Product.objects.count(),
+            'customers': Customer.objects.count(),
+            'sales': Sale.objects.count(),
+        },
+        'routes': results,
+    }
+
+
+def compare(previous, current, threshold):
+    """
+    Compare two baselines. Returns a list of ``(route, metric, before, after,
+    change_percent)`` regressions: latency or throughput worse by more than
+    ``threshold`` percent, or any increase in query or error counts.
+    """
+    regressions = []
+    for name, after in current['routes'].items():
+        before = previous['routes'].get(name)
+        if before is None:
+            continue
+        for metric, higher_is_better in COMPARED_METRICS.items():
+            old, new = before.get(metric), after.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old * 100
+            if (-change if higher_is_better else change) > threshold:
+                regressions.append((name, metric, old, new, round(change, 1)))
+        for metric in ('queries', 'errors'):
+            old, new = before.get(metric), after.get(metric)
+            if old is not None and new is not None and new > old:
+                regressions.append((name, metric, old, new, None))
+    return regressions
+
+
+def transport_comparison(wsgi, asgi, routes):
+    """
+    Compare throughput of two runs of ``routes``, through the WSGI and the
+    ASGI path. Async variants under ASGI are compared against the
+    synchronous route they stand in for under WSGI. Returns a list of
+    ``(route, wsgi_route, wsgi_rps, asgi_rps, change_percent)``.
+    """
+    rows = []
+    for route in routes:
+        wsgi_name = route.variant_of or route.name
+        before = wsgi.get(wsgi_name, {}).get('throughput_rps')
+        after = asgi.get(route.name, {}).get('throughput_rps')
+        if before and after is not None:
+            rows.append((route.name, wsgi_name, before, after,
+                         round((after - before) / before * 100, 1)))
+    return rows
+
+
+def config_differences(previous, current):
+    """
+    Settings that differ between two baselines and make them hard to compare.
+    """
+    keys = ('transport', 'requests', 'concurrency', 'database', 'pagination_mode', 'seed', 'end_date')
+    return [
+        (key, previous['config'].get(key), current['config'].get(key))
+        for key in keys if previous['config'].get(key) != current['config'].get(key)
+    ]
+
+
+def serialization_speedups(rows=1000, repeat=5):
+    """
+    Time serializer-based against ``.values()``-based serialization of the
+    first ``rows`` rows of each list endpoint's queryset (query included)
+    and check that both render the same JSON. Returns results keyed by
+    serializer name.
+    """
+    from rest_framework.renderers import JSONRenderer
+    from rest_framework.test import APIRequestFactory
+
+    from .fast_serializers import ValuesSerializer
+    from .serializers import CustomerSerializer, ProductSerializer, SaleItemSerializer, SaleSerializer
+    from .views import sale_items_prefetch
+
+    request = APIRequestFactory().get('/')
+    context = {'request': request}
+    cases = [
+        (ProductSerializer, Product.objects.select_related('category').order_by('id')),
+        (CustomerSerializer, Customer.objects.order_by('id')),
+        (SaleSerializer, Sale.objects.select_related('customer').prefetch_related(
+            sale_items_prefetch()).order_by('id')),
+        (SaleItemSerializer, SaleItem.objects.select_related('product').order_by('id')),
+    ]
+    renderer = JSONRenderer()
+    results = {}
+    for serializer_class, queryset in cases:
+        def regular():
+            return serializer_class(queryset[:rows], many=True, context=context).data
+
+        def values():
+            serializer = ValuesSerializer(serializer_class, context=context)
+            return serializer.serialize(serializer.values(queryset)[:rows])
+
+        identical = renderer.render(regular()) == renderer.render(values())
+        regular_time = _best_of(regular, repeat)
+        values_time = _best_of(values, repeat)
+        results[serializer_class.__name__] = {
+            'rows': len(regular()),
+            'serializer_ms': _ms(regular_time),
+            'values_ms': _ms(values_time),
+            'speedup': round(regular_time / values_time, 1),
+            'identical': identical,
+        }
+    return results
+
+
+def sale_burst(processes=3, threads=4, seconds=10):
+    """
+    Create completed sales through ``services.create_sale()`` as fast as
+    possible from ``processes`` forked worker processes with ``threads``
+    threads each, for ``seconds``, the way gunicorn workers write during a
+    burst of checkouts. Each sale buys one unit of one of the best-stocked
+    products. Returns totals, throughput, latency percentiles and failed
+    attempts by error message.
+    """
+    customers = list(Customer.objects.order_by('id').only('id')[:100])
+    products = list(Product.objects.order_by('-stock', 'id').values_list('id', flat=True)[:20])
+    if not customers or not products:
+        raise ValueError('The database needs customers and products.')
+
+    # Forked workers must open their own connections.
+    connections.close_all()
+    context = multiprocessing.get_context('fork')
+    start = time.perf_counter()
+    with context.Pool(processes) as pool:
+        outcomes = pool.starmap(
+            _burst_process, [(threads, seconds, customers, products)] * processes
+        )
+    wall = time.perf_counter() - start
+
+    latencies = sorted(latency for process_latencies, _ in outcomes for latency in process_latencies)
+    errors = Counter()
+    for _, process_errors in outcomes:
+        errors.update(process_errors)
+    return {
+        'processes': processes,
+        'threads': threads,
+        'seconds': seconds,
+        'database': connection.vendor,
+        'sales': len(latencies),
+        'sales_per_second': round(len(latencies) / wall, 2),
+        'p50_ms': _ms(percentile(latencies, 50)),
+        'p99_ms': _ms(percentile(latencies, 99)),
+        'lock_errors': sum(count for error, count in errors.items() if 'locked' in error),
+        'errors': dict(errors),
+    }
+
+
+def _burst_process(threads, seconds, customers, products):
+    from .services import SaleValidationError, create_sale
+
+    deadline = time.monotonic() + seconds
+
+    def write(_):
+        rng = random.Random()
+        latencies, errors = [], Counter()
+        try:
+            while time.monotonic() < deadline:
+                items = [{'product': rng.choice(products), 'quantity': 1}]
+                started = time.perf_counter()
+                try:
+                    create_sale(rng.choice(customers), 'completed', items)
+                except OperationalError as exc:
+                    errors[str(exc)] += 1
+                except SaleValidationError:
+                    errors['out of stock'] += 1
+                else:
+                    latencies.append(time.perf_counter() - started)
+        finally:
+            connections.close_all()
+        return latencies, errors
+
+    latencies, errors = [], Counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        for thread_latencies, thread_errors in pool.map(write, range(threads)):
+            latencies.extend(thread_latencies)
+            errors.update(thread_errors)
+    return latencies, errors
+
+
+def format_result(name, result):
+    # Routes without a single success have no latencies or throughput.
+    p50, p95, p99, rps = (
+        '-' if result[key] is None else result[key]
+        for key in ('p50_ms', 'p95_ms', 'p99_ms', 'throughput_rps')
+    )
+    return (
+        f"{name:<32} p50 {p50:>8} ms  p95 {p95:>8} ms  "
+        f"p99 {p99:>8} ms  {rps:>8} req/s  "
+        f"queries {result['queries']}  errors {result['errors']}"
+    )
+
+
+def _timed(transport, route):
+    try:
+        return transport.request(route)
+    except (OSError, http.client.HTTPException):
+        return None, None, None
+
+
+def _drain(response):
+    for _ in response.streaming_content:
+        pass
+
+
+def _best_of(function, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def _ms(seconds):
+    return None if seconds is None else round(seconds * 1000, 2)
+
+
+def _server_timing_queries(header):
+    # db;dur=1.23;desc="4 queries"
+    for metric in (header or '').split(','):
+        name, _, params = metric.strip().partition(';')
+        if name == 'db' and params.endswith(_QUERY_COUNT):
+            return int(params.rsplit('"', 2)[1].split()[0])
+    return None
@@ -0,0 +1,165 @@
+"""
+Versioned caching for read-heavy pages and API payloads.
+
+Every model has a data-version counter in the cache. Signal handlers bump
+it after any committed save or delete, and cache keys embed the current
+versions of the models a snapshot was built from, so a cached snapshot is
+never served once its inputs have changed. Counters start at a random
+value, which keeps a counter that was evicted and re-created from ever
+repeating an earlier version.
+
+With the local-memory backend each process keeps its own counters, which
+is only exact for a single worker; multi-worker deployments should point
+``CACHE_URL`` at a shared backend (Redis, Memcached or the database).
+
+``CachedListViewMixin`` caches the rendered rows of the HTML list pages
+the same way, so a repeat view of a list runs none of its queries.
+
+Snapshots are built from the primary database even when the request may
+read from a replica: a lagging replica would otherwise store old data
+under the new versions.
+"""
+
+import hashlib
+import random
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.middleware.csrf import get_token
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from product_management.routers import use_primary
+
+KEY_PREFIX = 'products'
+
+# Rendered into cached HTML in place of the CSRF token, and replaced with
+# the requesting user's token whenever the HTML is served.
+CSRF_PLACEHOLDER = 'csrf-token-placeholder'
+
+
+def _version_key(model):
+    return f'{KEY_PREFIX}:version:{model._meta.label_lower}'
+
+
+def _initial_version():
+    return random.getrandbits(48)
+
+
+def get_data_versions(*models):
+    """
+    Return the current data version of each model, in order.
+    """
+    keys = [_version_key(model) for model in models]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, _initial_version(), timeout=None)
+            versions[key] = cache.get(key)
+    return tuple(versions[key] for key in keys)
+
+
+def bump_data_version(*models):
+    """
+    Invalidate every snapshot built from ``models`` once the current
+    transaction commits (immediately when not in a transaction). Bumping
+    earlier would let a concurrent request cache data that is about to be
+    rolled back, or cache pre-commit data under the new version.
+    """
+    def bump():
+        for model in models:
+            key = _version_key(model)
+            try:
+                cache.incr(key)
+            except ValueError:
+                cache.add(key, _initial_version(), timeout=None)
+
+    transaction.on_commit(bump)
+
+
+def cached_snapshot(name, models, build, *key_parts, timeout=None):
+    """
+    Return the value ``build()`` produces for the current versions of
+    ``models``, computing and caching it on a miss. ``key_parts`` add
+    further inputs to the key, such as the date window of a report.
+    """
+    key = _snapshot_key(name, models, key_parts)
+    value = cache.get(key)
+    if value is None:
+        with use_primary():
+            value = build()
+        cache.set(key, value, _timeout(timeout))
+    return value
+
+
+async def acached_snapshot(name, models, build, *key_parts, timeout=None):
+    """
+    ``cached_snapshot()`` for async views; ``build`` is a coroutine
+    function.
+    """
+    key = await sync_to_async(_snapshot_key)(name, models, key_parts)
+    value = await cache.aget(key)
+    if value is None:
+        with use_primary():
+            value = await build()
+        await cache.aset(key, value, _timeout(timeout))
+    return value
+
+
+def _snapshot_key(name, models, key_parts):
+    versions = get_data_versions(*models)
+    return ':'.join(
+        [KEY_PREFIX, 'snapshot', name]
+        + [str(part) for part in key_parts]
+        + [str(version) for version in versions]
+    )
+
+
+def _timeout(timeout):
+    return settings.SNAPSHOT_CACHE_TIMEOUT if timeout is None else timeout
+
+
+class CachedListViewMixin:
+    """
+    ListView mixin caching the parts of the page that show the list, for
+    the current versions of ``cache_models`` and the request's origin and
+    query string (filters, search, page or cursor): ``list_content``,
+    rendered from ``content_template_name``, and the page number links in
+    ``list_pagination``. On a hit the view renders the page around the
+    cached HTML without querying the list.
+
+    Cached HTML is shared between users: content templates get no request
+    context, and ``{% csrf_token %}`` in them is filled in per request.
+    """
+    cache_models = ()
+    content_template_name = None
+    pagination_template_name = 'products/page_pagination.html'
+
+    def get(self, request, *args, **kwargs):
+        query = request.GET.urlencode()
+        parts = cached_snapshot(
+            f'list:{self.content_template_name}', self.cache_models,
+            self.render_list_parts,
+            hashlib.sha256(f'{request.scheme}://{request.get_host()}?{query}'.encode()).hexdigest()[:32]
+        )
+        token = get_token(request)
+        context = {'view': self}
+        for name, html in parts.items():
+            context[name] = mark_safe(html.replace(CSRF_PLACEHOLDER, token))
+        return self.response_class(
+            request=request,
+            template=[self.template_name],
+            context=context,
+            using=self.template_engine,
+        )
+
+    def render_list_parts(self):
+        self.object_list = self.get_queryset()
+        context = self.get_context_data()
+        context['csrf_token'] = CSRF_PLACEHOLDER
+        return {
+            'list_content': render_to_string(self.content_template_name, context),
+            'list_pagination': render_to_string(self.pagination_template_name, context),
+        }
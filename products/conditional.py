@@ -0,0 +1,161 @@
+"""
+Conditional GET (``ETag`` / ``Last-Modified``) for API resources.
+
+Validators are computed before anything is serialized: lists use one
+aggregate query for the row count and the latest ``updated_at`` of the
+filtered rows (and of the related rows the serializer renders), details
+use the ``updated_at`` of the object already fetched by ``get_object()``.
+When the client's ``If-None-Match`` / ``If-Modified-Since`` still match,
+the view answers ``304 Not Modified`` with an empty body.
+
+Lists honour ``If-Modified-Since`` only through the ETag: deleting a row
+that was not the most recently updated one leaves ``MAX(updated_at)``
+unchanged, but not the count.
+"""
+
+import hashlib
+
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from rest_framework.response import Response
+
+from .cache import get_data_versions
+
+
+def make_etag(request, *parts):
+    """
+    Weak ETag over ``parts`` and the representation the request asked for
+    (URL including the query string, and the negotiated media type).
+    """
+    key = ':'.join(
+        [request.build_absolute_uri(), str(getattr(request, 'accepted_media_type', ''))]
+        + [str(part) for part in parts]
+    )
+    return 'W/' + quote_etag(hashlib.md5(key.encode()).hexdigest())
+
+
+def list_validators(request, queryset, fields):
+    """
+    Return ``(etag, last_modified)`` for a list from the row count and the
+    newest value of ``fields`` in ``queryset``.
+    """
+    aggregates = _list_aggregates(fields)
+    values = queryset.order_by().aggregate(rows=Count('pk'), **aggregates)
+    return _list_result(request, values, aggregates)
+
+
+async def alist_validators(request, queryset, fields):
+    aggregates = _list_aggregates(fields)
+    values = await queryset.order_by().aaggregate(rows=Count('pk'), **aggregates)
+    return _list_result(request, values, aggregates)
+
+
+def object_validators(request, instance, fields):
+    last_modified = max(
+        (value for value in (_resolve(instance, field) for field in fields) if value is not None),
+        default=None,
+    )
+    return make_etag(request, instance.pk, last_modified), last_modified
+
+
+def version_validators(request, models):
+    """
+    Validators for responses built from cached snapshots, which change
+    exactly when the snapshot's data versions do.
+    """
+    return make_etag(request, *get_data_versions(*models)), None
+
+
+def conditional_response(request, etag, last_modified, respond, check_last_modified=True):
+    """
+    Return 304 if the request's validators match, otherwise the response
+    from ``respond()``; both carry ``ETag`` and ``Last-Modified``.
+    """
+    response = _not_modified(request, etag, last_modified, check_last_modified)
+    if response is None:
+        response = respond()
+    return _set_validators(response, etag, last_modified)
+
+
+async def aconditional_response(request, etag, last_modified, respond, check_last_modified=True):
+    """
+    ``conditional_response()`` for async views; ``respond`` is a coroutine
+    function.
+    """
+    response = _not_modified(request, etag, last_modified, check_last_modified)
+    if response is None:
+        response = await respond()
+    return _set_validators(response, etag, last_modified)
+
+
+class ConditionalGetMixin:
+    """
+    ViewSet mixin answering ``list`` and ``retrieve`` with 304 Not Modified
+    when nothing in the response has changed. ``last_modified_fields``
+    names the ``updated_at`` columns the serialized output depends on,
+    including those of related rows (e.g. ``category__updated_at``).
+    """
+    last_modified_fields = ('updated_at',)
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_list_response(
+            self.filter_queryset(self.get_queryset()),
+            lambda: super(ConditionalGetMixin, self).list(request, *args, **kwargs),
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        instance = self.get_object()
+        etag, last_modified = object_validators(request, instance, self.last_modified_fields)
+        return conditional_response(
+            request, etag, last_modified,
+            lambda: Response(self.get_serializer(instance).data),
+        )
+
+    def conditional_list_response(self, queryset, respond, fields=None):
+        etag, last_modified = list_validators(
+            self.request, queryset, fields or self.last_modified_fields
+        )
+        return conditional_response(
+            self.request, etag, last_modified, respond, check_last_modified=False
+        )
+
+
+def _list_aggregates(fields):
+    return {f'last_{index}': Max(field) for index, field in enumerate(fields)}
+
+
+def _list_result(request, values, aggregates):
+    last_modified = max(
+        (values[key] for key in aggregates if values[key] is not None), default=None
+    )
+    return make_etag(request, values['rows'], last_modified), last_modified
+
+
+def _not_modified(request, etag, last_modified, check_last_modified):
+    return get_conditional_response(
+        request,
+        etag=etag,
+        last_modified=_timestamp(last_modified) if check_last_modified else None,
+    )
+
+
+def _set_validators(response, etag, last_modified):
+    if response.status_code in (200, 304):
+        response['ETag'] = etag
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(_timestamp(last_modified))
+    return response
+
+
+def _timestamp(last_modified):
+    return int(last_modified.timestamp()) if last_modified is not None else None
+
+
+def _resolve(instance, path):
+    value = instance
+    for attribute in path.split('__'):
+        value = getattr(value, attribute, None)
+        if value is None:
+            return None
+    return value
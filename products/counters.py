@@ -0,0 +1,155 @@
+"""
+Denormalized counters on products, categories and customers.
+
+``Product.units_sold`` / ``revenue`` and ``Customer.purchase_count`` /
+``lifetime_spend`` count completed sales, the same ones the daily rollup
+holds, and move with it: ``apply_sales()`` is called inside the
+transaction that writes the sales, where ``rollups.sync_sales()`` is
+queued.
+``Category.product_count`` follows products being created, deleted or
+moved to another category (``signals``).
+
+Every change is an ``UPDATE ... SET x = x + n``, so concurrent writers add
+to each other's counts instead of overwriting them. Writes that bypass
+these paths (bulk loads, editing the items of a completed sale) are
+corrected by ``manage.py reconcile_counters``.
+"""
+
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, DecimalField, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Round
+from django.db.models.lookups import Exact
+from django.utils import timezone
+
+from .cache import bump_data_version
+from .models import Category, Customer, Product, Sale, SaleItem
+
+
+def apply_sales(sale_ids, sign=1):
+    """
+    Add (``sign=1``) or remove (``sign=-1``) the given sales to the product
+    and customer counters. Costs two grouped queries plus one UPDATE per
+    affected customer and product, issued in primary key order.
+    """
+    sale_ids = list(sale_ids)
+    if not sale_ids:
+        return
+    bump_data_version(Product, Customer)
+    now = timezone.now()
+
+    customers = Sale.objects.filter(pk__in=sale_ids).values('customer_id').annotate(
+        count=Count('id'),
+        amount=Sum('total_amount')
+    ).order_by('customer_id')
+    for row in customers:
+        Customer.objects.filter(pk=row['customer_id']).update(
+            purchase_count=F('purchase_count') + sign * row['count'],
+            lifetime_spend=F('lifetime_spend') + sign * row['amount'],
+            updated_at=now
+        )
+
+    lines = SaleItem.objects.filter(sale_id__in=sale_ids).values('product_id').annotate(
+        quantity=Sum('quantity'),
+        amount=Sum('total_price')
+    ).order_by('product_id')
+    for line in lines:
+        Product.objects.filter(pk=line['product_id']).update(
+            units_sold=F('units_sold') + sign * line['quantity'],
+            revenue=F('revenue') + sign * line['amount'],
+            updated_at=now
+        )
+
+
+def move_product(old_category_id, new_category_id):
+    """
+    Move one product between category counts; either side may be None
+    for a product being created or deleted.
+    """
+    bump_data_version(Category)
+    now = timezone.now()
+    for category_id, delta in sorted(
+            ((old_category_id, -1), (new_category_id, 1)),
+            key=lambda change: change[0] or 0):
+        if category_id is not None:
+            Category.objects.filter(pk=category_id).update(
+                product_count=F('product_count') + delta,
+                updated_at=now
+            )
+
+
+def rebuild(dry_run=False):
+    """
+    Recompute every counter with one UPDATE per table, touching only rows
+    whose stored values are wrong. Returns ``{model name: rows fixed}``
+    (or that would be fixed, with ``dry_run``).
+    """
+    with transaction.atomic():
+        fixed = {}
+        for model, counters in (
+                (Category, _category_counters),
+                (Product, _product_counters),
+                (Customer, _customer_counters)):
+            # Each use of an expression needs its own unresolved copy.
+            stale = model.objects.exclude(*_matches(model, counters()))
+            if dry_run:
+                fixed[model.__name__] = stale.count()
+            else:
+                fixed[model.__name__] = stale.update(**counters(), updated_at=timezone.now())
+        if not dry_run and any(fixed.values()):
+            bump_data_version(Category, Product, Customer)
+    return fixed
+
+
+def _matches(model, counters):
+    """
+    Conditions that hold when the stored counters equal ``counters``.
+    Money is compared in whole cents: SQLite stores decimals as floats,
+    and the increments and its ``SUM()`` can differ in the last bits.
+    """
+    conditions = []
+    for name, value in counters.items():
+        if isinstance(model._meta.get_field(name), DecimalField):
+            conditions.append(Exact(Round(F(name), 2), Round(value, 2)))
+        else:
+            conditions.append(Exact(F(name), value))
+    return conditions
+
+
+def _category_counters():
+    return {
+        'product_count': _total(Product.objects.all(), 'category', Count('id')),
+    }
+
+
+def _product_counters():
+    items = SaleItem.objects.filter(sale__status='completed')
+    return {
+        'units_sold': _total(items, 'product', Sum('quantity')),
+        'revenue': _total(items, 'product', Sum('total_price'), money=True),
+    }
+
+
+def _customer_counters():
+    sales = Sale.objects.filter(status='completed')
+    return {
+        'purchase_count': _total(sales, 'customer', Count('id')),
+        'lifetime_spend': _total(sales, 'customer', Sum('total_amount'), money=True),
+    }
+
+
+def _total(queryset, fk_name, aggregate, money=False):
+    """
+    Correlated subquery aggregating the rows of ``queryset`` that point at
+    the outer row through ``fk_name``, with 0 when there are none.
+    """
+    subquery = Subquery(
+        queryset.filter(**{fk_name: OuterRef('pk')}).order_by().values(fk_name).annotate(
+            total=aggregate
+        ).values('total')
+    )
+    if money:
+        output_field = DecimalField(max_digits=14, decimal_places=2)
+        return Coalesce(subquery, Value(Decimal('0')), output_field=output_field)
+    return Coalesce(subquery, 0)
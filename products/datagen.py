@@ -0,0 +1,409 @@
+"""
+Deterministic synthetic data at production scale.
+
+Rows are generated in fixed-size chunks, each with its own random stream
+derived from the seed, so a given seed and end date always produce the
+same data no matter how many worker processes share the work. Product popularity and
+customer activity follow Zipf distributions, and sale dates follow weekly
+and yearly seasonality with a growth trend.
+
+Rows are written with ``COPY`` on PostgreSQL and batched multi-row
+``executemany`` INSERTs elsewhere, bypassing model ``save()`` so explicit
+sale dates are kept.
+"""
+
+import io
+import math
+import multiprocessing
+import random
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from itertools import accumulate
+
+from django.core.management.color import no_style
+from django.db import connection, connections, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from .models import Category, Customer, Product, Sale, SaleItem
+
+# Rows per generation unit. Fixed so the output does not depend on the
+# number of workers or the write batch size.
+CHUNK_SIZE = 10000
+
+CATEGORY_NAMES = [
+    'Electronics', 'Clothing', 'Books', 'Home & Garden', 'Sports', 'Toys',
+    'Beauty', 'Grocery', 'Automotive', 'Office', 'Music', 'Pet Supplies',
+]
+ADJECTIVES = [
+    'Classic', 'Premium', 'Compact', 'Wireless', 'Organic', 'Deluxe', 'Smart',
+    'Portable', 'Vintage', 'Ergonomic', 'Eco', 'Pro', 'Ultra', 'Mini', 'Heavy-Duty',
+]
+NOUNS = [
+    'Laptop', 'Headphones', 'Jacket', 'Sneakers', 'Novel', 'Lamp', 'Blender',
+    'Backpack', 'Watch', 'Camera', 'Chair', 'Desk', 'Bottle', 'Speaker', 'Tent',
+    'Keyboard', 'Mug', 'Scarf', 'Racket', 'Guitar',
+]
+DESCRIPTION_WORDS = [
+    'durable', 'lightweight', 'stylish', 'reliable', 'affordable', 'everyday',
+    'water-resistant', 'rechargeable', 'handmade', 'bestselling', 'versatile',
+    'comfortable', 'professional', 'travel', 'gift', 'family', 'outdoor', 'kitchen',
+]
+FIRST_NAMES = [
+    'Alex', 'Sam', 'Jordan', 'Taylor', 'Morgan', 'Casey', 'Riley', 'Jamie',
+    'Avery', 'Quinn', 'Kai', 'Rowan', 'Hana', 'Yuki', 'Priya', 'Omar',
+]
+LAST_NAMES = [
+    'Smith', 'Tanaka', 'Garcia', 'Kim', 'Patel', 'Nguyen', 'Muller', 'Rossi',
+    'Silva', 'Cohen', 'Ivanov', 'Okafor', 'Larsen', 'Dubois', 'Sato', 'Brown',
+]
+STATUSES = ['completed', 'pending', 'cancelled']
+STATUS_WEIGHTS = [85, 10, 5]
+ITEMS_PER_SALE_WEIGHTS = [40, 25, 15, 10, 6, 4]
+QUANTITY_WEIGHTS = [60, 20, 10, 6, 4]
+# Share of sales by hour of day (UTC), peaking in the afternoon.
+HOUR_WEIGHTS = [1, 1, 1, 1, 1, 2, 3, 5, 7, 9, 10, 11, 12, 12, 11, 10, 10, 11, 11, 9, 7, 5, 3, 2]
+
+
+def parse_count(value):
+    """
+    argparse type accepting ``1000``, ``1e6`` or ``2_500_000``.
+    """
+    count = int(float(value.replace('_', '')))
+    if count < 0:
+        raise ValueError(value)
+    return count
+
+
+class Plan:
+    """
+    Everything a worker needs to generate its chunks of sales. Built once in
+    the parent process and inherited by forked workers.
+    """
+
+    def __init__(self, seed, categories, products, customers, sales, days, max_items, batch_size,
+                 end_date):
+        self.seed = seed
+        self.categories = categories
+        self.products = products
+        self.customers = customers
+        self.sales = sales
+        self.days = days
+        self.max_items = max_items
+        self.batch_size = batch_size
+        # Sales run up to the end of ``end_date`` (UTC); rows are created at
+        # the start of the history.
+        self.end = datetime.combine(end_date + timedelta(days=1), time.min, tzinfo=dt_timezone.utc)
+        self.start = self.end - timedelta(days=days)
+
+        self.category_base = _next_id(Category)
+        self.product_base = _next_id(Product)
+        self.customer_base = _next_id(Customer)
+        self.sale_base = _next_id(Sale)
+
+        # Product prices in cents, filled in by generate_products().
+        self.product_prices = []
+
+    def rng(self, *parts):
+        return random.Random(':'.join(str(part) for part in (self.seed,) + parts))
+
+    def prepare_distributions(self):
+        rng = self.rng('popularity')
+
+        # Popular products and busy customers are spread over the id range.
+        self.product_ranking = list(range(self.products))
+        rng.shuffle(self.product_ranking)
+        self.product_weights = _zipf_cum_weights(self.products, 1.1)
+
+        self.customer_ranking = list(range(self.customers))
+        rng.shuffle(self.customer_ranking)
+        self.customer_weights = _zipf_cum_weights(self.customers, 0.8)
+
+        self.day_weights = list(accumulate(
+            _day_weight(self.start + timedelta(days=day), day, self.days)
+            for day in range(self.days)
+        ))
+        self.hour_weights = list(accumulate(HOUR_WEIGHTS))
+
+
+def generate(seed=42, categories=12, products=1000, customers=1000, sales=10000,
+             days=365, max_items=5, workers=1, batch_size=5000, end_date=None, log=None):
+    """
+    Generate and write the whole dataset, with sales dated up to
+    ``end_date`` (today in UTC by default). Returns a dict of row counts.
+    """
+    log = log or (lambda message: None)
+    end_date = end_date or timezone.now().date()
+    plan = Plan(seed, categories, products, customers, sales, days, max_items, batch_size,
+                end_date)
+
+    with transaction.atomic():
+        log(f'Writing {categories} categories')
+        _write_chunks(plan, Category, ['id', 'name', 'description', 'product_count',
+                                       'created_at', 'updated_at'],
+                      _category_rows(plan))
+        log(f'Writing {products} products')
+        _write_chunks(plan, Product, ['id', 'name', 'description', 'category_id', 'price', 'stock',
+                                      'image', 'image_renditions', 'units_sold', 'revenue',
+                                      'created_at', 'updated_at'],
+                      generate_products(plan))
+        log(f'Writing {customers} customers')
+        _write_chunks(plan, Customer, ['id', 'name', 'email', 'phone', 'address',
+                                       'purchase_count', 'lifetime_spend', 'created_at', 'updated_at'],
+                      _customer_rows(plan))
+
+    plan.prepare_distributions()
+    chunks = list(range(math.ceil(sales / CHUNK_SIZE)))
+    log(f'Writing {sales} sales dated {plan.start.date()} to {end_date} '
+        f'in {len(chunks)} chunks with {workers} worker(s)')
+    if workers > 1 and len(chunks) > 1:
+        # Forked workers must not share the parent's database connection.
+        connections.close_all()
+        context = multiprocessing.get_context('fork')
+        global _PLAN
+        _PLAN = plan
+        with context.Pool(workers) as pool:
+            item_counts = pool.map(_generate_sales_chunk_in_worker, chunks)
+    else:
+        item_counts = [generate_sales_chunk(plan, chunk) for chunk in chunks]
+
+    _reset_sequences()
+    _analyze()
+    return {
+        'categories': categories,
+        'products': products,
+        'customers': customers,
+        'sales': sales,
+        'sale_items': sum(item_counts),
+    }
+
+
+def generate_products(plan):
+    rng = plan.rng('products')
+    ops = connection.ops
+    for index in range(plan.products):
+        product_id = plan.product_base + index
+        # Log-normal prices: many cheap items, a long tail of expensive ones.
+        cents = max(99, min(int(rng.lognormvariate(7.6, 1.0)), 99999999))
+        plan.product_prices.append(cents)
+        # Roughly one product in twenty is running low.
+        stock = rng.randint(0, 9) if rng.random() < 0.05 else rng.randint(10, 1000)
+        created = ops.adapt_datetimefield_value(plan.start)
+        # Counters start at zero; generate_data reconciles them at the end.
+        yield (
+            product_id,
+            f'{rng.choice(ADJECTIVES)} {rng.choice(NOUNS)} {product_id}',
+            ' '.join(rng.choices(DESCRIPTION_WORDS, k=8)).capitalize() + '.',
+            plan.category_base + rng.randrange(plan.categories),
+            ops.adapt_decimalfield_value(Decimal(cents).scaleb(-2), 10, 2),
+            stock,
+            '',
+            '{}',
+            0,
+            ops.adapt_decimalfield_value(Decimal('0'), 14, 2),
+            created,
+            created,
+        )
+
+
+def generate_sales_chunk(plan, chunk):
+    """
+    Generate and write one chunk of sales with their items. Returns the
+    number of items written.
+    """
+    rng = plan.rng('sales', chunk)
+    ops = connection.ops
+    first = chunk * CHUNK_SIZE
+    last = min(first + CHUNK_SIZE, plan.sales)
+
+    sales = []
+    items = []
+    item_sizes = range(1, min(plan.max_items, len(ITEMS_PER_SALE_WEIGHTS)) + 1)
+    for index in range(first, last):
+        sale_id = plan.sale_base + index
+        day = bisect_choice(rng, plan.day_weights)
+        hour = bisect_choice(rng, plan.hour_weights)
+        sale_date = plan.start.replace(hour=0, minute=0, second=0) + timedelta(
+            days=day, hours=hour, seconds=rng.randrange(3600)
+        )
+        when = ops.adapt_datetimefield_value(sale_date)
+        customer = plan.customer_base + plan.customer_ranking[
+            bisect_choice(rng, plan.customer_weights)
+        ]
+
+        total = 0
+        count = rng.choices(item_sizes, weights=ITEMS_PER_SALE_WEIGHTS[:len(item_sizes)])[0]
+        for _ in range(count):
+            product_index = plan.product_ranking[bisect_choice(rng, plan.product_weights)]
+            quantity = rng.choices(range(1, 6), weights=QUANTITY_WEIGHTS)[0]
+            price = plan.product_prices[product_index]
+            total += price * quantity
+            items.append((
+                sale_id,
+                plan.product_base + product_index,
+                quantity,
+                ops.adapt_decimalfield_value(Decimal(price).scaleb(-2), 10, 2),
+                ops.adapt_decimalfield_value(Decimal(price * quantity).scaleb(-2), 10, 2),
+            ))
+
+        sales.append((
+            sale_id,
+            customer,
+            when,
+            ops.adapt_decimalfield_value(Decimal(total).scaleb(-2), 10, 2),
+            rng.choices(STATUSES, weights=STATUS_WEIGHTS)[0],
+            False,
+            when,
+            when,
+        ))
+
+    with transaction.atomic():
+        _write_rows(plan, Sale, ['id', 'customer_id', 'sale_date', 'total_amount', 'status',
+                                 'rolled_up', 'created_at', 'updated_at'], sales)
+        _write_rows(plan, SaleItem, ['sale_id', 'product_id', 'quantity', 'unit_price',
+                                     'total_price'], items)
+    return len(items)
+
+
+def bisect_choice(rng, cum_weights):
+    """
+    Index drawn with the given cumulative weights (``random.choices`` without
+    the per-call setup cost).
+    """
+    return rng.choices(range(len(cum_weights)), cum_weights=cum_weights)[0]
+
+
+_PLAN = None
+
+
+def _generate_sales_chunk_in_worker(chunk):
+    try:
+        return generate_sales_chunk(_PLAN, chunk)
+    finally:
+        connections.close_all()
+
+
+def _category_rows(plan):
+    rng = plan.rng('categories')
+    now = connection.ops.adapt_datetimefield_value(plan.start)
+    for index in range(plan.categories):
+        base = CATEGORY_NAMES[index % len(CATEGORY_NAMES)]
+        name = base if index < len(CATEGORY_NAMES) else f'{base} {index // len(CATEGORY_NAMES) + 1}'
+        yield (
+            plan.category_base + index,
+            name,
+            f"{name} - {' '.join(rng.choices(DESCRIPTION_WORDS, k=4))}",
+            0,
+            now,
+            now,
+        )
+
+
+def _customer_rows(plan):
+    rng = plan.rng('customers')
+    now = connection.ops.adapt_datetimefield_value(plan.start)
+    for index in range(plan.customers):
+        customer_id = plan.customer_base + index
+        first_name = rng.choice(FIRST_NAMES)
+        last_name = rng.choice(LAST_NAMES)
+        yield (
+            customer_id,
+            f'{first_name} {last_name}',
+            f'{first_name.lower()}.{last_name.lower()}.{customer_id}@example.com',
+            f'{rng.randint(100, 999)}-{rng.randint(100, 999)}-{rng.randint(1000, 9999)}',
+            f'{rng.randint(1, 9999)} {rng.choice(LAST_NAMES)} St',
+            0,
+            connection.ops.adapt_decimalfield_value(Decimal('0'), 14, 2),
+            now,
+            now,
+        )
+
+
+def _zipf_cum_weights(n, exponent):
+    return list(accumulate(1.0 / (rank + 1) ** exponent for rank in range(n)))
+
+
+def _day_weight(date, day, days):
+    weekend = 1.4 if date.weekday() >= 5 else 1.0
+    yearly = 1.0 + 0.3 * math.sin(2 * math.pi * (date.timetuple().tm_yday - 80) / 365.0)
+    # December peak for holiday shopping.
+    holiday = 1.6 if date.month == 12 else 1.0
+    growth = 1.0 + day / max(days, 1)
+    return weekend * yearly * holiday * growth
+
+
+def _next_id(model):
+    return (model.objects.aggregate(last=Max('id'))['last'] or 0) + 1
+
+
+def _write_chunks(plan, model, columns, rows):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= CHUNK_SIZE:
+            _write_rows(plan, model, columns, batch)
+            batch = []
+    if batch:
+        _write_rows(plan, model, columns, batch)
+
+
+def _write_rows(plan, model, columns, rows):
+    if not rows:
+        return
+    table = model._meta.db_table
+    if connection.vendor == 'postgresql':
+        _copy_rows(table, columns, rows)
+        return
+
+    quote = connection.ops.quote_name
+    sql = 'INSERT INTO {} ({}) VALUES ({})'.format(
+        quote(table),
+        ', '.join(quote(column) for column in columns),
+        ', '.join(['%s'] * len(columns)),
+    )
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), plan.batch_size):
+            cursor.executemany(sql, rows[start:start + plan.batch_size])
+
+
+def _copy_rows(table, columns, rows):
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write('\t'.join(_copy_value(value) for value in row))
+        buffer.write('\n')
+    buffer.seek(0)
+    sql = 'COPY {} ({}) FROM STDIN'.format(table, ', '.join(columns))
+    with connection.cursor() as cursor:
+        raw = cursor.cursor
+        if hasattr(raw, 'copy_expert'):
+            # psycopg2
+            raw.copy_expert(sql, buffer)
+        else:
+            # psycopg 3
+            with raw.copy(sql) as copy:
+                copy.write(buffer.getvalue())
+
+
+def _copy_value(value):
+    if value is None:
+        return '\\N'
+    return (
+        str(value).replace('\\', '\\\\').replace('\t', '\\t')
+        .replace('\n', '\\n').replace('\r', '\\r')
+    )
+
+
+def _reset_sequences():
+    # Explicit ids bypass PostgreSQL sequences; move them past the new rows.
+    statements = connection.ops.sequence_reset_sql(no_style(), [Category, Product, Customer, Sale])
+    if statements:
+        with connection.cursor() as cursor:
+            for statement in statements:
+                cursor.execute(statement)
+
+
+def _analyze():
+    # Fresh planner statistics, so the new row counts steer index choice.
+    if connection.vendor in ('sqlite', 'postgresql'):
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
@@ -0,0 +1,207 @@
+"""
+Inventory events: stock changes and low-stock threshold crossings.
+
+Writers call ``stock_changed()`` inside their transaction; the events are
+handed to the broker by a background task (``products.tasks``) once it
+commits, so a slow broker does not hold up the writer. Subscribers (the
+SSE stream in ``products.sse``) live on asyncio event loops, so a broker
+delivers to each loop with ``call_soon_threadsafe()``.
+
+``InProcessBroker`` only reaches subscribers in the same process.
+``RedisBroker`` publishes through a Redis channel and relays to each
+process's local subscribers, for deployments with several workers. Any
+class with the same ``publish()`` / ``subscribe()`` methods can be set
+as ``INVENTORY_EVENTS_BROKER``.
+"""
+
+import asyncio
+import json
+import logging
+import threading
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.module_loading import import_string
+
+from .tasks import task
+
+logger = logging.getLogger(__name__)
+
+# Events buffered per subscriber before it is disconnected as too slow.
+QUEUE_SIZE = 256
+
+# Marks the end of a subscription in its queue.
+CLOSED = None
+
+
+def stock_changed(changes):
+    """
+    Publish events for ``changes``, an iterable of ``(product_id, name,
+    previous_stock, stock)`` tuples, when the current transaction commits.
+    ``previous_stock`` is None for new products.
+    """
+    threshold = settings.LOW_STOCK_THRESHOLD
+    events = []
+    for product_id, name, previous, stock in changes:
+        if previous == stock:
+            continue
+        data = {'product': product_id, 'name': name, 'stock': stock, 'previous': previous}
+        events.append({'event': 'stock', 'data': data})
+        was_low = previous is not None and previous <= threshold
+        if stock <= threshold and not was_low:
+            events.append({'event': 'low_stock', 'data': dict(data, threshold=threshold)})
+        elif stock > threshold and was_low:
+            events.append({'event': 'restocked', 'data': dict(data, threshold=threshold)})
+    if events:
+        _publish.enqueue(events)
+
+
+@lru_cache(maxsize=None)
+def get_broker():
+    return import_string(settings.INVENTORY_EVENTS_BROKER)()
+
+
+# Subscribers are reached through this process's broker, and expect each
+# product's events in order.
+@task(retries=0, durable=False, ordered=True)
+def _publish(events):
+    get_broker().publish(events)
+
+
+class Subscription:
+    """
+    One subscriber's queue of events, optionally limited to some products
+    and event types. Created and consumed on the subscriber's event loop.
+    """
+
+    def __init__(self, products=None, types=None):
+        self.products = products
+        self.types = types
+        self.queue = asyncio.Queue(QUEUE_SIZE)
+        self.closed = False
+
+    def wants(self, event):
+        return ((self.types is None or event['event'] in self.types)
+                and (self.products is None or event['data']['product'] in self.products))
+
+    def put(self, events):
+        if self.closed:
+            return
+        for event in events:
+            if not self.wants(event):
+                continue
+            try:
+                self.queue.put_nowait(event)
+            except asyncio.QueueFull:
+                self.close()
+                return
+
+    def close(self):
+        self.closed = True
+        # Drop what is buffered so the CLOSED marker always fits; a client
+        # that reconnects re-reads the current stock anyway.
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.queue.put_nowait(CLOSED)
+
+    async def get(self):
+        return await self.queue.get()
+
+
+class InProcessBroker:
+    """
+    Fans events out to the subscribers of this process. ``publish()`` may
+    be called from any thread and schedules one delivery per event loop
+    with subscribers, whatever their number.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # {loop: set of subscriptions}; each set is only touched on its loop.
+        self._loops = {}
+
+    def publish(self, events):
+        with self._lock:
+            loops = list(self._loops)
+        for loop in loops:
+            try:
+                loop.call_soon_threadsafe(self._deliver, loop, events)
+            except RuntimeError:
+                # The loop was closed without unsubscribing.
+                with self._lock:
+                    self._loops.pop(loop, None)
+
+    def subscribe(self, products=None, types=None):
+        """
+        Register a subscription on the running event loop. Pass it to
+        ``unsubscribe()`` when the client goes away.
+        """
+        subscription = Subscription(products, types)
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            self._loops.setdefault(loop, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            subscriptions = self._loops.get(loop, set())
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                self._loops.pop(loop, None)
+
+    def subscriber_count(self):
+        with self._lock:
+            return sum(len(subscriptions) for subscriptions in self._loops.values())
+
+    def _deliver(self, loop, events):
+        for subscription in list(self._loops.get(loop, ())):
+            subscription.put(events)
+
+
+class RedisBroker(InProcessBroker):
+    """
+    Publishes to the ``INVENTORY_EVENTS_REDIS_CHANNEL`` channel at
+    ``INVENTORY_EVENTS_REDIS_URL``. Each event loop with subscribers keeps
+    one Redis subscription and delivers what it receives locally, so
+    events reach every process. Requires the ``redis`` package.
+    """
+
+    def __init__(self):
+        super().__init__()
+        try:
+            import redis
+        except ImportError:
+            raise ImproperlyConfigured('RedisBroker requires the redis package.')
+        self.url = settings.INVENTORY_EVENTS_REDIS_URL
+        self.channel = settings.INVENTORY_EVENTS_REDIS_CHANNEL
+        self._client = redis.Redis.from_url(self.url)
+        self._listeners = {}
+
+    def publish(self, events):
+        self._client.publish(self.channel, json.dumps(events))
+
+    def subscribe(self, products=None, types=None):
+        subscription = super().subscribe(products, types)
+        loop = asyncio.get_running_loop()
+        if loop not in self._listeners:
+            self._listeners[loop] = loop.create_task(self._listen(loop))
+        return subscription
+
+    async def _listen(self, loop):
+        import redis.asyncio
+
+        while True:
+            client = redis.asyncio.Redis.from_url(self.url)
+            try:
+                async with client.pubsub() as pubsub:
+                    await pubsub.subscribe(self.channel)
+                    async for message in pubsub.listen():
+                        if message['type'] == 'message':
+                            self._deliver(loop, json.loads(message['data']))
+            except redis.RedisError:
+                logger.exception('Inventory event subscription lost, reconnecting')
+                await asyncio.sleep(1)
+            finally:
+                await client.close()
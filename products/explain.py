@@ -0,0 +1,192 @@
+"""
+Query plan audit for the views and viewsets.
+
+Every route from ``products.benchmark.build_routes()`` is called through
+``RequestFactory`` with caches disabled (so snapshot builders run) and
+writes rolled back; async views run through ``async_to_sync``. Each distinct query is then run through the
+backend's ``EXPLAIN`` and full table scans of large tables are flagged.
+The outer loop of a statement that reads in its ``ORDER BY`` order and
+stops at its ``LIMIT`` (e.g. the first page of a list ordered by primary
+key) is not.
+"""
+
+import asyncio
+import json
+import re
+
+from asgiref.sync import async_to_sync
+from django.contrib.auth import get_user_model
+from django.db import connections, transaction
+from django.test import RequestFactory, override_settings
+from django.urls import resolve
+
+from product_management.middleware import fingerprint
+
+from .benchmark import build_routes, request_queries
+
+NO_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}
+
+# SQLite: "SCAN products_sale" is a full table scan; "SCAN t USING INDEX"
+# walks an index in order and "VIRTUAL TABLE" is the FTS index. Aliased
+# tables (Django's subqueries use U0, U1, ...) are shown by their alias.
+_SQLITE_SCAN = re.compile(r'^SCAN (?:TABLE )?(\w+)(?: AS \w+)?$')
+_SQL_ALIAS = re.compile(r'"(\w+)" (?:AS )?(\w+)')
+_ORDERED_LIMIT = re.compile(r'\bORDER BY\b.*\bLIMIT\b', re.IGNORECASE | re.DOTALL)
+
+
+class QueryRecorder:
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        if not many and sql.lstrip()[:6].upper() == 'SELECT':
+            self.queries.append((sql, params))
+        return execute(sql, params, many, context)
+
+
+def capture_route_queries(route, user):
+    """
+    Return the ``(sql, params)`` of every SELECT a route runs.
+    """
+    factory = RequestFactory()
+    if route.method == 'POST':
+        request = factory.post(route.path, json.dumps(route.body), content_type='application/json')
+    else:
+        request = factory.get(route.path)
+    request.user = user
+    # Views that write expect CSRF to have been checked by the middleware.
+    request._dont_enforce_csrf_checks = True
+    match = resolve(request.path_info)
+    view = match.func
+    if asyncio.iscoroutinefunction(view):
+        view = async_to_sync(view)
+
+    recorder = QueryRecorder()
+    with override_settings(CACHES=NO_CACHE), request_queries(recorder):
+        with transaction.atomic():
+            response = view(request, *match.args, **match.kwargs)
+            if hasattr(response, 'render'):
+                response.render()
+            if response.streaming:
+                for _ in response.streaming_content:
+                    pass
+            transaction.set_rollback(True)
+    return response.status_code, recorder.queries
+
+
+def explain(connection, sql, params):
+    """
+    Return ``(plan_lines, scanned_tables)`` for a query.
+    """
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            rows = cursor.fetchall()
+            lines = [row[-1] for row in rows]
+            outer = [row for row in rows if row[1] == 0]
+            loops = [row for row in outer if row[-1].startswith(('SCAN ', 'SEARCH '))]
+            if (loops and _ORDERED_LIMIT.search(_outer_sql(sql))
+                    and not any('TEMP B-TREE' in row[-1] for row in outer)):
+                # The outer loop walks the rowid/index in ORDER BY order and
+                # is stopped by the LIMIT; inner loops and subqueries still
+                # run in full.
+                rows = [row for row in rows if row is not loops[0]]
+            aliases = {alias: table for table, alias in _SQL_ALIAS.findall(sql)}
+            scans = [aliases.get(match.group(1), match.group(1))
+                     for match in (_SQLITE_SCAN.match(row[-1]) for row in rows) if match]
+            return lines, scans
+        if connection.vendor == 'postgresql':
+            cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+            plan = cursor.fetchone()[0]
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            lines, scans = [], []
+            _walk_pg_plan(plan[0]['Plan'], lines, scans)
+            return lines, scans
+        if connection.vendor == 'mysql':
+            cursor.execute('EXPLAIN ' + sql, params)
+            columns = [column[0] for column in cursor.description]
+            rows = [dict(zip(columns, row)) for row in cursor.fetchall()]
+            lines = [f"{row['table']}: {row['type']} key={row['key']}" for row in rows]
+            return lines, [row['table'] for row in rows if row['type'] == 'ALL']
+        cursor.execute('EXPLAIN ' + sql, params)
+        return [' '.join(map(str, row)) for row in cursor.fetchall()], []
+
+
+def table_rows(connection, table):
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            # The planner's estimate; exact counts of big tables are slow.
+            cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE relname = %s', [table])
+            row = cursor.fetchone()
+            return max(row[0], 0) if row else 0
+        cursor.execute(f'SELECT COUNT(*) FROM {connection.ops.quote_name(table)}')
+        return cursor.fetchone()[0]
+
+
+def audit(min_rows=1000, connection=None, routes=None):
+    """
+    Explain the queries of every route. Returns one dict per route with
+    its distinct queries, their plans and the large tables they scan.
+    """
+    connection = connection or connections['default']
+    # Unsaved: logging in would write a session and a last_login.
+    user = get_user_model()(username='explain', is_staff=True, is_superuser=True)
+    tables = set(connection.introspection.table_names())
+    sizes = {}
+    report = []
+    for route in routes or build_routes():
+        status, queries = capture_route_queries(route, user)
+        seen = {}
+        for sql, params in queries:
+            key = fingerprint(sql)
+            if key in seen:
+                seen[key]['count'] += 1
+                continue
+            lines, scans = explain(connection, sql, params)
+            scans = [table for table in scans if table in tables]
+            for table in scans:
+                if table not in sizes:
+                    sizes[table] = table_rows(connection, table)
+            seen[key] = {
+                'sql': key,
+                'count': 1,
+                'plan': lines,
+                'scans': [(table, sizes[table]) for table in scans if sizes[table] >= min_rows],
+            }
+        report.append({
+            'route': route.name,
+            'method': route.method,
+            'path': route.path,
+            'status': status,
+            'queries': list(seen.values()),
+        })
+    return report
+
+
+def _walk_pg_plan(node, lines, scans, depth=0):
+    relation = node.get('Relation Name')
+    index = node.get('Index Name')
+    lines.append('  ' * depth + node['Node Type']
+                 + (f' on {relation}' if relation else '')
+                 + (f' using {index}' if index else ''))
+    if node['Node Type'] == 'Seq Scan' and relation:
+        scans.append(relation)
+    for child in node.get('Plans', []):
+        _walk_pg_plan(child, lines, scans, depth + 1)
+
+
+def _outer_sql(sql):
+    """
+    Return ``sql`` without its parenthesized parts (subqueries, function
+    arguments, ``OVER`` clauses), i.e. the clauses of the outer statement.
+    """
+    depth, outer = 0, []
+    for char in sql:
+        if char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+        elif not depth:
+            outer.append(char)
+    return ''.join(outer)
@@ -0,0 +1,235 @@
+"""
+Streaming CSV / NDJSON exports of sales, sale items and products.
+
+Rows are read as plain tuples with ``.values_list().iterator()`` (a
+server-side cursor on PostgreSQL, chunked fetches elsewhere) and encoded
+as they arrive, so memory use does not grow with the size of the export
+and the first bytes go out before the query has been fully read. Under
+ASGI the body is handed to Django as an async iterator; a sync one would
+be read with ``sync_to_async(list)``, i.e. all of it before sending.
+"""
+
+import csv
+import datetime
+import json
+from decimal import Decimal
+from itertools import groupby
+
+from asgiref.sync import sync_to_async
+from django.http import StreamingHttpResponse
+from django.utils.dateparse import parse_date, parse_datetime
+from django.utils import timezone
+
+from .models import Product, Sale, SaleItem
+
+# Rows fetched from the database per round trip.
+CHUNK_SIZE = 2000
+
+# Encoded rows buffered per chunk written to the client.
+ROWS_PER_WRITE = 500
+
+FORMATS = ('ndjson', 'csv')
+
+SALE_FIELDS = [
+    ('id', 'id'),
+    ('sale_date', 'sale_date'),
+    ('status', 'status'),
+    ('customer', 'customer_id'),
+    ('customer_name', 'customer__name'),
+    ('customer_email', 'customer__email'),
+    ('total_amount', 'total_amount'),
+]
+
+SALE_ITEM_FIELDS = [
+    ('item_id', 'items__id'),
+    ('product', 'items__product_id'),
+    ('product_name', 'items__product__name'),
+    ('quantity', 'items__quantity'),
+    ('unit_price', 'items__unit_price'),
+    ('total_price', 'items__total_price'),
+]
+
+EXPORTS = {
+    'sales': {
+        'queryset': lambda: Sale.objects.order_by('id', 'items__id'),
+        'fields': SALE_FIELDS + SALE_ITEM_FIELDS,
+        'since': 'sale_date__gte',
+    },
+    'sale-items': {
+        'queryset': lambda: SaleItem.objects.order_by('id'),
+        'fields': [
+            ('id', 'id'),
+            ('sale', 'sale_id'),
+            ('sale_date', 'sale__sale_date'),
+            ('status', 'sale__status'),
+            ('customer', 'sale__customer_id'),
+            ('product', 'product_id'),
+            ('product_name', 'product__name'),
+            ('quantity', 'quantity'),
+            ('unit_price', 'unit_price'),
+            ('total_price', 'total_price'),
+        ],
+        'since': 'sale__sale_date__gte',
+    },
+    'products': {
+        'queryset': lambda: Product.objects.order_by('id'),
+        'fields': [
+            ('id', 'id'),
+            ('name', 'name'),
+            ('category', 'category_id'),
+            ('category_name', 'category__name'),
+            ('price', 'price'),
+            ('stock', 'stock'),
+            ('created_at', 'created_at'),
+            ('updated_at', 'updated_at'),
+        ],
+        'since': 'updated_at__gte',
+    },
+}
+
+
+def parse_since(value):
+    """
+    Parse a ``since`` bound given as an ISO date or datetime. Returns None
+    for an empty value and raises ValueError for anything unparseable.
+    """
+    if not value:
+        return None
+    parsed = parse_datetime(value)
+    if parsed is None:
+        date = parse_date(value)
+        if date is None:
+            raise ValueError(f'Invalid date or datetime: {value!r}')
+        parsed = datetime.datetime.combine(date, datetime.time.min)
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def export_rows(kind, since=None):
+    """
+    Return ``(columns, rows)`` for an export, where ``rows`` lazily yields
+    one tuple per database row.
+    """
+    export = EXPORTS[kind]
+    queryset = export['queryset']()
+    if since is not None:
+        queryset = queryset.filter(**{export['since']: since})
+    columns = [column for column, _ in export['fields']]
+    lookups = [lookup for _, lookup in export['fields']]
+    return columns, queryset.values_list(*lookups).iterator(chunk_size=CHUNK_SIZE)
+
+
+def encode_value(value):
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, datetime.datetime):
+        value = value.isoformat()
+        if value.endswith('+00:00'):
+            value = value[:-6] + 'Z'
+        return value
+    if isinstance(value, datetime.date):
+        return value.isoformat()
+    return value
+
+
+def stream_ndjson(kind, since=None):
+    """
+    Yield the export as newline-delimited JSON. Sales are emitted as one
+    object per sale with its items nested.
+    """
+    columns, rows = export_rows(kind, since)
+    if kind == 'sales':
+        records = _nest_sale_items(columns, rows)
+    else:
+        records = (dict(zip(columns, map(encode_value, row))) for row in rows)
+    lines = (json.dumps(record, separators=(',', ':')) + '\n' for record in records)
+    return _buffered(lines)
+
+
+def stream_csv(kind, since=None):
+    """
+    Yield the export as CSV with a header row. Sales have one row per item,
+    with the sale columns repeated.
+    """
+    columns, rows = export_rows(kind, since)
+    writer = csv.writer(_Echo())
+    yield writer.writerow(columns)
+    yield from _buffered(
+        writer.writerow(['' if value is None else encode_value(value) for value in row])
+        for row in rows
+    )
+
+
+def streaming_response(kind, export_format, since=None, asynchronous=False):
+    """
+    Build the export response. Pass ``asynchronous`` for requests served by
+    the ASGI handler.
+    """
+    if export_format == 'csv':
+        stream, content_type = stream_csv(kind, since), 'text/csv'
+    else:
+        stream, content_type = stream_ndjson(kind, since), 'application/x-ndjson'
+    if asynchronous:
+        stream = _async_chunks(stream)
+    response = StreamingHttpResponse(stream, content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{kind}.{export_format}"'
+    return response
+
+
+def _nest_sale_items(columns, rows):
+    sale_width = len(SALE_FIELDS)
+    sale_columns = columns[:sale_width]
+    item_columns = columns[sale_width:]
+    for _, sale_rows in groupby(rows, key=lambda row: row[0]):
+        first = next(sale_rows)
+        record = dict(zip(sale_columns, map(encode_value, first[:sale_width])))
+        record['items'] = [
+            dict(zip(item_columns, map(encode_value, row[sale_width:])))
+            for row in (first, *sale_rows)
+            # Sales without items come back as one row of NULL item columns.
+            if row[sale_width] is not None
+        ]
+        yield record
+
+
+def _buffered(chunks):
+    """
+    Join small encoded rows into larger writes. The first row is sent on
+    its own so clients start receiving data right away.
+    """
+    buffer = []
+    first = True
+    for chunk in chunks:
+        buffer.append(chunk)
+        if first or len(buffer) >= ROWS_PER_WRITE:
+            yield ''.join(buffer)
+            buffer = []
+            first = False
+    if buffer:
+        yield ''.join(buffer)
+
+
+async def _async_chunks(chunks):
+    """
+    Pull ``chunks`` one at a time in the request's sync thread, which holds
+    the database connection the rows are read from.
+    """
+    try:
+        while True:
+            chunk = await sync_to_async(next, thread_sensitive=True)(chunks, None)
+            if chunk is None:
+                return
+            yield chunk
+    finally:
+        # Release the database cursor if the client went away early.
+        await sync_to_async(chunks.close, thread_sensitive=True)()
+
+
+class _Echo:
+    """
+    File-like object whose write() hands back the CSV line it was given.
+    """
+
+    def write(self, value):
+        return value
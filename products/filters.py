@@ -0,0 +1,15 @@
+from rest_framework import filters
+from .search import search_products
+
+class FullTextSearchFilter(filters.SearchFilter):
+    """
+    ``?search=`` backed by the product full-text index (see
+    ``products.search``) rather than ``LIKE '%term%'`` scans. Results come
+    back ordered by relevance.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        terms = request.query_params.get(self.search_param, '')
+        if not terms.strip():
+            return queryset
+        return search_products(queryset, terms)
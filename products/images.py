@@ -0,0 +1,144 @@
+"""
+Resized renditions of product images.
+
+When a product gets a new image, ``schedule()`` queues it as a background
+task (``products.tasks``) that always runs in the task threads, so the
+upload request does not wait for the resizing. The task writes each size in ``RENDITIONS`` as WebP
+and as JPEG (for clients without WebP support) and stores the map in
+``Product.image_renditions``:
+
+    {"thumb": {"width": 80, "height": 60, "webp": "renditions/3f2a....webp",
+               "jpeg": "renditions/9b1c....jpg"}, ...}
+
+Files are named after a hash of their content, so a name always means the
+same bytes and can be cached forever (see ``nginx.conf``). Identical
+renditions are stored once and are not deleted with a product.
+"""
+
+import hashlib
+import io
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from .cache import bump_data_version
+from .models import Product
+from .tasks import task
+
+logger = logging.getLogger(__name__)
+
+# Longest side in pixels, sized for the largest place each is shown
+# (at twice the CSS size for high-density screens).
+RENDITIONS = {
+    'thumb': 80,
+    'small': 200,
+    'medium': 640,
+}
+
+FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', {'quality': 85, 'optimize': True, 'progressive': True}),
+}
+
+DIRECTORY = 'renditions'
+
+
+def schedule(product):
+    """
+    Build renditions of ``product``'s current image in the background once
+    the current transaction commits.
+    """
+    build.enqueue(product.pk, product.image.name)
+
+
+@task(allow_inline=False)
+def build(pk, name):
+    """
+    Render image ``name`` and store the renditions on product ``pk``,
+    unless the product has moved on to another image in the meantime.
+    Returns the rendition map, or None if the image could not be read.
+    """
+    try:
+        with default_storage.open(name) as image_file:
+            renditions = render(image_file)
+    except (OSError, Image.DecompressionBombError):
+        logger.exception('Could not build renditions of %s for product %s', name, pk)
+        return None
+    updated = Product.objects.filter(pk=pk, image=name).update(
+        image_renditions=renditions,
+        updated_at=timezone.now()
+    )
+    if updated:
+        # update() sends no signals.
+        bump_data_version(Product)
+    return renditions
+
+
+def build_all(rebuild=False, workers=None):
+    """
+    Build renditions for every product with an image but none yet (or
+    for all of them with ``rebuild``), ``workers`` images at a time.
+    Returns ``(built, failed)`` counts.
+    """
+    products = Product.objects.exclude(image='').exclude(image__isnull=True)
+    if not rebuild:
+        products = products.filter(image_renditions={})
+    jobs = list(products.order_by('pk').values_list('pk', 'image'))
+    with ThreadPoolExecutor(max_workers=workers or settings.TASK_WORKERS or 1) as pool:
+        results = list(pool.map(lambda job: _build_in_worker(*job), jobs))
+    built = sum(1 for renditions in results if renditions is not None)
+    return built, len(results) - built
+
+
+def render(image_file):
+    """
+    Write every rendition of the image in ``image_file`` to storage and
+    return the rendition map.
+    """
+    with Image.open(image_file) as original:
+        original = ImageOps.exif_transpose(original)
+        renditions = {}
+        for size_name, longest_side in RENDITIONS.items():
+            image = original.copy()
+            image.thumbnail((longest_side, longest_side), Image.Resampling.LANCZOS)
+            rendition = {'width': image.width, 'height': image.height}
+            for format_name, (pil_format, options) in FORMATS.items():
+                rendition[format_name] = _store(_encode(image, pil_format, options), format_name)
+            renditions[size_name] = rendition
+    return renditions
+
+
+def _encode(image, pil_format, options):
+    if pil_format == 'JPEG' and image.mode not in ('RGB', 'L'):
+        # JPEG has no alpha channel; flatten onto white.
+        background = Image.new('RGB', image.size, 'white')
+        background.paste(image, mask=image.convert('RGBA').getchannel('A'))
+        image = background
+    buffer = io.BytesIO()
+    image.save(buffer, pil_format, **options)
+    return buffer.getvalue()
+
+
+def _store(content, format_name):
+    extension = 'jpg' if format_name == 'jpeg' else format_name
+    name = f'{DIRECTORY}/{hashlib.sha256(content).hexdigest()[:32]}.{extension}'
+    if not default_storage.exists(name):
+        default_storage.save(name, ContentFile(content))
+    return name
+
+
+def _build_in_worker(pk, name):
+    try:
+        return build(pk, name)
+    except Exception:
+        logger.exception('Rendition worker failed for product %s', pk)
+        return None
+    finally:
+        close_old_connections()
+
@@ -0,0 +1,183 @@
+import datetime
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from products import benchmark, counters, datagen, rollups
+from products.models import Sale
+
+class Command(BaseCommand):
+    help = 'Benchmark every route and record latency percentiles, throughput and query counts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', choices=sorted(benchmark.SCALES),
+                            help='Generate a dataset of this size first (use an empty database)')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--end-date', type=datetime.date.fromisoformat, default=None,
+                            help='Last day of generated sales, YYYY-MM-DD (default: today, UTC)')
+        parser.add_argument('--requests', type=int, default=50, help='Timed requests per route')
+        parser.add_argument('--warmup', type=int, default=5, help='Untimed requests per route')
+        parser.add_argument('--concurrency', type=int, default=1)
+        parser.add_argument('--routes', nargs='+', help='Only routes whose name contains one of these')
+        parser.add_argument('--skip-writes', action='store_true', help='Leave out POST routes')
+        parser.add_argument('--base-url',
+                            help='Benchmark a running server (e.g. http://127.0.0.1:8000) '
+                                 'instead of the in-process test client')
+        parser.add_argument('--asgi', action='store_true',
+                            help="Send in-process requests through Django's ASGI handler")
+        parser.add_argument('--compare-transports', action='store_true',
+                            help='Run every route through WSGI, then ASGI, and compare throughput')
+        parser.add_argument('--asgi-base-url',
+                            help='ASGI server to compare a --base-url WSGI server against')
+        parser.add_argument('--output', '-o', help='Write the results to this JSON baseline file')
+        parser.add_argument('--compare', help='Previous baseline file to compare against')
+        parser.add_argument('--threshold', type=float, default=10.0,
+                            help='Allowed slowdown in percent before a route counts as a regression')
+        parser.add_argument('--serialization', type=int, metavar='ROWS',
+                            help='Only compare serializer and .values() serialization of ROWS rows')
+        parser.add_argument('--sale-burst', type=int, metavar='SECONDS',
+                            help='Only create sales for SECONDS from --processes processes with '
+                                 '--concurrency threads each')
+        parser.add_argument('--processes', type=int, default=3)
+
+    def handle(self, *args, **options):
+        if options['requests'] < 1 or options['concurrency'] < 1:
+            raise CommandError('--requests and --concurrency must be at least 1')
+
+        previous = None
+        if options['compare']:
+            with open(options['compare'], encoding='utf-8') as baseline_file:
+                previous = json.load(baseline_file)
+
+        if options['scale']:
+            if Sale.objects.exists():
+                self.stdout.write(self.style.WARNING('Adding generated data to a non-empty database'))
+            options['end_date'] = options['end_date'] or timezone.now().date()
+            datagen.generate(seed=options['seed'], end_date=options['end_date'], log=self.stdout.write,
+                             **benchmark.SCALES[options['scale']])
+            rollups.rebuild()
+            counters.rebuild()
+
+        if options['serialization']:
+            return self.benchmark_serialization(options)
+        if options['sale_burst']:
+            return self.benchmark_sale_burst(options)
+
+        try:
+            routes = benchmark.build_routes()
+        except ValueError as exc:
+            raise CommandError(f'{exc} Run with --scale to generate a dataset.')
+        if options['routes']:
+            routes = [route for route in routes if any(part in route.name for part in options['routes'])]
+        if options['skip_writes']:
+            routes = [route for route in routes if route.method == 'GET']
+
+        cookie = benchmark.session_cookie()
+        if options['compare_transports']:
+            return self.compare_transports(routes, cookie, options)
+        if options['base_url']:
+            transport = benchmark.HTTPTransport(options['base_url'], cookie)
+        elif options['asgi']:
+            transport = benchmark.ASGITransport(cookie)
+        else:
+            transport = benchmark.InProcessTransport(cookie)
+        current = self.run_routes(transport, routes, options)
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as baseline_file:
+                json.dump(current, baseline_file, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Wrote baseline to {options['output']}"))
+
+        if previous is not None:
+            for key, before, after in benchmark.config_differences(previous, current):
+                self.stdout.write(self.style.WARNING(f'Baseline {key} was {before}, now {after}'))
+            regressions = benchmark.compare(previous, current, options['threshold'])
+            for name, metric, before, after, change in regressions:
+                change = '' if change is None else f' ({change:+}%)'
+                self.stdout.write(self.style.ERROR(f'{name}: {metric} {before} -> {after}{change}'))
+            if regressions:
+                raise CommandError(f'{len(regressions)} regression(s) against {options["compare"]}')
+            self.stdout.write(self.style.SUCCESS(
+                f"No regressions beyond {options['threshold']}% against {options['compare']}"
+            ))
+
+    def run_routes(self, transport, routes, options):
+        self.stdout.write(
+            f"Benchmarking {len(routes)} routes ({transport.name}, {options['requests']} requests, "
+            f"concurrency {options['concurrency']})"
+        )
+        results = benchmark.run(
+            transport, routes,
+            requests=options['requests'],
+            concurrency=options['concurrency'],
+            warmup=options['warmup'],
+            log=self.stdout.write,
+        )
+        return benchmark.baseline(
+            results, transport, options['requests'], options['concurrency'], options['scale'],
+            *((options['seed'], options['end_date']) if options['scale'] else ())
+        )
+
+    def compare_transports(self, routes, cookie, options):
+        if bool(options['base_url']) != bool(options['asgi_base_url']):
+            raise CommandError('Give both --base-url and --asgi-base-url, or neither')
+        if options['base_url']:
+            wsgi = benchmark.HTTPTransport(options['base_url'], cookie)
+            asgi = benchmark.HTTPTransport(options['asgi_base_url'], cookie)
+        else:
+            wsgi = benchmark.InProcessTransport(cookie)
+            asgi = benchmark.ASGITransport(cookie)
+        # Async variants stand in for their synchronous routes under ASGI only.
+        wsgi_routes = [route for route in routes if route.variant_of is None]
+        runs = {
+            'wsgi': self.run_routes(wsgi, wsgi_routes, options),
+            'asgi': self.run_routes(asgi, routes, options),
+        }
+
+        self.stdout.write(
+            f"\n{'ASGI route':<32} {'WSGI route':<26} {'WSGI rps':>10} {'ASGI rps':>10} {'change':>8}"
+        )
+        for name, wsgi_name, before, after, change in benchmark.transport_comparison(
+                runs['wsgi']['routes'], runs['asgi']['routes'], routes):
+            self.stdout.write(f'{name:<32} {wsgi_name:<26} {before:>10} {after:>10} {change:>+7}%')
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as baseline_file:
+                json.dump(runs, baseline_file, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Wrote both runs to {options['output']}"))
+
+    def benchmark_sale_burst(self, options):
+        try:
+            result = benchmark.sale_burst(
+                processes=options['processes'],
+                threads=options['concurrency'],
+                seconds=options['sale_burst'],
+            )
+        except ValueError as exc:
+            raise CommandError(f'{exc} Run with --scale to generate a dataset.')
+        self.stdout.write(
+            f"{result['sales']} sales in {result['seconds']} s from {result['processes']} processes "
+            f"x {result['threads']} threads: {result['sales_per_second']} sales/s, "
+            f"p50 {result['p50_ms']} ms, p99 {result['p99_ms']} ms"
+        )
+        for error, count in result['errors'].items():
+            self.stdout.write(self.style.WARNING(f'{count} x {error}'))
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as baseline_file:
+                json.dump({'sale_burst': result}, baseline_file, indent=2)
+        if result['lock_errors']:
+            raise CommandError(f"{result['lock_errors']} sale(s) failed with the database locked")
+
+    def benchmark_serialization(self, options):
+        results = benchmark.serialization_speedups(options['serialization'])
+        for name, result in results.items():
+            self.stdout.write(
+                f"{name:<20} {result['rows']:>6} rows  serializer {result['serializer_ms']:>9} ms  "
+                f"values {result['values_ms']:>9} ms  {result['speedup']:>5}x  "
+                f"{'identical' if result['identical'] else 'DIFFERENT OUTPUT'}"
+            )
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as baseline_file:
+                json.dump({'serialization': results}, baseline_file, indent=2)
+        if not all(result['identical'] for result in results.values()):
+            raise CommandError('The .values() serialization differs from the serializers')
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from products import images
+
+class Command(BaseCommand):
+    help = 'Build resized WebP/JPEG renditions of product images that have none yet'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true',
+                            help='Rebuild the renditions of every product image')
+        parser.add_argument('--workers', type=int, help='Images resized at a time')
+
+    def handle(self, *args, **options):
+        built, failed = images.build_all(rebuild=options['all'], workers=options['workers'])
+        self.stdout.write(self.style.SUCCESS(f'Built renditions for {built} products'))
+        if failed:
+            self.stdout.write(self.style.WARNING(f'{failed} images could not be read, see the log'))
@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand, CommandError
+from products import explain
+
+class Command(BaseCommand):
+    help = 'EXPLAIN every query the views and viewsets run and flag full scans of large tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--min-rows', type=int, default=1000,
+                            help='Only flag scans of tables with at least this many rows')
+        parser.add_argument('--routes', nargs='+', help='Only routes whose name contains one of these')
+        parser.add_argument('--fail', action='store_true',
+                            help='Exit with an error if any scan is flagged (for CI)')
+
+    def handle(self, *args, **options):
+        routes = None
+        if options['routes']:
+            routes = [
+                route for route in explain.build_routes()
+                if any(part in route.name for part in options['routes'])
+            ]
+        try:
+            report = explain.audit(min_rows=options['min_rows'], routes=routes)
+        except ValueError as exc:
+            raise CommandError(f'{exc} Load or generate data first.')
+
+        flagged = 0
+        for entry in report:
+            scans = [query for query in entry['queries'] if query['scans']]
+            flagged += len(scans)
+            style = self.style.WARNING if scans else self.style.SUCCESS
+            self.stdout.write(style(
+                f"{entry['method']} {entry['path']} [{entry['status']}]: "
+                f"{len(entry['queries'])} distinct queries, {len(scans)} with full scans"
+            ))
+            for query in entry['queries']:
+                if not query['scans'] and options['verbosity'] < 2:
+                    continue
+                tables = ', '.join(f'{table} ({rows} rows)' for table, rows in query['scans'])
+                self.stdout.write(f"  x{query['count']} {query['sql']}")
+                if tables:
+                    self.stdout.write(self.style.WARNING(f'    full scan: {tables}'))
+                for line in query['plan']:
+                    self.stdout.write(f'    | {line}')
+
+        if flagged and options['fail']:
+            raise CommandError(f'{flagged} queries scan large tables')
+        self.stdout.write(f'{flagged} queries scan tables with at least {options["min_rows"]} rows')
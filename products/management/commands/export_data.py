@@ -0,0 +1,31 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from products.exports import EXPORTS, FORMATS, parse_since, stream_csv, stream_ndjson
+
+class Command(BaseCommand):
+    help = 'Stream sales, sale items or products to a CSV or NDJSON file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=sorted(EXPORTS))
+        parser.add_argument('--format', choices=FORMATS, default='ndjson')
+        parser.add_argument('--since', help='Only rows on or after this ISO date/datetime')
+        parser.add_argument('--output', '-o', help='Output file (default: stdout)')
+
+    def handle(self, *args, **options):
+        try:
+            since = parse_since(options['since'])
+        except ValueError as exc:
+            raise CommandError(str(exc))
+
+        stream = stream_csv if options['format'] == 'csv' else stream_ndjson
+        chunks = stream(options['kind'], since)
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8', newline='') as output:
+                for chunk in chunks:
+                    output.write(chunk)
+            self.stderr.write(self.style.SUCCESS(f"Exported {options['kind']} to {options['output']}"))
+        else:
+            for chunk in chunks:
+                sys.stdout.write(chunk)
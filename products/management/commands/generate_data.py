@@ -0,0 +1,56 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from products import counters, datagen, rollups
+from products.cache import bump_data_version
+from products.models import Category, Customer, DailySales, Product, Sale, SaleItem
+
+class Command(BaseCommand):
+    help = 'Generate a deterministic synthetic dataset (e.g. --sales 1e6) for load testing'
+
+    def add_arguments(self, parser):
+        count = datagen.parse_count
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--categories', type=count, default=12)
+        parser.add_argument('--products', type=count, default=1000)
+        parser.add_argument('--customers', type=count, default=1000)
+        parser.add_argument('--sales', type=count, default=10000)
+        parser.add_argument('--days', type=count, default=365, help='Days of sales history')
+        parser.add_argument('--end-date', type=datetime.date.fromisoformat, default=None,
+                            help='Last day of sales history, YYYY-MM-DD (default: today, UTC)')
+        parser.add_argument('--max-items', type=count, default=5, help='Most items per sale')
+        parser.add_argument('--workers', type=int, default=1,
+                            help='Processes generating sales in parallel (best on PostgreSQL)')
+        parser.add_argument('--batch-size', type=count, default=5000, help='Rows per INSERT batch')
+
+    def handle(self, *args, **options):
+        for name in ('categories', 'products', 'customers', 'days', 'max_items', 'batch_size'):
+            if options[name] < 1:
+                raise CommandError(f"--{name.replace('_', '-')} must be at least 1")
+
+        end_date = options['end_date'] or timezone.now().date()
+        counts = datagen.generate(
+            seed=options['seed'],
+            categories=options['categories'],
+            products=options['products'],
+            customers=options['customers'],
+            sales=options['sales'],
+            days=options['days'],
+            max_items=options['max_items'],
+            workers=max(options['workers'], 1),
+            batch_size=options['batch_size'],
+            end_date=end_date,
+            log=self.stdout.write,
+        )
+
+        self.stdout.write('Rebuilding sales rollup')
+        rollups.rebuild()
+        self.stdout.write('Reconciling counters')
+        counters.rebuild()
+        bump_data_version(Category, Product, Customer, Sale, SaleItem, DailySales)
+
+        self.stdout.write(self.style.SUCCESS(
+            'Generated ' + ', '.join(f'{count} {name}' for name, count in counts.items())
+        ))
+        self.stdout.write(f"Reproduce with --seed {options['seed']} --end-date {end_date.isoformat()}")
@@ -1,4 +1,5 @@
 from django.core.management.base import BaseCommand
+from products import counters
 from scripts.insert_dummy_data import create_dummy_data
 
 class Command(BaseCommand):
@@ -6,3 +7,5 @@ class Command(BaseCommand):
 
     def handle(self, *args, **kwargs):
         create_dummy_data()
+        # Items are added after their sale is saved, which the counters do not follow.
+        counters.rebuild()
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from products import rollups
+from products.models import DailyProductSales, DailySales
+
+class Command(BaseCommand):
+    help = 'Rebuild the daily sales rollup tables from the sales history'
+
+    def handle(self, *args, **kwargs):
+        rollups.rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt rollup: {DailySales.objects.count()} days, '
+            f'{DailyProductSales.objects.count()} day/product rows'
+        ))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from products import counters
+
+class Command(BaseCommand):
+    help = 'Recompute the sales, product and purchase counters from the sales history'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only report how many rows have drifted')
+
+    def handle(self, *args, **options):
+        fixed = counters.rebuild(dry_run=options['dry_run'])
+        verb = 'Would fix' if options['dry_run'] else 'Fixed'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} ' + ', '.join(f'{count} {name} rows' for name, count in fixed.items())
+        ))
@@ -0,0 +1,38 @@
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from products import tasks
+
+class Command(BaseCommand):
+    help = 'Run background tasks queued in the database (TASK_BACKEND=database)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=settings.TASK_WORKERS,
+                            help='Tasks run at a time')
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help='Seconds between checks for new tasks when the queue is empty')
+        parser.add_argument('--once', action='store_true',
+                            help='Exit once no task is due instead of waiting for more')
+        parser.add_argument('--retry-failed', action='store_true',
+                            help='Queue tasks that ran out of retries again before starting')
+        parser.add_argument('--stats', action='store_true',
+                            help='Print queue depth and wait/run times as JSON and exit')
+
+    def handle(self, *args, **options):
+        if options['stats']:
+            self.stdout.write(json.dumps(tasks.stats(), indent=2))
+            return
+        if settings.TASK_BACKEND != 'database':
+            self.stdout.write(self.style.WARNING(
+                f'TASK_BACKEND is {settings.TASK_BACKEND!r}; only tasks queued with the '
+                f'database backend run here'
+            ))
+        if options['retry_failed']:
+            self.stdout.write(f'Requeued {tasks.retry_failed()} failed tasks')
+        done = tasks.run_worker(
+            workers=max(options['workers'], 1),
+            poll_interval=options['poll_interval'],
+            once=options['once']
+        )
+        self.stdout.write(self.style.SUCCESS(f'Ran {done} tasks'))
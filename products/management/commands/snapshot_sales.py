@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from products import snapshot
+
+class Command(BaseCommand):
+    help = 'Append new sale items to the columnar sales snapshot used by reports'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true',
+                            help='Export every sale item again, picking up changed and deleted sales')
+        parser.add_argument('--chunk-size', type=int, default=snapshot.CHUNK_SIZE,
+                            help='Sale items read per query')
+
+    def handle(self, *args, **options):
+        appended, total = snapshot.export(rebuild=options['rebuild'], chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(f'Appended {appended} sale items ({total} in the snapshot)'))
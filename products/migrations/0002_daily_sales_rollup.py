@@ -0,0 +1,47 @@
+# Generated by Django 4.2 on 2026-10-18 15:54
+
+from decimal import Decimal
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailySales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(unique=True)),
+                ('sales_count', models.IntegerField(default=0)),
+                ('total_amount', models.DecimalField(decimal_places=2, default=Decimal('0'), max_digits=14)),
+            ],
+            options={
+                'verbose_name_plural': 'Daily sales',
+                'ordering': ['date'],
+            },
+        ),
+        migrations.CreateModel(
+            name='DailyProductSales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('quantity', models.IntegerField(default=0)),
+                ('total_amount', models.DecimalField(decimal_places=2, default=Decimal('0'), max_digits=14)),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_sales', to='products.category')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_sales', to='products.product')),
+            ],
+            options={
+                'verbose_name_plural': 'Daily product sales',
+                'ordering': ['date'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='dailyproductsales',
+            constraint=models.UniqueConstraint(fields=('date', 'product'), name='unique_daily_product_sales'),
+        ),
+    ]
@@ -0,0 +1,22 @@
+from django.db import migrations
+
+from products import search
+
+
+def install_search_index(apps, schema_editor):
+    search.install(schema_editor.connection, rebuild=True)
+
+
+def remove_search_index(apps, schema_editor):
+    search.uninstall(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("products", "0003_keyset_pagination_indexes"),
+    ]
+
+    operations = [
+        migrations.RunPython(install_search_index, remove_search_index),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 4.2 on 2026-10-18 16:14
+
+from django.db import migrations, models
+
+
+def analyze(apps, schema_editor):
+    # Without statistics SQLite's planner prefers walking the ordering index
+    # over the partial low-stock index.
+    if schema_editor.connection.vendor in ('sqlite', 'postgresql'):
+        schema_editor.execute('ANALYZE')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0004_product_search_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('stock__lte', 10)), fields=['stock'], name='product_low_stock_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sale',
+            index=models.Index(fields=['status', 'sale_date', 'id'], name='sale_status_date_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sale',
+            index=models.Index(fields=['status', 'created_at'], name='sale_status_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sale',
+            index=models.Index(fields=['customer', 'sale_date', 'id'], name='sale_customer_date_id_idx'),
+        ),
+        migrations.RunPython(analyze, migrations.RunPython.noop),
+    ]
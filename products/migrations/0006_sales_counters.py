@@ -0,0 +1,74 @@
+# Generated by Django 4.2 on 2026-10-18 16:17
+
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def total(queryset, fk_name, aggregate, money=False):
+    subquery = Subquery(
+        queryset.filter(**{fk_name: OuterRef('pk')}).order_by().values(fk_name).annotate(
+            total=aggregate
+        ).values('total')
+    )
+    if money:
+        output_field = models.DecimalField(max_digits=14, decimal_places=2)
+        return Coalesce(subquery, Value(Decimal('0')), output_field=output_field)
+    return Coalesce(subquery, 0)
+
+
+def backfill(apps, schema_editor):
+    Category = apps.get_model('products', 'Category')
+    Product = apps.get_model('products', 'Product')
+    Customer = apps.get_model('products', 'Customer')
+    Sale = apps.get_model('products', 'Sale')
+    SaleItem = apps.get_model('products', 'SaleItem')
+
+    items = SaleItem.objects.filter(sale__status='completed')
+    sales = Sale.objects.filter(status='completed')
+    Category.objects.update(product_count=total(Product.objects.all(), 'category', Count('id')))
+    Product.objects.update(
+        units_sold=total(items, 'product', Sum('quantity')),
+        revenue=total(items, 'product', Sum('total_price'), money=True),
+    )
+    Customer.objects.update(
+        purchase_count=total(sales, 'customer', Count('id')),
+        lifetime_spend=total(sales, 'customer', Sum('total_amount'), money=True),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0005_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='product_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='customer',
+            name='lifetime_spend',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0'), editable=False, max_digits=14),
+        ),
+        migrations.AddField(
+            model_name='customer',
+            name='purchase_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='revenue',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0'), editable=False, max_digits=14),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='units_sold',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.2 on 2026-10-18 17:05
+
+from django.db import migrations, models
+
+
+def mark_completed(apps, schema_editor):
+    # The rollup has been holding every completed sale.
+    Sale = apps.get_model('products', 'Sale')
+    Sale.objects.filter(status='completed').update(rolled_up=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0008_queued_task'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sale',
+            name='rolled_up',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.RunPython(mark_completed, migrations.RunPython.noop),
+    ]
@@ -1,10 +1,14 @@
 from django.db import models
+from django.db.models import Q
 from django.core.validators import MinValueValidator
+from django.utils import timezone
 from decimal import Decimal
 
 class Category(models.Model):
     name = models.CharField(max_length=100)
     description = models.TextField(blank=True)
+    # Maintained by products.counters
+    product_count = models.IntegerField(default=0, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -26,11 +30,26 @@ class Product(models.Model):
     )
     stock = models.PositiveIntegerField(default=0)
     image = models.ImageField(upload_to='products/', blank=True, null=True)
+    # Resized copies of the image; maintained by products.images
+    image_renditions = models.JSONField(default=dict, blank=True, editable=False)
+    # Completed sales only; maintained by products.counters
+    units_sold = models.IntegerField(default=0, editable=False)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal('0'), editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ['name']
+        indexes = [
+            # Keyset pagination order (see products.pagination)
+            models.Index(fields=['name', 'id'], name='product_name_id_idx'),
+            # Low-stock lists only ever look at a handful of rows, so index
+            # just those (on backends with partial index support). The 10 is
+            # fixed by the migration: it serves LOW_STOCK_THRESHOLD and
+            # ?threshold= up to 10; higher thresholds scan instead.
+            models.Index(fields=['stock'], name='product_low_stock_idx',
+                         condition=Q(stock__lte=10)),
+        ]
 
     def __str__(self):
         return self.name
@@ -40,9 +59,17 @@ class Customer(models.Model):
     email = models.EmailField(unique=True)
     phone = models.CharField(max_length=20, blank=True)
     address = models.TextField()
+    # Completed sales only; maintained by products.counters
+    purchase_count = models.IntegerField(default=0, editable=False)
+    lifetime_spend = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal('0'), editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['name', 'id'], name='customer_name_id_idx'),
+        ]
+
     def __str__(self):
         return self.name
 
@@ -59,9 +86,21 @@ class Sale(models.Model):
         ],
         default='pending'
     )
+    # Whether the daily rollup counts this sale; maintained by products.rollups
+    rolled_up = models.BooleanField(default=False, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['sale_date', 'id'], name='sale_date_id_idx'),
+            # ?status= lists in keyset order, and recent sales by status.
+            models.Index(fields=['status', 'sale_date', 'id'], name='sale_status_date_id_idx'),
+            models.Index(fields=['status', 'created_at'], name='sale_status_created_idx'),
+            # Purchase history in keyset order.
+            models.Index(fields=['customer', 'sale_date', 'id'], name='sale_customer_date_id_idx'),
+        ]
+
     def __str__(self):
         return f"Sale {self.id} - {self.customer.name}"
 
@@ -78,3 +117,74 @@ class SaleItem(models.Model):
 
     def __str__(self):
         return f"{self.product.name} - {self.quantity} units"
+
+class DailySales(models.Model):
+    """
+    Completed sales rolled up per day, so dashboards read one row per day
+    instead of scanning every sale. Kept up to date by ``products.rollups``
+    and rebuilt with ``manage.py rebuild_sales_rollup``.
+    """
+    date = models.DateField(unique=True)
+    sales_count = models.IntegerField(default=0)
+    total_amount = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal('0'))
+
+    class Meta:
+        verbose_name_plural = 'Daily sales'
+        ordering = ['date']
+
+    def __str__(self):
+        return f"{self.date} - {self.total_amount}"
+
+class DailyProductSales(models.Model):
+    """
+    Completed sale items rolled up per day and product. The category is
+    copied from the product so per-category charts need no join.
+    """
+    date = models.DateField()
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='daily_sales')
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='daily_sales')
+    quantity = models.IntegerField(default=0)
+    total_amount = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal('0'))
+
+    class Meta:
+        verbose_name_plural = 'Daily product sales'
+        ordering = ['date']
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'product'], name='unique_daily_product_sales'),
+        ]
+
+    def __str__(self):
+        return f"{self.date} - {self.product_id} x {self.quantity}"
+
+class QueuedTask(models.Model):
+    """
+    A background task waiting for ``manage.py run_tasks`` when
+    ``TASK_BACKEND`` is ``database``; see ``products.tasks``. Finished tasks
+    are deleted, failed ones are kept with their last error.
+    """
+    name = models.CharField(max_length=200)
+    args = models.JSONField(default=list)
+    kwargs = models.JSONField(default=dict)
+    status = models.CharField(
+        max_length=20,
+        choices=[
+            ('pending', 'Pending'),
+            ('running', 'Running'),
+            ('failed', 'Failed')
+        ],
+        default='pending'
+    )
+    attempts = models.PositiveIntegerField(default=0)
+    run_after = models.DateTimeField(default=timezone.now)
+    started_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # Workers claim due tasks in order.
+            models.Index(fields=['status', 'run_after', 'id'], name='queued_task_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.name} ({self.status})"
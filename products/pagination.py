@@ -0,0 +1,214 @@
+"""
+Keyset (cursor) pagination for API endpoints and HTML list views.
+
+Page-number pagination issues ``COUNT(*)`` and an ever-growing ``OFFSET``
+on every page. The cursor classes below order by stable, indexed keys
+and encode the position of the last row in an opaque ``cursor`` query
+parameter instead, so every page costs the same. The cursor holds every
+ordering field (DRF's ``CursorPagination`` keeps only the first and steps
+over ties with an ``OFFSET`` capped at 1000), so any number of customers
+sharing a name still page correctly. ``PAGINATION_MODE = 'page'``
+switches back to page numbers everywhere; views without a cursor class
+(e.g. categories) always use page numbers.
+"""
+
+import json
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import Cursor, CursorPagination
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param
+
+from .fast_serializers import ValuesSerializer, use_values_serialization
+
+
+class KeysetPagination(CursorPagination):
+    """
+    ``CursorPagination`` over a composite key. ``ordering`` must end with
+    a unique field; the cursor stores the values of all its fields for the
+    row next to the page boundary.
+    """
+    page_size = api_settings.PAGE_SIZE
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.cursor = self.decode_cursor(request)
+        reverse = self.cursor is not None and self.cursor.reverse
+
+        if reverse:
+            queryset = queryset.order_by(*_reverse_ordering(self.ordering))
+        else:
+            queryset = queryset.order_by(*self.ordering)
+        if self.cursor is not None:
+            queryset = queryset.filter(self._after(self.cursor.position, reverse))
+
+        # One extra row tells whether there is anything past this page.
+        results = list(queryset[:self.page_size + 1])
+        self.page = results[:self.page_size]
+        has_more = len(results) > len(self.page)
+        if reverse:
+            self.page.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, self.cursor is not None
+
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+        return self.page
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        if not self.page:
+            # Paged back past the first row: start again from the top.
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(Cursor(offset=0, reverse=False, position=self._position(self.page[-1])))
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return self.encode_cursor(Cursor(offset=0, reverse=False, position=self.cursor.position))
+        return self.encode_cursor(Cursor(offset=0, reverse=True, position=self._position(self.page[0])))
+
+    def decode_cursor(self, request):
+        cursor = super().decode_cursor(request)
+        if cursor is None:
+            return None
+        try:
+            values = json.loads(cursor.position)
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if (not isinstance(values, list) or len(values) != len(self.ordering)
+                or not all(isinstance(value, str) for value in values)):
+            raise NotFound(self.invalid_cursor_message)
+        return cursor._replace(position=values)
+
+    def encode_cursor(self, cursor):
+        if isinstance(cursor.position, list):
+            cursor = cursor._replace(position=json.dumps(cursor.position))
+        return super().encode_cursor(cursor)
+
+    def _position(self, row):
+        return [self._get_position_from_instance(row, [field]) for field in self.ordering]
+
+    def _after(self, values, reverse):
+        """
+        Rows strictly past ``values`` in ``ordering`` (before them when
+        ``reverse``): ``(a > x) OR (a = x AND b > y) OR ...``.
+        """
+        conditions = []
+        for index, field in enumerate(self.ordering):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') != reverse else 'gt'
+            equal = {other.lstrip('-'): value for other, value in zip(self.ordering[:index], values)}
+            conditions.append(Q(**equal, **{f'{name}__{lookup}': values[index]}))
+        return reduce(or_, conditions)
+
+
+class ProductCursorPagination(KeysetPagination):
+    ordering = ('name', 'id')
+
+
+class CustomerCursorPagination(KeysetPagination):
+    ordering = ('name', 'id')
+
+
+class SaleCursorPagination(KeysetPagination):
+    ordering = ('-sale_date', '-id')
+
+
+class SaleItemCursorPagination(KeysetPagination):
+    ordering = ('-id',)
+
+
+def _reverse_ordering(ordering):
+    return tuple(field[1:] if field.startswith('-') else f'-{field}' for field in ordering)
+
+
+def get_pagination_class(cursor_class):
+    """
+    Return ``cursor_class`` in cursor mode and the configured page-number
+    class otherwise.
+    """
+    if cursor_class is not None and settings.PAGINATION_MODE == 'cursor':
+        return cursor_class
+    return api_settings.DEFAULT_PAGINATION_CLASS
+
+
+class CursorPaginationMixin:
+    """
+    ViewSet mixin that paginates with ``cursor_pagination_class`` when
+    cursor mode is on.
+    """
+    cursor_pagination_class = None
+
+    def use_cursor_pagination(self):
+        """
+        Hook for views whose ordering must not be replaced by the cursor
+        keys, e.g. relevance-ranked search results.
+        """
+        return True
+
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator'):
+            cursor_class = self.cursor_pagination_class if self.use_cursor_pagination() else None
+            self._paginator = get_pagination_class(cursor_class)()
+        return self._paginator
+
+    def get_paginated_action_response(self, queryset, serializer_class, cursor_class):
+        """
+        Paginate the rows of a custom ``@action`` (which may list a
+        different model than the viewset) and build the response.
+        """
+        paginator = get_pagination_class(cursor_class)()
+        if use_values_serialization(self.request):
+            serializer = ValuesSerializer(serializer_class, context=self.get_serializer_context())
+            page = paginator.paginate_queryset(serializer.values(queryset), self.request, view=self)
+            return paginator.get_paginated_response(serializer.serialize(page))
+        page = paginator.paginate_queryset(queryset, self.request, view=self)
+        serializer = serializer_class(page, many=True, context=self.get_serializer_context())
+        return paginator.get_paginated_response(serializer.data)
+
+
+class CursorListViewMixin:
+    """
+    ListView mixin using a DRF cursor class for keyset pagination. Adds
+    ``cursor_previous``/``cursor_next`` links to the context in place of
+    ``page_obj``.
+    """
+    cursor_pagination_class = None
+
+    def use_cursor_pagination(self):
+        return True
+
+    def paginate_queryset(self, queryset, page_size):
+        if (self.cursor_pagination_class is None or settings.PAGINATION_MODE != 'cursor'
+                or not self.use_cursor_pagination()):
+            return super().paginate_queryset(queryset, page_size)
+
+        paginator = self.cursor_pagination_class()
+        paginator.page_size = page_size
+        request = Request(self.request)
+        object_list = paginator.paginate_queryset(queryset, request)
+        self.cursor_links = {
+            'cursor_previous': paginator.get_previous_link(),
+            'cursor_next': paginator.get_next_link(),
+        }
+        return (None, None, object_list, False)
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context.update(getattr(self, 'cursor_links', {}))
+        return context
@@ -0,0 +1,138 @@
+"""
+Renderers and parsers for the API.
+
+``FastJSONRenderer`` / ``FastJSONParser`` use orjson when it is installed
+and produce the same bytes as DRF's ``JSONRenderer``; anything orjson
+cannot reproduce exactly (indented output, ``ensure_ascii``, integers
+beyond 64 bits, Decimals that become floats in exponent notation) goes
+through the stdlib path instead. The one visible difference is the spelling
+of float values in exponent notation (``1e16`` rather than ``1e+16``),
+which parse to the same value. The MessagePack
+classes need the optional ``msgpack`` package and are only registered in
+``REST_FRAMEWORK`` when it is importable.
+"""
+
+import json
+
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser, JSONParser
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+if orjson is not None:
+    # Datetimes go through DRF's encoder, which formats them differently
+    # from orjson (e.g. milliseconds only).
+    ORJSON_OPTIONS = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    Drop-in ``JSONRenderer`` using orjson for compact output.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (orjson is None or data is None or self.ensure_ascii or not self.compact
+                or self.get_indent(accepted_media_type, renderer_context or {}) is not None):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = orjson.dumps(data, default=_orjson_default, option=ORJSON_OPTIONS)
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        # Same JavaScript-safe escaping as JSONRenderer.
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return ret
+
+
+class FastJSONParser(JSONParser):
+    renderer_class = FastJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        encoding = (parser_context or {}).get('encoding', 'utf-8')
+        if (orjson is None or not self.strict
+                or encoding.lower().replace('_', '-') != 'utf-8'):
+            return super().parse(stream, media_type, parser_context)
+        try:
+            # orjson rejects NaN and Infinity, like the strict stdlib parser.
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as exc:
+            raise ParseError('JSON parse error - %s' % str(exc))
+
+
+class MessagePackRenderer(BaseRenderer):
+    """
+    ``application/msgpack`` for service-to-service clients. Values JSON
+    cannot hold natively (Decimal, datetime, ...) are encoded as in JSON.
+    """
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return msgpack.packb(data, default=_json_default, use_bin_type=True)
+
+
+class MessagePackParser(BaseParser):
+    media_type = 'application/msgpack'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return msgpack.unpackb(stream.read(), raw=False)
+        except Exception as exc:
+            raise ParseError('MessagePack parse error - %s' % str(exc))
+
+
+class NDJSONRenderer(BaseRenderer):
+    """
+    Newline-delimited JSON. Export actions stream their own body; this
+    renderer makes ``?format=ndjson`` negotiable and renders error payloads.
+    """
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        rows = data if isinstance(data, list) else [data]
+        return ''.join(json.dumps(row) + '\n' for row in rows).encode(self.charset)
+
+
+class CSVRenderer(BaseRenderer):
+    """
+    Makes ``?format=csv`` negotiable for export actions; error payloads are
+    rendered as JSON text.
+    """
+    media_type = 'text/csv'
+    format = 'csv'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return json.dumps(data).encode(self.charset)
+
+
+_json_default = JSONEncoder().default
+
+
+def _orjson_default(obj):
+    value = _json_default(obj)
+    # Decimals become floats; leave the ones repr() spells in exponent
+    # notation (and NaN/Infinity) to the stdlib so the bytes stay the same.
+    if isinstance(value, float) and value and not 1e-4 <= abs(value) < 1e16:
+        raise TypeError(f'{obj!r} is rendered by the stdlib encoder')
+    return value
@@ -0,0 +1,161 @@
+"""
+Incremental maintenance of the daily sales rollup tables.
+
+Only completed sales are rolled up. A sale enters the rollup when it is
+created as completed (``services``) or moves to completed later, and
+leaves it when it moves away from completed or is deleted (``signals``).
+Except for deletions, whose items are gone once the delete commits, this
+runs as a background task after the sale is written, so writers do not
+queue on the rows of the current day.
+
+``Sale.rolled_up`` records which sales the rollup holds, so the task only
+adds or removes what differs from the sale's current status: running it
+twice (a database task whose lease ran out) or after the sale was deleted
+changes nothing. Edits that bypass those paths, such as changing items of
+a completed sale by hand, are picked up by
+``manage.py rebuild_sales_rollup``.
+"""
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+
+from .cache import bump_data_version
+from .models import DailyProductSales, DailySales, Sale, SaleItem
+from .tasks import task
+
+
+@task
+def sync_sales(sale_ids):
+    """
+    Add the given sales that are completed but not rolled up yet to the
+    rollup tables, and remove those that are rolled up but no longer
+    completed, in one transaction. Costs a query, two grouped queries per
+    direction plus one UPDATE per affected day and (day, product) pair.
+    """
+    sale_ids = list(sale_ids)
+    if not sale_ids:
+        return
+    with transaction.atomic():
+        added, removed = [], []
+        for pk, status, rolled_up in _locked(sale_ids).values_list('pk', 'status', 'rolled_up'):
+            if status == 'completed' and not rolled_up:
+                added.append(pk)
+            elif status != 'completed' and rolled_up:
+                removed.append(pk)
+        if added:
+            _apply_sales(added, 1)
+            Sale.objects.filter(pk__in=added).update(rolled_up=True)
+        if removed:
+            _apply_sales(removed, -1)
+            Sale.objects.filter(pk__in=removed).update(rolled_up=False)
+
+
+def remove_sales(sale_ids):
+    """
+    Take the given sales out of the rollup tables, if they are in, before
+    they are deleted. A sale whose task has not run yet was never added;
+    the task finds it gone and does nothing.
+    """
+    with transaction.atomic():
+        held = list(_locked(sale_ids).filter(rolled_up=True).values_list('pk', flat=True))
+        if held:
+            _apply_sales(held, -1)
+            Sale.objects.filter(pk__in=held).update(rolled_up=False)
+
+
+def _locked(sale_ids):
+    # Concurrent runs for the same sales, and their deletion, wait for
+    # each other instead of both changing the rollup.
+    return Sale.objects.select_for_update().filter(pk__in=sale_ids).order_by('pk')
+
+
+def _apply_sales(sale_ids, sign):
+    bump_data_version(DailySales, DailyProductSales)
+
+    days = Sale.objects.filter(pk__in=sale_ids).annotate(
+        date=TruncDate('sale_date')
+    ).values('date').annotate(
+        count=Count('id'),
+        amount=Sum('total_amount')
+    ).order_by()
+    for day in days:
+        _increment(
+            DailySales, {'date': day['date']},
+            sales_count=sign * day['count'],
+            total_amount=sign * day['amount']
+        )
+
+    lines = SaleItem.objects.filter(sale_id__in=sale_ids).annotate(
+        date=TruncDate('sale__sale_date')
+    ).values('date', 'product_id', 'product__category_id').annotate(
+        quantity=Sum('quantity'),
+        amount=Sum('total_price')
+    ).order_by()
+    for line in lines:
+        _increment(
+            DailyProductSales,
+            {'date': line['date'], 'product_id': line['product_id']},
+            defaults={'category_id': line['product__category_id']},
+            quantity=sign * line['quantity'],
+            total_amount=sign * line['amount']
+        )
+
+
+def rebuild():
+    """
+    Recompute both rollup tables from scratch with two grouped queries.
+    """
+    with transaction.atomic():
+        bump_data_version(DailySales, DailyProductSales)
+        DailySales.objects.all().delete()
+        DailyProductSales.objects.all().delete()
+        Sale.objects.filter(status='completed', rolled_up=False).update(rolled_up=True)
+        Sale.objects.exclude(status='completed').filter(rolled_up=True).update(rolled_up=False)
+
+        DailySales.objects.bulk_create(
+            (
+                DailySales(date=row['date'], sales_count=row['count'], total_amount=row['amount'])
+                for row in Sale.objects.filter(status='completed').annotate(
+                    date=TruncDate('sale_date')
+                ).values('date').annotate(
+                    count=Count('id'),
+                    amount=Sum('total_amount')
+                ).order_by().iterator()
+            ),
+            batch_size=1000
+        )
+        DailyProductSales.objects.bulk_create(
+            (
+                DailyProductSales(
+                    date=row['date'],
+                    product_id=row['product_id'],
+                    category_id=row['product__category_id'],
+                    quantity=row['quantity'],
+                    total_amount=row['amount']
+                )
+                for row in SaleItem.objects.filter(sale__status='completed').annotate(
+                    date=TruncDate('sale__sale_date')
+                ).values('date', 'product_id', 'product__category_id').annotate(
+                    quantity=Sum('quantity'),
+                    amount=Sum('total_price')
+                ).order_by().iterator()
+            ),
+            batch_size=1000
+        )
+
+
+def _increment(model, keys, defaults=None, **deltas):
+    """
+    Atomically add ``deltas`` to the row identified by ``keys``, creating it
+    if it does not exist yet.
+    """
+    changes = {field: F(field) + value for field, value in deltas.items()}
+    if model.objects.filter(**keys).update(**changes):
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(**keys, **(defaults or {}), **deltas)
+    except IntegrityError:
+        # Another writer created the row first.
+        model.objects.filter(**keys).update(**changes)
@@ -0,0 +1,167 @@
+"""
+Indexed full-text search over product names and descriptions.
+
+SQLite uses an FTS5 external-content table (``products_product_fts``)
+kept in sync with ``products_product`` by triggers, so ``bulk_create()``
+and ``update()`` are indexed as well. PostgreSQL uses a GIN index on a
+weighted ``tsvector`` expression, which the database keeps current by
+itself. Other backends fall back to ``icontains`` matching.
+
+Results are annotated with ``search_rank`` (higher is more relevant) and
+ordered by it.
+"""
+
+import re
+import time
+
+from django.db import connections
+from django.db.models import Q
+
+FTS_TABLE = 'products_product_fts'
+
+# The search expression and the GIN index must be the same expression for
+# PostgreSQL to use the index.
+PG_VECTOR_SQL = (
+    "setweight(to_tsvector('english', coalesce({table}name, '')), 'A') || "
+    "setweight(to_tsvector('english', coalesce({table}description, '')), 'B')"
+)
+
+SQLITE_INSTALL_SQL = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        name, description,
+        content='products_product', content_rowid='id',
+        tokenize='porter unicode61'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_insert AFTER INSERT ON products_product BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, name, description)
+        VALUES (new.id, new.name, new.description);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_delete AFTER DELETE ON products_product BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, description)
+        VALUES ('delete', old.id, old.name, old.description);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_update
+    AFTER UPDATE OF name, description ON products_product BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, description)
+        VALUES ('delete', old.id, old.name, old.description);
+        INSERT INTO {FTS_TABLE}(rowid, name, description)
+        VALUES (new.id, new.name, new.description);
+    END""",
+]
+
+_TOKEN = re.compile(r'\w+', re.UNICODE)
+
+# How long a missing search index is remembered before looking again, so
+# workers started before the migration pick it up without a restart.
+MISSING_RECHECK_SECONDS = 30
+
+# (alias, database name) -> True, or the monotonic time the index was
+# found missing.
+_fts_tables = {}
+
+
+def install(connection, rebuild=False):
+    """
+    Create the search index for ``connection`` if it is missing. Safe to
+    call repeatedly; SQLite's triggers are re-created here after Django
+    rebuilds ``products_product`` during a migration.
+    """
+    if connection.vendor == 'sqlite':
+        if not fts5_supported(connection):
+            return
+        existed = FTS_TABLE in connection.introspection.table_names()
+        with connection.cursor() as cursor:
+            for statement in SQLITE_INSTALL_SQL:
+                cursor.execute(statement)
+            if rebuild or not existed:
+                cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+    elif connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'CREATE INDEX IF NOT EXISTS product_search_idx ON products_product '
+                f"USING GIN (({PG_VECTOR_SQL.format(table='')}))"
+            )
+
+
+def uninstall(connection):
+    _fts_tables.clear()
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            for suffix in ('insert', 'delete', 'update'):
+                cursor.execute(f'DROP TRIGGER IF EXISTS {FTS_TABLE}_{suffix}')
+            cursor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+    elif connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('DROP INDEX IF EXISTS product_search_idx')
+
+
+def install_after_migrate(using, **kwargs):
+    """
+    ``post_migrate`` handler: rebuilding ``products_product`` on SQLite
+    (e.g. to add a column) drops its triggers, so put them back.
+    """
+    connection = connections[using]
+    if 'products_product' in connection.introspection.table_names():
+        install(connection)
+        _fts_tables.clear()
+
+
+def fts5_supported(connection):
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+        return bool(cursor.fetchone()[0])
+
+
+def fts_table_exists(alias, name):
+    """
+    Whether the SQLite search index exists. Found indexes are remembered
+    for the life of the process; a missing one is checked again after
+    ``MISSING_RECHECK_SECONDS``.
+    """
+    known = _fts_tables.get((alias, name))
+    if known is True:
+        return True
+    if known is not None and time.monotonic() - known < MISSING_RECHECK_SECONDS:
+        return False
+    exists = FTS_TABLE in connections[alias].introspection.table_names()
+    _fts_tables[(alias, name)] = True if exists else time.monotonic()
+    return exists
+
+
+def search_products(queryset, terms):
+    """
+    Filter a ``Product`` queryset to rows matching every word in ``terms``
+    (prefix matches included) and order it by relevance.
+    """
+    tokens = _TOKEN.findall(terms)
+    if not tokens:
+        return queryset
+
+    connection = connections[queryset.db]
+    table = queryset.model._meta.db_table
+
+    if connection.vendor == 'sqlite' and fts_table_exists(connection.alias, connection.settings_dict['NAME']):
+        match = ' '.join(f'"{token}"*' for token in tokens)
+        return queryset.extra(
+            tables=[FTS_TABLE],
+            where=[f'{FTS_TABLE}.rowid = {table}.id', f'{FTS_TABLE} MATCH %s'],
+            params=[match],
+            # bm25() is lower for better matches; weight names over descriptions.
+            select={'search_rank': f'-bm25({FTS_TABLE}, 10.0, 1.0)'},
+        ).order_by('-search_rank', 'name', 'id')
+
+    if connection.vendor == 'postgresql':
+        vector = PG_VECTOR_SQL.format(table=f'{table}.')
+        query = "to_tsquery('english', %s)"
+        tsquery = ' & '.join(f'{token}:*' for token in tokens)
+        return queryset.extra(
+            where=[f'({vector}) @@ {query}'],
+            params=[tsquery],
+            select={'search_rank': f'ts_rank(({vector}), {query})'},
+            select_params=[tsquery],
+        ).order_by('-search_rank', 'name', 'id')
+
+    condition = Q()
+    for token in tokens:
+        condition &= Q(name__icontains=token) | Q(description__icontains=token)
+    return queryset.filter(condition)
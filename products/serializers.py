@@ -1,5 +1,28 @@
+from django.core.files.storage import default_storage
 from rest_framework import serializers
+from .images import FORMATS
 from .models import Category, Product, Customer, Sale, SaleItem
+from .services import create_sale, SaleValidationError
+
+class ImageRenditionsField(serializers.Field):
+    """
+    ``Product.image_renditions`` with each file name replaced by its URL,
+    absolute when there is a request, as ``ImageField`` does.
+    """
+
+    def __init__(self, **kwargs):
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        request = self.context.get('request')
+        renditions = {}
+        for size, rendition in value.items():
+            renditions[size] = dict(rendition)
+            for format_name in FORMATS:
+                url = default_storage.url(rendition[format_name])
+                renditions[size][format_name] = request.build_absolute_uri(url) if request else url
+        return renditions
 
 class CategorySerializer(serializers.ModelSerializer):
     class Meta:
@@ -8,11 +31,13 @@ class CategorySerializer(serializers.ModelSerializer):
 
 class ProductSerializer(serializers.ModelSerializer):
     category_name = serializers.CharField(source='category.name', read_only=True)
+    image_renditions = ImageRenditionsField()
 
     class Meta:
         model = Product
         fields = ['id', 'name', 'description', 'category', 'category_name', 
-                 'price', 'stock', 'image', 'created_at', 'updated_at']
+                 'price', 'stock', 'image', 'image_renditions', 'units_sold', 'revenue',
+                 'created_at', 'updated_at']
 
 class CustomerSerializer(serializers.ModelSerializer):
     class Meta:
@@ -26,6 +51,23 @@ class SaleItemSerializer(serializers.ModelSerializer):
         model = SaleItem
         fields = ['id', 'product', 'product_name', 'quantity', 'unit_price', 'total_price']
 
+class BulkSaleItemSerializer(serializers.Serializer):
+    product = serializers.IntegerField(min_value=1)
+    quantity = serializers.IntegerField(min_value=1)
+
+class BulkSaleSerializer(serializers.Serializer):
+    """
+    Input shape for one sale in a bulk upload. Products and customers are
+    plain ids here; they are resolved in a single query per table by
+    ``services.create_sales_bulk`` instead of one lookup per row.
+    """
+    customer = serializers.IntegerField(min_value=1)
+    status = serializers.ChoiceField(
+        choices=Sale._meta.get_field('status').choices,
+        default=Sale._meta.get_field('status').default
+    )
+    items = BulkSaleItemSerializer(many=True, allow_empty=False)
+
 class SaleSerializer(serializers.ModelSerializer):
     items = SaleItemSerializer(many=True, read_only=True)
     customer_name = serializers.CharField(source='customer.name', read_only=True)
@@ -34,29 +76,23 @@ class SaleSerializer(serializers.ModelSerializer):
         model = Sale
         fields = ['id', 'customer', 'customer_name', 'sale_date', 
                  'total_amount', 'status', 'items', 'created_at', 'updated_at']
+        # Computed from the items on create.
+        read_only_fields = ['total_amount']
+
+    def validate(self, attrs):
+        if self.instance is None:
+            items = BulkSaleItemSerializer(data=self.context.get('items', []), many=True)
+            if not items.is_valid():
+                raise serializers.ValidationError({'items': items.errors})
+            self._items = items.validated_data
+        return attrs
 
     def create(self, validated_data):
-        items_data = self.context.get('items', [])
-        sale = Sale.objects.create(**validated_data)
-        
-        total_amount = 0
-        for item_data in items_data:
-            product = item_data['product']
-            quantity = item_data['quantity']
-            unit_price = product.price
-            
-            SaleItem.objects.create(
-                sale=sale,
-                product=product,
-                quantity=quantity,
-                unit_price=unit_price
+        try:
+            return create_sale(
+                customer=validated_data['customer'],
+                status=validated_data.get('status', Sale._meta.get_field('status').default),
+                items=self._items
             )
-            total_amount += quantity * unit_price
-            
-            # Update product stock
-            product.stock -= quantity
-            product.save()
-        
-        sale.total_amount = total_amount
-        sale.save()
-        return sale
+        except SaleValidationError as exc:
+            raise serializers.ValidationError(exc.errors[0])
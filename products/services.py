@@ -0,0 +1,277 @@
+"""
+Write paths that touch several tables at once.
+
+Views and serializers call into these helpers so that multi-row writes
+(sales, their items and the matching stock movements) happen in a single
+transaction with a fixed number of statements.
+
+On SQLite a sale transaction can still find the database locked once
+``busy_timeout`` runs out during a burst of writes from several workers;
+it is then retried a few times from the start.
+"""
+
+import random
+import time
+from collections import defaultdict
+from decimal import Decimal
+from functools import wraps
+
+from django.db import OperationalError, connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import counters, events, rollups
+from .cache import bump_data_version
+from .models import Customer, Product, Sale, SaleItem
+
+# Rows per INSERT statement when writing sales and sale items in bulk.
+BULK_BATCH_SIZE = 1000
+
+# Attempts at a sale transaction that fails with "database is locked", and
+# the longest random pause before the second one (doubling after that).
+LOCKED_ATTEMPTS = 3
+LOCKED_RETRY_DELAY = 0.05
+
+
+class SaleValidationError(Exception):
+    """
+    Raised when one or more sales in a batch cannot be written.
+
+    ``errors`` holds one dict per submitted sale, in input order; sales
+    without problems get an empty dict, mirroring the error shape DRF uses
+    for ``many=True`` serializers.
+    """
+
+    def __init__(self, errors):
+        super().__init__(errors)
+        self.errors = errors
+
+
+def retry_when_locked(function):
+    """
+    Run ``function``, a whole transaction, again when SQLite reports the
+    database as locked. Inside an outer transaction the error propagates,
+    since only the outermost transaction can be retried.
+    """
+    @wraps(function)
+    def wrapper(*args, **kwargs):
+        for attempt in range(1, LOCKED_ATTEMPTS + 1):
+            try:
+                return function(*args, **kwargs)
+            except OperationalError as exc:
+                if (attempt == LOCKED_ATTEMPTS or connection.in_atomic_block
+                        or 'database is locked' not in str(exc)):
+                    raise
+            time.sleep(random.uniform(0, LOCKED_RETRY_DELAY * 2 ** (attempt - 1)))
+    return wrapper
+
+
+@retry_when_locked
+def create_sales_bulk(sales_data):
+    """
+    Create many sales with their items in one transaction.
+
+    ``sales_data`` is a list of dicts with ``customer`` (id), ``status`` and
+    ``items`` (a list of ``{'product': id, 'quantity': n}``). Everything is
+    validated before the first write; if any sale fails, nothing is written
+    and ``SaleValidationError`` is raised. Returns the created ``Sale``
+    instances in input order.
+    """
+    customer_ids = {sale['customer'] for sale in sales_data}
+    product_ids = {item['product'] for sale in sales_data for item in sale['items']}
+
+    with transaction.atomic():
+        existing_customers = set(
+            Customer.objects.filter(pk__in=customer_ids).values_list('pk', flat=True)
+        )
+        products = _lock_products(product_ids)
+        demand = _stock_demand(
+            item for sale in sales_data for item in sale['items']
+        )
+
+        short = {
+            product_id for product_id, quantity in demand.items()
+            if product_id in products and products[product_id].stock < quantity
+        }
+
+        errors = []
+        for sale in sales_data:
+            sale_errors = {}
+            if sale['customer'] not in existing_customers:
+                sale_errors['customer'] = [f"Customer {sale['customer']} does not exist."]
+            item_errors = []
+            for item in sale['items']:
+                if item['product'] not in products:
+                    item_errors.append(f"Product {item['product']} does not exist.")
+                elif item['product'] in short:
+                    item_errors.append(
+                        f"Insufficient stock for product {item['product']}: "
+                        f"{products[item['product']].stock} available, "
+                        f"{demand[item['product']]} requested in this batch."
+                    )
+            if item_errors:
+                sale_errors['items'] = item_errors
+            errors.append(sale_errors)
+
+        if any(errors):
+            raise SaleValidationError(errors)
+
+        sales = []
+        for sale in sales_data:
+            total_amount = sum(
+                (products[item['product']].price * item['quantity'] for item in sale['items']),
+                Decimal('0')
+            )
+            sales.append(Sale(
+                customer_id=sale['customer'],
+                status=sale['status'],
+                total_amount=total_amount
+            ))
+        Sale.objects.bulk_create(sales, batch_size=BULK_BATCH_SIZE)
+
+        SaleItem.objects.bulk_create(
+            [
+                _build_item(sale, item, products)
+                for sale, data in zip(sales, sales_data)
+                for item in data['items']
+            ],
+            batch_size=BULK_BATCH_SIZE
+        )
+
+        failed = _decrement_stock(demand)
+        if failed is not None:
+            raise SaleValidationError([
+                {'items': [f'Insufficient stock for product {failed}.']}
+                if any(item['product'] == failed for item in sale['items']) else {}
+                for sale in sales_data
+            ])
+        _publish_stock_changes(demand, products)
+
+        completed = [sale.pk for sale in sales if sale.status == 'completed']
+        if completed:
+            rollups.sync_sales.enqueue(completed)
+        counters.apply_sales(completed)
+        # bulk_create() and update() send no signals.
+        bump_data_version(Sale, SaleItem, Product)
+
+    return sales
+
+
+@retry_when_locked
+def create_sale(customer, status, items):
+    """
+    Create a single sale with its items.
+
+    ``items`` is a list of ``{'product': id, 'quantity': n}``. The affected
+    products are locked, priced and decremented inside one transaction, the
+    sale row is inserted with its final ``total_amount`` and all items go in
+    with one INSERT. Raises ``SaleValidationError`` (with a single error
+    dict) if a product is unknown or would go out of stock.
+    """
+    with transaction.atomic():
+        products = _lock_products({item['product'] for item in items})
+        demand = _stock_demand(items)
+
+        item_errors = []
+        for product_id, quantity in demand.items():
+            if product_id not in products:
+                item_errors.append(f'Product {product_id} does not exist.')
+            elif products[product_id].stock < quantity:
+                item_errors.append(
+                    f'Insufficient stock for product {product_id}: '
+                    f'{products[product_id].stock} available, {quantity} requested.'
+                )
+        if item_errors:
+            raise SaleValidationError([{'items': item_errors}])
+
+        sale = Sale.objects.create(
+            customer=customer,
+            status=status,
+            total_amount=sum(
+                (products[item['product']].price * item['quantity'] for item in items),
+                Decimal('0')
+            )
+        )
+        SaleItem.objects.bulk_create([_build_item(sale, item, products) for item in items])
+
+        failed = _decrement_stock(demand)
+        if failed is not None:
+            raise SaleValidationError([
+                {'items': [f'Insufficient stock for product {failed}.']}
+            ])
+        _publish_stock_changes(demand, products)
+
+        if sale.status == 'completed':
+            rollups.sync_sales.enqueue([sale.pk])
+            counters.apply_sales([sale.pk])
+        bump_data_version(SaleItem, Product)
+
+    return sale
+
+
+def _lock_products(product_ids):
+    """
+    Fetch the given products as ``{pk: product}``, holding row locks until
+    the surrounding transaction ends. Rows are locked in primary key order
+    so two writers touching overlapping products cannot deadlock.
+    """
+    if not connection.features.has_select_for_update:
+        # No row locks (SQLite): take the database write lock with a no-op
+        # UPDATE before reading anything. Waiting for it then goes through
+        # busy_timeout, whereas upgrading a read transaction fails at once
+        # while another writer commits.
+        Product.objects.filter(pk__in=product_ids).update(stock=F('stock'))
+    return {
+        product.pk: product
+        for product in Product.objects.select_for_update()
+        .filter(pk__in=product_ids)
+        .only('id', 'name', 'price', 'stock')
+        .order_by('pk')
+    }
+
+
+def _stock_demand(items):
+    demand = defaultdict(int)
+    for item in items:
+        demand[item['product']] += item['quantity']
+    return demand
+
+
+def _publish_stock_changes(demand, products):
+    # Stock was read by _lock_products() in this transaction (under row
+    # locks where the backend has them), so no need to read it back.
+    events.stock_changed(
+        (product_id, products[product_id].name, products[product_id].stock,
+         products[product_id].stock - quantity)
+        for product_id, quantity in sorted(demand.items())
+    )
+
+
+def _build_item(sale, item, products):
+    # bulk_create() skips SaleItem.save(), so total_price is set here.
+    unit_price = products[item['product']].price
+    return SaleItem(
+        sale=sale,
+        product_id=item['product'],
+        quantity=item['quantity'],
+        unit_price=unit_price,
+        total_price=unit_price * item['quantity']
+    )
+
+
+def _decrement_stock(demand):
+    """
+    Subtract ``demand`` ({product_id: quantity}) from stock, one UPDATE per
+    product in primary key order. Each UPDATE only matches while enough stock
+    is left, so stock can never go negative even without row locks (e.g. on
+    SQLite). Returns the id of the first product that could not be
+    decremented, or None; callers must roll back in that case.
+    """
+    now = timezone.now()
+    for product_id, quantity in sorted(demand.items()):
+        updated = Product.objects.filter(
+            pk=product_id, stock__gte=quantity
+        ).update(stock=F('stock') - quantity, updated_at=now)
+        if not updated:
+            return product_id
+    return None
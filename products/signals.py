@@ -0,0 +1,90 @@
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from . import counters, events, images, rollups
+from .cache import bump_data_version
+from .models import Category, Customer, Product, Sale, SaleItem
+
+
+@receiver(pre_save, sender=Sale)
+def remember_sale_status(sender, instance, **kwargs):
+    """
+    Keep the stored status around so post_save can tell whether the sale
+    moved into or out of the rollup.
+    """
+    instance._previous_status = None
+    if instance.pk:
+        instance._previous_status = Sale.objects.filter(
+            pk=instance.pk
+        ).values_list('status', flat=True).first()
+
+
+@receiver(post_save, sender=Sale)
+def update_rollup_on_status_change(sender, instance, created, **kwargs):
+    # New sales are rolled up by services once their items are written.
+    if created:
+        return
+    previous = getattr(instance, '_previous_status', None)
+    if previous == instance.status:
+        return
+    if instance.status == 'completed':
+        rollups.sync_sales.enqueue([instance.pk])
+        counters.apply_sales([instance.pk], sign=1)
+    elif previous == 'completed':
+        rollups.sync_sales.enqueue([instance.pk])
+        counters.apply_sales([instance.pk], sign=-1)
+
+
+@receiver(pre_delete, sender=Sale)
+def remove_deleted_sale_from_rollup(sender, instance, **kwargs):
+    # Runs before the cascade removes the items, so they are still counted.
+    rollups.remove_sales([instance.pk])
+    if instance.status == 'completed':
+        counters.apply_sales([instance.pk], sign=-1)
+
+
+@receiver(pre_save, sender=Product)
+def remember_product_state(sender, instance, **kwargs):
+    instance._previous_category_id = instance._previous_stock = previous_image = None
+    if instance.pk:
+        previous = Product.objects.filter(pk=instance.pk).values_list(
+            'category_id', 'stock', 'image'
+        ).first() or (None, None, None)
+        instance._previous_category_id, instance._previous_stock, previous_image = previous
+    instance._image_changed = (previous_image or '') != (instance.image.name or '')
+    if instance._image_changed:
+        # Renditions of the old image are stale; new ones follow the save.
+        instance.image_renditions = {}
+
+
+@receiver(post_save, sender=Product)
+def update_category_count_on_save(sender, instance, created, **kwargs):
+    previous = None if created else getattr(instance, '_previous_category_id', None)
+    if previous != instance.category_id:
+        counters.move_product(previous, instance.category_id)
+
+
+@receiver(post_save, sender=Product)
+def publish_stock_change(sender, instance, created, **kwargs):
+    previous = None if created else getattr(instance, '_previous_stock', None)
+    events.stock_changed([(instance.pk, instance.name, previous, instance.stock)])
+
+
+@receiver(post_save, sender=Product)
+def build_image_renditions(sender, instance, **kwargs):
+    if getattr(instance, '_image_changed', False) and instance.image:
+        images.schedule(instance)
+
+
+@receiver(post_delete, sender=Product)
+def update_category_count_on_delete(sender, instance, **kwargs):
+    counters.move_product(instance.category_id, None)
+
+
+def bump_version_on_change(sender, **kwargs):
+    bump_data_version(sender)
+
+
+for model in (Category, Product, Customer, Sale, SaleItem):
+    post_save.connect(bump_version_on_change, sender=model, dispatch_uid=f'bump_version_save_{model.__name__}')
+    post_delete.connect(bump_version_on_change, sender=model, dispatch_uid=f'bump_version_delete_{model.__name__}')
@@ -0,0 +1,280 @@
+"""
+Columnar snapshot of the sales facts, for reports that should not load
+the database.
+
+``export()`` (``manage.py snapshot_sales``) appends one row per sale item
+to a set of column files in ``SALES_SNAPSHOT_DIR``. Each column is a raw
+array of fixed-width values (``COLUMNS``), so ``SalesSnapshot`` can map
+it into memory and aggregate it with NumPy without reading more than the
+pages a report touches. ``meta.json`` holds the row count and the
+watermark, the highest sale item id exported. Each run appends items past
+the watermark and rewrites ``meta.json`` last, so an interrupted run
+leaves the snapshot as it was.
+
+Rows are copied as they are at export time. Later changes to exported
+sales (status changes, deletions, edited items) only show up after
+``snapshot_sales --rebuild``. Items newer than
+``SALES_SNAPSHOT_LAG_SECONDS`` are left for the next run, so that a
+transaction that took a lower id but commits later is not skipped.
+"""
+
+import datetime
+import json
+import os
+from contextlib import contextmanager
+
+import numpy as np
+from django.conf import settings
+from django.utils import timezone
+
+from product_management.routers import replica_reads
+
+from . import analytics
+from .models import Category, Customer, Product, Sale, SaleItem
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+COLUMNS = {
+    'item_id': np.int64,
+    'sale_id': np.int64,
+    'sale_date': 'datetime64[s]',
+    'customer_id': np.int64,
+    'product_id': np.int64,
+    'category_id': np.int64,
+    'status': np.uint8,
+    'quantity': np.int32,
+    'unit_price_cents': np.int64,
+    'total_cents': np.int64,
+}
+
+# Codes of the ``status`` column.
+STATUSES = [value for value, label in Sale._meta.get_field('status').choices]
+
+# Sale items read from the database per query.
+CHUNK_SIZE = 50000
+
+META_FILE = 'meta.json'
+FORMAT_VERSION = 1
+
+
+class SnapshotMissing(Exception):
+    pass
+
+
+def export(directory=None, rebuild=False, chunk_size=CHUNK_SIZE):
+    """
+    Append sale items past the watermark to the snapshot in ``directory``
+    (``SALES_SNAPSHOT_DIR``), starting over with ``rebuild``. Reads from a
+    replica when one is configured. Returns ``(appended, total)`` rows.
+    """
+    directory = directory or settings.SALES_SNAPSHOT_DIR
+    os.makedirs(directory, exist_ok=True)
+    with _exclusive(directory):
+        if rebuild:
+            _clear(directory)
+        meta = _read_meta(directory) or _empty_meta()
+        cutoff = timezone.now() - datetime.timedelta(seconds=settings.SALES_SNAPSHOT_LAG_SECONDS)
+        appended = 0
+        with replica_reads():
+            while True:
+                rows = list(
+                    SaleItem.objects.filter(id__gt=meta['watermark']).order_by('id').values_list(
+                        'id', 'sale_id', 'sale__sale_date', 'sale__customer_id', 'product_id',
+                        'product__category_id', 'sale__status', 'quantity', 'unit_price',
+                        'total_price', 'sale__created_at'
+                    )[:chunk_size]
+                )
+                # Stop at the first item that is too recent; the ones after
+                # it are newer still.
+                recent = next((index for index, row in enumerate(rows) if row[-1] > cutoff), None)
+                if recent is not None:
+                    rows = rows[:recent]
+                if rows:
+                    _append(directory, meta, _to_columns(rows))
+                    appended += len(rows)
+                    meta['watermark'] = rows[-1][0]
+                    meta['rows'] += len(rows)
+                    meta['updated_at'] = timezone.now().isoformat()
+                    _write_meta(directory, meta)
+                if recent is not None or len(rows) < chunk_size:
+                    return appended, meta['rows']
+
+
+def _to_columns(rows):
+    (item_id, sale_id, sale_date, customer_id, product_id, category_id, status, quantity,
+     unit_price, total_price, _) = zip(*rows)
+    codes = {value: code for code, value in enumerate(STATUSES)}
+    return {
+        'item_id': np.array(item_id, dtype=np.int64),
+        'sale_id': np.array(sale_id, dtype=np.int64),
+        'sale_date': np.fromiter(map(datetime.datetime.timestamp, sale_date), np.float64, len(rows))
+        .astype(np.int64).astype('datetime64[s]'),
+        'customer_id': np.array(customer_id, dtype=np.int64),
+        'product_id': np.array(product_id, dtype=np.int64),
+        'category_id': np.array(category_id, dtype=np.int64),
+        'status': np.fromiter(map(codes.__getitem__, status), np.uint8, len(rows)),
+        'quantity': np.array(quantity, dtype=np.int32),
+        'unit_price_cents': np.rint(np.array(unit_price, dtype=np.float64) * 100).astype(np.int64),
+        'total_cents': np.rint(np.array(total_price, dtype=np.float64) * 100).astype(np.int64),
+    }
+
+
+def _append(directory, meta, columns):
+    for name, values in columns.items():
+        dtype = np.dtype(COLUMNS[name])
+        path = os.path.join(directory, f'{name}.bin')
+        with open(path, 'ab') as column_file:
+            # Drop anything an interrupted run wrote past the last
+            # recorded row, then grow the file for the new rows.
+            column_file.truncate((meta['rows'] + len(values)) * dtype.itemsize)
+        mapped = np.memmap(path, dtype=dtype, mode='r+', offset=meta['rows'] * dtype.itemsize,
+                           shape=(len(values),))
+        mapped[:] = values
+        mapped.flush()
+
+
+def _empty_meta():
+    return {
+        'version': FORMAT_VERSION,
+        'watermark': 0,
+        'rows': 0,
+        'columns': {name: np.dtype(dtype).str for name, dtype in COLUMNS.items()},
+        'statuses': STATUSES,
+        'updated_at': None,
+    }
+
+
+def _read_meta(directory):
+    try:
+        with open(os.path.join(directory, META_FILE)) as meta_file:
+            return json.load(meta_file)
+    except FileNotFoundError:
+        return None
+
+
+def _write_meta(directory, meta):
+    path = os.path.join(directory, META_FILE)
+    with open(f'{path}.tmp', 'w') as meta_file:
+        json.dump(meta, meta_file, indent=2)
+        meta_file.flush()
+        os.fsync(meta_file.fileno())
+    os.replace(f'{path}.tmp', path)
+
+
+def _clear(directory):
+    for name in [META_FILE, *(f'{column}.bin' for column in COLUMNS)]:
+        try:
+            os.remove(os.path.join(directory, name))
+        except FileNotFoundError:
+            pass
+
+
+@contextmanager
+def _exclusive(directory):
+    """Keep two exports from appending to the same snapshot."""
+    with open(os.path.join(directory, '.lock'), 'a') as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        yield
+
+
+class SalesSnapshot:
+    """
+    Read-only view of the snapshot in ``directory``. ``column(name)`` maps
+    a column into memory; the other methods aggregate over them.
+    """
+
+    def __init__(self, directory=None):
+        self.directory = directory or settings.SALES_SNAPSHOT_DIR
+        self.meta = _read_meta(self.directory)
+        if self.meta is None:
+            raise SnapshotMissing('No sales snapshot yet; run manage.py snapshot_sales.')
+        self.rows = self.meta['rows']
+        self._columns = {}
+
+    def column(self, name):
+        if name not in self._columns:
+            dtype = np.dtype(self.meta['columns'][name])
+            if self.rows:
+                self._columns[name] = np.memmap(
+                    os.path.join(self.directory, f'{name}.bin'), dtype=dtype, mode='r', shape=(self.rows,)
+                )
+            else:
+                self._columns[name] = np.empty(0, dtype=dtype)
+        return self._columns[name]
+
+    def select(self, start=None, stop=None, status='completed'):
+        """
+        Boolean mask of the rows with ``status`` (any with None) whose sale
+        date is at or after ``start`` and before ``stop`` (``datetime64``).
+        """
+        mask = np.ones(self.rows, dtype=bool)
+        if status is not None:
+            mask &= self.column('status') == self.meta['statuses'].index(status)
+        dates = self.column('sale_date')
+        if start is not None:
+            mask &= dates >= start.astype('datetime64[s]')
+        if stop is not None:
+            mask &= dates < stop.astype('datetime64[s]')
+        return mask
+
+    def totals(self, mask=None, by=None):
+        """
+        Amount (in cents), units and number of sales of the rows in
+        ``mask``, overall or per value of column ``by`` as arrays
+        ``(keys, cents, quantity, sales)``.
+        """
+        mask = self.select() if mask is None else mask
+        cents = self.column('total_cents')[mask]
+        quantity = self.column('quantity')[mask]
+        sales = self.first_of_sale(mask)
+        if by is None:
+            return int(cents.sum()), int(quantity.sum()), int(sales.sum())
+        keys, groups = np.unique(self.column(by)[mask], return_inverse=True)
+        groups = groups.reshape(-1)
+        return (
+            keys,
+            np.bincount(groups, weights=cents, minlength=len(keys)).round().astype(np.int64),
+            np.bincount(groups, weights=quantity, minlength=len(keys)).round().astype(np.int64),
+            np.bincount(groups, weights=sales, minlength=len(keys)).round().astype(np.int64),
+        )
+
+    def first_of_sale(self, mask):
+        """
+        For the rows in ``mask``, 1 on one item of each sale and 0 on the
+        others, so summing it counts sales rather than items.
+        """
+        sale_ids = self.column('sale_id')[mask]
+        flags = np.zeros(len(sale_ids), dtype=np.int64)
+        flags[np.unique(sale_ids, return_index=True)[1]] = 1
+        return flags
+
+
+def sales_series(granularity, group_by, start, end, top, snapshot=None):
+    """
+    ``analytics.sales_series()`` computed from ``snapshot`` (by default
+    the one in ``SALES_SNAPSHOT_DIR``). Periods are in UTC. Only the
+    labels of the groups shown are read from the database.
+    """
+    snapshot = snapshot or SalesSnapshot()
+    axis = analytics.period_axis(granularity, start, end)
+    mask = snapshot.select(axis[0], axis[-1] + analytics.GRANULARITIES[granularity][1])
+    stamps = snapshot.column('sale_date')[mask]
+    by_items = group_by in ('category', 'product')
+    keys = snapshot.column(f'{group_by}_id')[mask] if group_by else np.zeros(len(stamps), dtype=np.int64)
+    counts = snapshot.column('quantity')[mask] if by_items else snapshot.first_of_sale(mask)
+    model = {'category': Category, 'product': Product, 'customer': Customer}.get(group_by)
+
+    def labels(group_keys, rows):
+        with replica_reads():
+            names = dict(model.objects.filter(pk__in=group_keys).values_list('pk', 'name'))
+        return [names.get(key, '') for key in group_keys]
+
+    return analytics.dense_series(
+        granularity, group_by, axis, stamps, keys, snapshot.column('total_cents')[mask], counts,
+        'quantity' if by_items else 'sales', top, labels
+    )
+
@@ -0,0 +1,153 @@
+"""
+Server-Sent Events stream of inventory events (``products.events``).
+
+``InventoryEventStream`` is a plain ASGI application mounted in front of
+Django by ``product_management.asgi``: each client is one coroutine
+waiting on its subscription queue, so a process holds thousands of idle
+connections without a thread each. It also watches for the client's
+``http.disconnect``, which Django's ASGI handler does not do for
+streaming responses, so subscriptions end with their connections.
+
+    GET /api/events/inventory/?product=1,2&type=low_stock,restocked
+
+Both parameters are optional. Events are ``stock``, ``low_stock`` and
+``restocked``, each with a JSON ``data`` line. Comment lines are sent as
+heartbeats while nothing happens.
+"""
+
+import asyncio
+import json
+from urllib.parse import parse_qs
+
+from django.conf import settings
+
+from .events import CLOSED, get_broker
+
+PATH = '/api/events/inventory/'
+
+EVENT_TYPES = {'stock', 'low_stock', 'restocked'}
+
+# Seconds of silence before a heartbeat; keeps proxies from timing out
+# idle connections.
+HEARTBEAT_INTERVAL = 15
+
+# Milliseconds EventSource clients wait before reconnecting.
+RETRY_MS = 3000
+
+
+def mount(application):
+    """
+    Wrap the Django ASGI ``application`` so that ``PATH`` is served by the
+    event stream.
+    """
+    stream = InventoryEventStream()
+
+    async def router(scope, receive, send):
+        if scope['type'] == 'http' and scope['path'] == PATH:
+            await stream(scope, receive, send)
+        else:
+            await application(scope, receive, send)
+    return router
+
+
+class InventoryEventStream:
+    async def __call__(self, scope, receive, send):
+        if scope['method'] != 'GET':
+            await _plain_response(send, 405, b'Method Not Allowed', [(b'allow', b'GET')])
+            return
+        try:
+            products, types = _parse_filters(scope['query_string'])
+        except ValueError as exc:
+            await _plain_response(send, 400, str(exc).encode())
+            return
+
+        broker = get_broker()
+        subscription = broker.subscribe(products=products, types=types)
+        try:
+            await send({
+                'type': 'http.response.start',
+                'status': 200,
+                'headers': [
+                    (b'content-type', b'text/event-stream'),
+                    (b'cache-control', b'no-cache'),
+                    # Stop nginx from buffering the stream.
+                    (b'x-accel-buffering', b'no'),
+                ] + _cors_headers(scope),
+            })
+            await _send_chunk(send, f'retry: {RETRY_MS}\n\n')
+
+            pump = asyncio.ensure_future(self.pump(subscription, send))
+            disconnect = asyncio.ensure_future(_wait_for_disconnect(receive))
+            done, pending = await asyncio.wait(
+                {pump, disconnect}, return_when=asyncio.FIRST_COMPLETED
+            )
+            for task in pending:
+                task.cancel()
+            if pump in done:
+                pump.result()
+                await send({'type': 'http.response.body', 'body': b''})
+        finally:
+            broker.unsubscribe(subscription)
+
+    async def pump(self, subscription, send):
+        """
+        Forward events until the subscription is closed (the client fell
+        too far behind and should reconnect).
+        """
+        while True:
+            try:
+                event = await asyncio.wait_for(subscription.get(), HEARTBEAT_INTERVAL)
+            except asyncio.TimeoutError:
+                await _send_chunk(send, ': heartbeat\n\n')
+                continue
+            if event is CLOSED:
+                return
+            await _send_chunk(
+                send, f"event: {event['event']}\ndata: {json.dumps(event['data'])}\n\n"
+            )
+
+
+def _parse_filters(query_string):
+    query = parse_qs(query_string.decode('latin-1'))
+    products = types = None
+    if query.get('product'):
+        try:
+            products = {int(value) for value in ','.join(query['product']).split(',') if value}
+        except ValueError:
+            raise ValueError('product must be a comma-separated list of ids')
+    if query.get('type'):
+        types = {value for value in ','.join(query['type']).split(',') if value}
+        unknown = types - EVENT_TYPES
+        if unknown:
+            raise ValueError(f"Unknown event type: {', '.join(sorted(unknown))}")
+    return products, types
+
+
+def _cors_headers(scope):
+    # This endpoint bypasses Django's middleware, including django-cors-headers.
+    origin = dict(scope['headers']).get(b'origin')
+    if origin is None:
+        return []
+    if settings.CORS_ALLOW_ALL_ORIGINS:
+        return [(b'access-control-allow-origin', b'*')]
+    if origin.decode('latin-1') in settings.CORS_ALLOWED_ORIGINS:
+        return [(b'access-control-allow-origin', origin), (b'vary', b'Origin')]
+    return []
+
+
+async def _wait_for_disconnect(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+async def _send_chunk(send, text):
+    await send({'type': 'http.response.body', 'body': text.encode(), 'more_body': True})
+
+
+async def _plain_response(send, status, body, headers=()):
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', b'text/plain; charset=utf-8')] + list(headers),
+    })
+    await send({'type': 'http.response.body', 'body': body})
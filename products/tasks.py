@@ -0,0 +1,335 @@
+"""
+Background tasks for work that can follow a write instead of slowing it
+down: rollups, image renditions, inventory events.
+
+Functions decorated with ``@task`` still run directly when called, and
+``.enqueue(*args, **kwargs)`` queues them once the current transaction
+commits (right away outside one), so a rolled-back write queues nothing.
+Arguments must be JSON serializable. ``TASK_BACKEND`` decides where
+queued tasks run:
+
+- ``thread`` (default): ``TASK_WORKERS`` threads in each process, with up
+  to ``TASK_QUEUE_SIZE`` tasks waiting. When the queue is full the task
+  runs in the enqueuing thread, which slows that request down instead of
+  losing the task. Tasks still waiting when the process stops are lost.
+- ``database``: a ``QueuedTask`` row, written in the transaction of the
+  data it follows up on and run by ``manage.py run_tasks``, so tasks
+  survive restarts. A task left running by a worker that died is run
+  again after ``TASK_LEASE_SECONDS``.
+- ``inline``: in the enqueuing thread, right after the commit.
+
+Tasks declared ``durable=False`` only make sense in the process that
+enqueued them (e.g. delivering events to its SSE clients) and always use
+the threads. Tasks declared ``allow_inline=False`` are too slow to hold up
+a request (e.g. resizing images) and use the threads with the ``inline``
+backend too. Tasks declared ``ordered=True`` get a thread of their own
+and run one at a time in enqueue order.
+
+A task that raises is retried up to ``retries`` times, ``retry_delay``
+seconds later and doubling with each attempt, so it must be safe to run
+again: a task doing several writes should do them in one transaction.
+Retries of thread and inline tasks run in the threads, so a failing
+inline task does not keep its request waiting.
+``stats()`` reports queue depth and wait and run times.
+"""
+
+import logging
+import queue
+import threading
+import time
+import traceback
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from functools import update_wrapper
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.db.models import Count, F, Min, Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import QueuedTask
+
+logger = logging.getLogger(__name__)
+
+# Wait and run times kept per task for the percentiles in stats().
+SAMPLE_SIZE = 1000
+
+
+def task(function=None, *, retries=3, retry_delay=1, durable=True, ordered=False, allow_inline=True):
+    """
+    Make ``function`` a task (usable as ``@task`` or ``@task(...)``).
+    """
+    def decorate(function):
+        return Task(function, retries, retry_delay, durable, ordered, allow_inline)
+    return decorate(function) if function is not None else decorate
+
+
+class Task:
+    def __init__(self, function, retries, retry_delay, durable, ordered, allow_inline):
+        update_wrapper(self, function)
+        self.function = function
+        self.name = f'{function.__module__}.{function.__name__}'
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.durable = durable
+        self.ordered = ordered
+        self.allow_inline = allow_inline
+
+    def __call__(self, *args, **kwargs):
+        return self.function(*args, **kwargs)
+
+    def __repr__(self):
+        return f'<Task {self.name}>'
+
+    def enqueue(self, *args, **kwargs):
+        _stats.count(self.name, 'enqueued')
+        if settings.TASK_BACKEND == 'database' and self.durable:
+            QueuedTask.objects.create(name=self.name, args=list(args), kwargs=kwargs)
+        elif settings.TASK_BACKEND == 'inline' and self.allow_inline:
+            transaction.on_commit(lambda: Job(self, args, kwargs).run())
+        else:
+            transaction.on_commit(lambda: _get_pool(self).submit(Job(self, args, kwargs)))
+
+    def delay(self, attempt):
+        """Seconds to wait before the attempt after ``attempt``."""
+        return self.retry_delay * 2 ** (attempt - 1)
+
+
+class Job:
+    """One queued run of a task in this process."""
+
+    def __init__(self, task, args, kwargs, attempt=1):
+        self.task = task
+        self.args = args
+        self.kwargs = kwargs
+        self.attempt = attempt
+        self.queued_at = time.monotonic()
+
+    def run(self):
+        error = _execute(self.task, self.args, self.kwargs, self.attempt,
+                         time.monotonic() - self.queued_at)
+        if error is not None and self.attempt <= self.task.retries:
+            retry = Job(self.task, self.args, self.kwargs, self.attempt + 1)
+            timer = threading.Timer(self.task.delay(self.attempt), _get_pool(self.task).submit, [retry])
+            timer.daemon = True
+            timer.start()
+
+
+class ThreadPool:
+    """
+    ``workers`` daemon threads taking jobs from a queue of at most
+    ``size``; a job that does not fit runs in the submitting thread.
+    """
+
+    def __init__(self, name, workers, size):
+        self.name = name
+        self.queue = queue.Queue(size)
+        for number in range(workers):
+            threading.Thread(target=self._work, name=f'{name}-{number}', daemon=True).start()
+
+    def submit(self, job):
+        try:
+            self.queue.put_nowait(job)
+        except queue.Full:
+            _stats.count(job.task.name, 'overflowed')
+            logger.warning('Task queue %s is full, running %s in the caller', self.name, job.task.name)
+            job.run()
+
+    def _work(self):
+        while True:
+            job = self.queue.get()
+            try:
+                job.run()
+            except Exception:
+                logger.exception('Task worker %s failed', threading.current_thread().name)
+            finally:
+                close_old_connections()
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def _get_pool(task):
+    name = f'tasks-{task.name}' if task.ordered else 'tasks'
+    with _pools_lock:
+        if name not in _pools:
+            workers = 1 if task.ordered else max(settings.TASK_WORKERS, 1)
+            _pools[name] = ThreadPool(name, workers, settings.TASK_QUEUE_SIZE)
+        return _pools[name]
+
+
+def _execute(task, args, kwargs, attempt, wait):
+    """
+    Run one attempt of ``task`` and record it. Returns the exception it
+    raised, or None.
+    """
+    started = time.monotonic()
+    try:
+        task.function(*args, **kwargs)
+    except Exception as exc:
+        final = attempt > task.retries
+        logger.log(
+            logging.ERROR if final else logging.WARNING,
+            'Task %s failed (attempt %d of %d)', task.name, attempt, task.retries + 1,
+            exc_info=True
+        )
+        _stats.record(task.name, 'failed' if final else 'retried', wait, time.monotonic() - started)
+        return exc
+    _stats.record(task.name, 'succeeded', wait, time.monotonic() - started)
+    return None
+
+
+def run_worker(workers=1, poll_interval=1.0, once=False):
+    """
+    Run ``QueuedTask`` rows as they become due, ``workers`` at a time,
+    checking for new ones every ``poll_interval`` seconds. With ``once``,
+    return when none are due. Returns the number of tasks run.
+    """
+    done = 0
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='run_tasks') as pool:
+        while True:
+            claimed = claim(workers)
+            done += len(list(pool.map(run_queued, claimed)))
+            if not claimed:
+                if once:
+                    return done
+                time.sleep(poll_interval)
+
+
+def claim(limit):
+    """
+    Mark up to ``limit`` due tasks as running by this worker and return
+    them. Tasks whose lease has run out count as due again.
+    """
+    now = timezone.now()
+    due = QueuedTask.objects.filter(
+        Q(status='pending', run_after__lte=now)
+        | Q(status='running', started_at__lt=now - timedelta(seconds=settings.TASK_LEASE_SECONDS))
+    ).order_by('run_after', 'id')
+    if connection.features.has_select_for_update_skip_locked:
+        # Workers skip each other's rows instead of queueing behind them.
+        due = due.select_for_update(skip_locked=True)
+    with transaction.atomic():
+        claimed = list(due[:limit])
+        QueuedTask.objects.filter(pk__in=[row.pk for row in claimed]).update(
+            status='running', started_at=now, attempts=F('attempts') + 1
+        )
+    for row in claimed:
+        row.status, row.started_at = 'running', now
+        row.attempts += 1
+    return claimed
+
+
+def run_queued(row):
+    """
+    Run a claimed ``QueuedTask``, then delete it, put it back for a retry
+    or mark it failed.
+    """
+    try:
+        try:
+            task = import_string(row.name)
+        except ImportError:
+            logger.exception('Unknown task %s', row.name)
+            QueuedTask.objects.filter(pk=row.pk).update(status='failed', last_error=traceback.format_exc())
+            return
+        wait = (row.started_at - row.run_after).total_seconds()
+        error = _execute(task, row.args, row.kwargs, row.attempts, wait)
+        if error is None:
+            QueuedTask.objects.filter(pk=row.pk).delete()
+        elif row.attempts <= task.retries:
+            QueuedTask.objects.filter(pk=row.pk).update(
+                status='pending',
+                run_after=timezone.now() + timedelta(seconds=task.delay(row.attempts)),
+                last_error=_format_error(error)
+            )
+        else:
+            QueuedTask.objects.filter(pk=row.pk).update(status='failed', last_error=_format_error(error))
+    finally:
+        close_old_connections()
+
+
+def retry_failed():
+    """Queue every failed task again. Returns how many there were."""
+    return QueuedTask.objects.filter(status='failed').update(
+        status='pending', attempts=0, run_after=timezone.now()
+    )
+
+
+def _format_error(error):
+    return ''.join(traceback.format_exception(type(error), error, error.__traceback__))
+
+
+class Stats:
+    """Per-task counts and recent wait and run times in this process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = {}
+        self._waits = {}
+        self._runs = {}
+
+    def count(self, name, outcome):
+        with self._lock:
+            self._counts.setdefault(name, Counter())[outcome] += 1
+
+    def record(self, name, outcome, wait, run):
+        with self._lock:
+            self._counts.setdefault(name, Counter())[outcome] += 1
+            self._waits.setdefault(name, deque(maxlen=SAMPLE_SIZE)).append(wait)
+            self._runs.setdefault(name, deque(maxlen=SAMPLE_SIZE)).append(run)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                name: dict(
+                    counts,
+                    wait_ms=_percentiles(self._waits.get(name, ())),
+                    run_ms=_percentiles(self._runs.get(name, ()))
+                )
+                for name, counts in sorted(self._counts.items())
+            }
+
+
+_stats = Stats()
+
+
+def _percentiles(samples):
+    samples = sorted(samples)
+    if not samples:
+        return None
+    return {
+        'p50': round(samples[len(samples) // 2] * 1000, 2),
+        'p95': round(samples[int(len(samples) * 0.95)] * 1000, 2),
+        'max': round(samples[-1] * 1000, 2),
+    }
+
+
+def stats(database=True):
+    """
+    Queue depth per thread pool and, with ``database``, of the
+    ``QueuedTask`` table (which costs a query), plus counts and wait and
+    run time percentiles of the tasks this process enqueued or ran.
+    """
+    with _pools_lock:
+        pools = dict(_pools)
+    result = {
+        'backend': settings.TASK_BACKEND,
+        'threads': {name: pool.queue.qsize() for name, pool in sorted(pools.items())},
+        'tasks': _stats.snapshot(),
+    }
+    if database:
+        rows = QueuedTask.objects.values('status').annotate(
+            count=Count('id'), oldest=Min('run_after')
+        ).order_by()
+        now = timezone.now()
+        result['database'] = {
+            row['status']: {
+                'count': row['count'],
+                'oldest_seconds': round((now - row['oldest']).total_seconds(), 1),
+            }
+            for row in rows
+        }
+    return result
@@ -0,0 +1,33 @@
+from django import template
+from django.core.files.storage import default_storage
+from django.utils.html import format_html, format_html_join
+
+register = template.Library()
+
+
+@register.simple_tag
+def product_picture(product, size, **attributes):
+    """
+    ``<picture>`` of ``product``'s ``size`` rendition, WebP with a JPEG
+    fallback, or the original image while its renditions are being built.
+    Keyword arguments become attributes of the ``<img>``:
+
+        {% product_picture product 'thumb' class='me-2' style='width: 40px' %}
+    """
+    attributes.setdefault('alt', product.name)
+    attributes.setdefault('loading', 'lazy')
+    rendition = product.image_renditions.get(size)
+    if rendition is None:
+        return format_html('<img src="{}"{}>', product.image.url, _attributes(attributes))
+    attributes.setdefault('width', rendition['width'])
+    attributes.setdefault('height', rendition['height'])
+    return format_html(
+        '<picture><source srcset="{}" type="image/webp"><img src="{}"{}></picture>',
+        default_storage.url(rendition['webp']),
+        default_storage.url(rendition['jpeg']),
+        _attributes(attributes)
+    )
+
+
+def _attributes(attributes):
+    return format_html_join('', ' {}="{}"', sorted(attributes.items()))
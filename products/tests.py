@@ -0,0 +1,436 @@
+import datetime
+import json
+import threading
+import unittest
+import uuid
+from decimal import Decimal
+
+from asgiref.sync import async_to_sync, sync_to_async
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.db.models import Sum
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from product_management.routers import ReplicaRouter, replica_reads, use_primary
+
+from . import counters, rollups
+from .benchmark import QueryCounter, request_queries
+from .explain import explain
+from .models import Category, Customer, Product, Sale, SaleItem
+from .renderers import FastJSONRenderer, msgpack, orjson
+
+NO_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}
+
+
+class ConcurrentSaleTests(TransactionTestCase):
+    """
+    Buyers racing for the last units of a product, each thread with its
+    own connection to the test database.
+    """
+    buyers = 8
+    stock = 5
+
+    def setUp(self):
+        category = Category.objects.create(name='Electronics')
+        self.product = Product.objects.create(
+            name='Laptop', description='', category=category, price=Decimal('999.99'), stock=self.stock
+        )
+        self.customer = Customer.objects.create(name='Alex', email='alex@example.com', address='1 Main St')
+
+    def test_last_units_are_sold_once(self):
+        start = threading.Barrier(self.buyers)
+        statuses = []
+        errors = []
+
+        def buy():
+            client = APIClient()
+            start.wait()
+            try:
+                response = client.post('/api/sales/', {
+                    'customer': self.customer.id,
+                    'status': 'pending',
+                    'items': [{'product': self.product.id, 'quantity': 1}],
+                }, format='json')
+                statuses.append(response.status_code)
+            except Exception as exc:
+                errors.append(exc)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=buy) for _ in range(self.buyers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(sorted(statuses), [200] * self.stock + [400] * (self.buyers - self.stock))
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 0)
+        self.assertEqual(Sale.objects.count(), self.stock)
+        self.assertEqual(
+            SaleItem.objects.filter(product=self.product).aggregate(sold=Sum('quantity'))['sold'], self.stock
+        )
+
+
+def create_catalog(rows):
+    """
+    ``rows`` categories, products, customers and completed sales of two
+    items each, with the rollups and counters filled in.
+    """
+    categories = [Category.objects.create(name=f'Category {number}') for number in range(rows)]
+    products = [
+        Product.objects.create(
+            name=f'Product {number}', description='Sturdy', category=categories[number],
+            price=Decimal('10.00') + number, stock=100
+        )
+        for number in range(rows)
+    ]
+    customers = [
+        Customer.objects.create(name=f'Customer {number}', email=f'c{number}@example.com', address='1 Main St')
+        for number in range(rows)
+    ]
+    for number in range(rows):
+        sale = Sale.objects.create(customer=customers[0], total_amount=Decimal('0'), status='completed')
+        for product in (products[number], products[(number + 1) % rows]):
+            SaleItem.objects.create(sale=sale, product=product, quantity=1, unit_price=product.price)
+    rollups.rebuild()
+    counters.rebuild()
+    return categories[0], products[0], customers[0]
+
+
+def delete_catalog():
+    for model in (Sale, Product, Customer, Category):
+        model.objects.all().delete()
+
+
+class QueryBudgetMixin:
+    """
+    Every route must run a fixed number of queries whatever the number of
+    rows it shows: each is requested with ``small`` and with ``large``
+    rows (more than a page) and checked against its budget, with caches
+    off so the queries building cached snapshots are counted too.
+    """
+    small = 2
+    large = 12
+
+    # (name, path, queries); paths are formatted with the ids from
+    # create_catalog().
+    budgets = []
+
+    def test_query_budgets(self):
+        user = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'secret')
+        for rows in (self.small, self.large):
+            with self.subTest(rows=rows):
+                delete_catalog()
+                category, product, customer = create_catalog(rows)
+                ids = {
+                    'category': category.pk,
+                    'product': product.pk,
+                    'customer': customer.pk,
+                    'sale': Sale.objects.order_by('pk').first().pk,
+                    'sale_item': SaleItem.objects.order_by('pk').first().pk,
+                }
+                self.client.force_login(user)
+                for name, path, queries in self.budgets:
+                    with self.subTest(route=name, rows=rows):
+                        self.assertQueries(queries, path.format(**ids))
+
+
+@override_settings(CACHES=NO_CACHE)
+class QueryBudgetTests(QueryBudgetMixin, TestCase):
+    budgets = [
+        ('dashboard', '/', 10),
+        ('product_list', '/products/', 3),
+        ('product_list_search', '/products/?search=Product', 4),
+        ('product_create', '/products/create/', 3),
+        ('product_edit', '/products/{product}/edit/', 4),
+        ('category_list', '/categories/', 4),
+        ('customer_list', '/customers/', 3),
+        ('sale_list', '/sales/', 3),
+        ('api_categories', '/api/categories/', 5),
+        ('api_category_detail', '/api/categories/{category}/', 3),
+        ('api_category_products', '/api/categories/{category}/products/', 5),
+        ('api_products', '/api/products/', 4),
+        ('api_products_search', '/api/products/?search=Product', 5),
+        ('api_product_detail', '/api/products/{product}/', 3),
+        ('api_products_low_stock', '/api/products/low_stock/?threshold=1000', 4),
+        ('api_products_export', '/api/products/export/', 3),
+        ('api_customers', '/api/customers/', 4),
+        ('api_customer_detail', '/api/customers/{customer}/', 3),
+        ('api_customer_purchase_history', '/api/customers/{customer}/purchase_history/', 5),
+        ('api_sales', '/api/sales/', 4),
+        ('api_sale_detail', '/api/sales/{sale}/', 4),
+        ('api_sales_dashboard_stats', '/api/sales/dashboard_stats/', 6),
+        ('api_sales_export', '/api/sales/export/', 3),
+        ('api_sale_items', '/api/sale-items/', 3),
+        ('api_sale_item_detail', '/api/sale-items/{sale_item}/', 3),
+        ('api_sale_items_export', '/api/sale-items/export/', 3),
+        ('api_analytics_sales', '/api/analytics/sales/?group_by=product', 3),
+        ('api_task_stats', '/api/tasks/stats/', 3),
+    ]
+
+    def assertQueries(self, queries, path):
+        # Once unmeasured first, so one-off probes cached for the process
+        # (e.g. FTS5 support) are not counted against the route.
+        self.client.get(path)
+        with self.assertNumQueries(queries):
+            response = self.client.get(path)
+            self.assertEqual(response.status_code, 200)
+            if response.streaming:
+                b''.join(response.streaming_content)
+
+    def test_write_budgets(self):
+        """
+        Writes cost one statement per product touched, never per item or
+        per sale: ``small`` and ``large`` items or sales over the same two
+        products must cost the same.
+        """
+        user = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'secret')
+        self.client.force_login(user)
+        category, product, customer = create_catalog(self.large)
+        products = list(Product.objects.order_by('pk')[:2])
+        for size in (self.small, self.large):
+            items = [{'product': products[number % 2].pk, 'quantity': 1} for number in range(size)]
+            sale = {'customer': customer.pk, 'status': 'completed', 'items': items[:2]}
+            with self.subTest(route='api_sale_create', items=size), self.assertNumQueries(18):
+                response = self.client.post('/api/sales/', dict(sale, items=items), content_type='application/json')
+                self.assertEqual(response.status_code, 200)
+            with self.subTest(route='api_sales_bulk', sales=size), self.assertNumQueries(16):
+                response = self.client.post('/api/sales/bulk/', [sale] * size, content_type='application/json')
+                self.assertEqual(response.status_code, 201)
+        # Every product is in two sales, so deleting one costs the same
+        # whatever the catalog size.
+        for rows in (self.small, self.large):
+            with self.subTest(route='product_delete', rows=rows):
+                delete_catalog()
+                category, product, customer = create_catalog(rows)
+                with self.assertNumQueries(8):
+                    response = self.client.post(f'/products/{product.pk}/delete/')
+                    self.assertEqual(response.status_code, 302)
+
+
+@override_settings(CACHES=NO_CACHE)
+class AsyncQueryBudgetTests(QueryBudgetMixin, TransactionTestCase):
+    """
+    The async views query from ``sync_to_async`` threads, with their own
+    connections, so they need committed data and are counted through
+    ``benchmark.request_queries()``.
+    """
+    budgets = [
+        ('async_dashboard', '/async/', 10),
+        ('api_async_products', '/api/async/products/', 4),
+        ('api_async_product_detail', '/api/async/products/{product}/', 1),
+        ('api_async_products_low_stock', '/api/async/products/low_stock/?threshold=1000', 2),
+        ('api_async_sales_dashboard_stats', '/api/async/sales/dashboard_stats/', 4),
+    ]
+
+    def assertQueries(self, queries, path):
+        counter = QueryCounter()
+        with request_queries(counter):
+            response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(counter.count, queries, f'{path} ran {counter.count} queries')
+
+
+@override_settings(REPLICA_DATABASES=['replica1', 'replica2', 'replica3'])
+class ReplicaRouterTests(SimpleTestCase):
+
+    def test_one_replica_per_block(self):
+        router = ReplicaRouter()
+        self.assertEqual(router.db_for_read(Product), 'default')
+        chosen = set()
+        for _ in range(20):
+            with replica_reads():
+                alias = router.db_for_read(Product)
+                self.assertEqual({router.db_for_read(Sale) for _ in range(20)}, {alias})
+                with replica_reads():
+                    self.assertEqual(router.db_for_read(Customer), alias)
+                with use_primary():
+                    self.assertEqual(router.db_for_read(Product), 'default')
+                self.assertEqual(async_to_sync(sync_to_async(router.db_for_read))(Product), alias)
+            chosen.add(alias)
+        self.assertLessEqual(chosen, {'replica1', 'replica2', 'replica3'})
+
+
+class KeysetPaginationTests(TestCase):
+    """
+    More customers share a name than DRF's cursor OFFSET cap (1000).
+    """
+
+    def setUp(self):
+        Customer.objects.bulk_create(
+            Customer(name=name, email=f'{name.lower()}{number}@example.com', address='1 Main St')
+            for name, count in (('Alex', 1050), ('Bea', 3), ('Aaron', 2))
+            for number in range(count)
+        )
+
+    def pages(self, url, link):
+        pages = []
+        while url:
+            data = self.client.get(url).json()
+            pages.append([row['id'] for row in data['results']])
+            url = data[link]
+            self.assertLess(len(pages), 200)
+        return pages
+
+    def test_ties_page_forward_and_back(self):
+        expected = list(Customer.objects.order_by('name', 'id').values_list('id', flat=True))
+        forward = self.pages('/api/customers/', 'next')
+        self.assertEqual([id for page in forward for id in page], expected)
+
+        last = self.client.get('/api/customers/').json()
+        while last['next']:
+            last = self.client.get(last['next']).json()
+        backward = self.pages(last['previous'], 'previous')
+        self.assertEqual(backward[::-1] + [forward[-1]], forward)
+
+    def test_invalid_cursor(self):
+        self.assertEqual(self.client.get('/api/customers/?cursor=bm90LWpzb24=').status_code, 404)
+
+
+@override_settings(CACHES=NO_CACHE)
+class LowStockThresholdTests(TestCase):
+
+    def setUp(self):
+        category = Category.objects.create(name='Tools')
+        for stock in (5, 10, 15):
+            Product.objects.create(name=f'Stock {stock}', description='', category=category,
+                                   price=Decimal('1.00'), stock=stock)
+        self.client.force_login(get_user_model().objects.create_superuser('admin', 'a@example.com', 'x'))
+
+    def assertLowStock(self, stocks):
+        dashboard = self.client.get('/').context['low_stock_products']
+        self.assertEqual([product.stock for product in dashboard], stocks)
+        api = self.client.get('/api/products/low_stock/').json()
+        self.assertEqual(sorted(product['stock'] for product in api), stocks)
+
+    def test_dashboard_follows_setting(self):
+        self.assertLowStock([5, 10])
+        with self.settings(LOW_STOCK_THRESHOLD=20):
+            self.assertLowStock([5, 10, 15])
+
+
+@unittest.skipUnless(connection.vendor == 'sqlite', 'reads SQLite query plans')
+class ExplainTests(TestCase):
+
+    def scans(self, queryset):
+        return explain(connection, *queryset.query.sql_with_params())[1]
+
+    def test_ordered_limit_is_not_a_scan(self):
+        self.assertEqual(self.scans(Product.objects.order_by('id')[:10]), [])
+
+    def test_unordered_limit_is_a_scan(self):
+        self.assertEqual(self.scans(Product.objects.filter(stock__lt=5).order_by()[:10]), ['products_product'])
+
+    def test_limit_in_subquery_is_a_scan(self):
+        sold = SaleItem.objects.filter(quantity__gt=1).values('product_id')[:5]
+        queryset = Product.objects.filter(id__in=sold).order_by('id')[:3]
+        self.assertEqual(self.scans(queryset), ['products_saleitem'])
+
+
+class AsgiExportTests(TestCase):
+
+    def setUp(self):
+        create_catalog(3)
+
+    async def test_export_streams_asynchronously(self):
+        for path in ('/api/sales/export/?format=ndjson', '/api/products/export/?format=csv'):
+            with self.subTest(path=path):
+                response = await self.async_client.get(path)
+                self.assertTrue(response.is_async)
+                body = b''.join([chunk async for chunk in response.streaming_content])
+                expected = await sync_to_async(self.export)(path)
+                self.assertEqual(body, expected)
+
+    def export(self, path):
+        response = self.client.get(path)
+        self.assertFalse(response.is_async)
+        return b''.join(response.streaming_content)
+
+
+@unittest.skipIf(orjson is None, 'orjson is not installed')
+class FastJSONRendererTests(SimpleTestCase):
+    """
+    FastJSONRenderer must produce exactly the bytes of DRF's JSONRenderer,
+    except for the documented spelling of floats in exponent notation.
+    """
+
+    def assertRendersLikeDRF(self, data):
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+
+    def test_decimal(self):
+        self.assertRendersLikeDRF({
+            'price': Decimal('1999.90'),
+            'zero': Decimal('0.00'),
+            'negative': Decimal('-0.0001'),
+            'tiny': Decimal('0.000001'),
+            'huge': Decimal('12345678901234567890.5'),
+        })
+
+    def test_datetime(self):
+        self.assertRendersLikeDRF({
+            'naive': datetime.datetime(2024, 2, 29, 13, 45, 7, 123456),
+            'aware': datetime.datetime(2024, 2, 29, 13, 45, 7, 123456, tzinfo=datetime.timezone.utc),
+            'offset': datetime.datetime(2024, 2, 29, 13, 45, 7, tzinfo=timezone.get_fixed_timezone(90)),
+            'date': datetime.date(2024, 2, 29),
+            'time': datetime.time(13, 45, 7, 500),
+            'duration': datetime.timedelta(days=1, seconds=5),
+            'uuid': uuid.UUID(int=1),
+        })
+
+    def test_floats(self):
+        self.assertRendersLikeDRF({'plain': 0.1, 'negative': -1999.9, 'whole': 2.0})
+        # Exponent notation is the one documented difference in spelling.
+        data = {'big': 1e16, 'small': -2.5e-7, 'list': [1e300]}
+        self.assertEqual(json.loads(FastJSONRenderer().render(data)), json.loads(JSONRenderer().render(data)))
+
+    def test_non_str_keys(self):
+        # Separate dicts: True == 1, so they would collapse into one key.
+        self.assertRendersLikeDRF({1: 'one', 2.5: 'half', None: 'none'})
+        self.assertRendersLikeDRF({True: 'yes', False: 'no'})
+
+    def test_line_separators(self):
+        self.assertRendersLikeDRF({'name': 'Line\u2028break and\u2029paragraph \u00e9'})
+
+    def test_big_ints(self):
+        self.assertRendersLikeDRF({'big': 2 ** 64, 'negative': -2 ** 63 - 1, 'max': 2 ** 63 - 1})
+
+    def test_none(self):
+        self.assertRendersLikeDRF(None)
+
+
+@unittest.skipIf(msgpack is None, 'msgpack is not installed')
+class MessagePackTests(TestCase):
+
+    def setUp(self):
+        self.category = Category.objects.create(name='Tools')
+        Product.objects.create(
+            name='Hammer', description='Sturdy', category=self.category,
+            price=Decimal('12.50'), stock=3
+        )
+
+    def test_accept_msgpack(self):
+        response = self.client.get('/api/products/', HTTP_ACCEPT='application/msgpack')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/msgpack')
+        data = msgpack.unpackb(response.content, raw=False)
+        self.assertEqual(data, self.client.get('/api/products/', HTTP_ACCEPT='application/json').json())
+        self.assertEqual(data['results'][0]['price'], '12.50')
+
+    def test_format_msgpack(self):
+        response = self.client.get(f'/api/categories/{self.category.pk}/?format=msgpack')
+        self.assertEqual(response['Content-Type'], 'application/msgpack')
+        self.assertEqual(msgpack.unpackb(response.content, raw=False)['name'], 'Tools')
+
+    def test_msgpack_request_body(self):
+        response = self.client.post(
+            '/api/categories/', msgpack.packb({'name': 'Garden'}),
+            content_type='application/msgpack', HTTP_ACCEPT='application/msgpack'
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(msgpack.unpackb(response.content, raw=False)['name'], 'Garden')
+        self.assertTrue(Category.objects.filter(name='Garden').exists())
@@ -1,11 +1,12 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
+from . import async_views
 from .views import (
     CategoryViewSet, ProductViewSet, CustomerViewSet,
     SaleViewSet, SaleItemViewSet, DashboardView,
     ProductListView, ProductCreateView, ProductUpdateView,
     ProductDeleteView, CategoryListView, CustomerListView,
-    SaleListView
+    SaleListView, sales_analytics, task_stats
 )
 
 app_name = 'products'
@@ -36,6 +37,17 @@ urlpatterns = [
     # Sale URLs
     path('sales/', SaleListView.as_view(), name='sale_list'),
     
+    # Async variants of read-heavy views (for ASGI servers)
+    path('async/', async_views.dashboard, name='async_dashboard'),
+    path('api/async/products/', async_views.product_list, name='async_product_list'),
+    path('api/async/products/low_stock/', async_views.low_stock, name='async_low_stock'),
+    path('api/async/products/<int:pk>/', async_views.product_detail, name='async_product_detail'),
+    path('api/async/sales/dashboard_stats/', async_views.dashboard_stats,
+         name='async_dashboard_stats'),
+
+    path('api/analytics/sales/', sales_analytics, name='sales_analytics'),
+    path('api/tasks/stats/', task_stats, name='task_stats'),
+
     # API Routes
     path('api/', include(router.urls)),
 ]
@@ -48,6 +60,7 @@ urlpatterns = [
 # /api/products/ - List and create products
 # /api/products/{id}/ - Retrieve, update, delete product
 # /api/products/low_stock/ - List products with low stock
+# /api/products/export/ - Stream all products as NDJSON or CSV
 
 # /api/customers/ - List and create customers
 # /api/customers/{id}/ - Retrieve, update, delete customer
@@ -56,12 +69,22 @@ urlpatterns = [
 # /api/sales/ - List and create sales
 # /api/sales/{id}/ - Retrieve, update, delete sale
 # /api/sales/dashboard_stats/ - Get sales dashboard statistics
+# /api/sales/bulk/ - Create a batch of sales with their items (POST)
+# /api/sales/export/ - Stream all sales with their items as NDJSON or CSV
 
 # /api/sale-items/ - List and create sale items
 # /api/sale-items/{id}/ - Retrieve, update, delete sale item
+# /api/sale-items/export/ - Stream all sale items as NDJSON or CSV
+
+# /api/analytics/sales/ - Sales time series (?granularity=, group_by=, from=, to=, top=)
+# /api/tasks/stats/ - Background task queue depth and latency (staff only)
+
+# /api/async/products/, /api/async/products/{id}/, /api/async/products/low_stock/
+# and /api/async/sales/dashboard_stats/ - async variants of the above
 
 # Available template views:
 # / - Dashboard view
+# /async/ - Async variant of the dashboard
 # /products/ - Product list view
 # /products/create/ - Create new product
 # /products/<id>/edit/ - Edit existing product
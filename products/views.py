@@ -1,80 +1,151 @@
-from rest_framework import viewsets, filters
-from rest_framework.decorators import action
+from rest_framework import viewsets, filters, status
+from rest_framework.decorators import action, api_view, permission_classes
+from rest_framework.permissions import IsAdminUser
 from rest_framework.response import Response
-from django.db.models import Sum, Count, F
+from rest_framework.exceptions import ValidationError
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.db.models import Sum, F, Prefetch
 from django.views.generic import TemplateView, ListView, CreateView, UpdateView, DeleteView
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.urls import reverse_lazy
 from django.contrib import messages
 from django.utils import timezone
-from django.db.models.functions import TruncDate
 from datetime import timedelta
 from django_filters.rest_framework import DjangoFilterBackend
-from .models import Category, Product, Customer, Sale, SaleItem
+from .models import Category, Product, Customer, Sale, SaleItem, DailySales
 from .serializers import (
     CategorySerializer, ProductSerializer, CustomerSerializer,
-    SaleSerializer, SaleItemSerializer
+    SaleSerializer, SaleItemSerializer, BulkSaleSerializer
 )
+from .services import create_sales_bulk, SaleValidationError
+from . import analytics, snapshot, tasks
+from .cache import CachedListViewMixin, cached_snapshot, get_data_versions
+from .fast_serializers import ValuesListMixin
+from .conditional import ConditionalGetMixin, conditional_response, make_etag, version_validators
+from .filters import FullTextSearchFilter
+from .search import search_products
+from .exports import parse_since, streaming_response
+from .renderers import NDJSONRenderer, CSVRenderer
+from .pagination import (
+    CursorPaginationMixin, CursorListViewMixin, ProductCursorPagination,
+    CustomerCursorPagination, SaleCursorPagination, SaleItemCursorPagination
+)
+
+class ExportMixin:
+    """
+    Adds an ``export`` action streaming every row of ``export_kind``
+    (optionally ``?since=<ISO date/datetime>``) as NDJSON or CSV, chosen
+    with ``?format=`` or the Accept header.
+    """
+    export_kind = None
+
+    @action(detail=False, renderer_classes=[NDJSONRenderer, CSVRenderer])
+    def export(self, request):
+        try:
+            since = parse_since(request.query_params.get('since'))
+        except ValueError as exc:
+            raise ValidationError({'since': [str(exc)]})
+        return streaming_response(
+            self.export_kind, request.accepted_renderer.format, since,
+            asynchronous=isinstance(request._request, ASGIRequest)
+        )
+
+# Models each cached snapshot is built from; a change to any of them
+# invalidates the snapshot.
+DASHBOARD_MODELS = (Product, Category, Customer, Sale, SaleItem, DailySales)
+DASHBOARD_STATS_MODELS = (Product, Sale, SaleItem, Customer, DailySales)
+
+def sale_items_prefetch():
+    """
+    Prefetch for ``Sale.items`` that also joins the product, as
+    ``SaleSerializer`` renders each item's product name.
+    """
+    return Prefetch('items', queryset=SaleItem.objects.select_related('product'))
 
 class DashboardView(LoginRequiredMixin, TemplateView):
     template_name = 'products/dashboard.html'
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        
-        # Get date range for filtering (last 30 days)
-        end_date = timezone.now()
-        start_date = end_date - timedelta(days=30)
-        
+        context.update(cached_snapshot(
+            'dashboard', DASHBOARD_MODELS, self.get_dashboard_data,
+            timezone.localdate().isoformat(), settings.LOW_STOCK_THRESHOLD
+        ))
+        return context
+
+    def get_dashboard_data(self):
+        """
+        Build the dashboard figures. The result is cached per day and data
+        version, so querysets are evaluated into lists here.
+        """
+        data = {}
+        for part in dashboard_parts():
+            data.update(part())
+        return data
+
+def dashboard_parts():
+    """
+    The dashboard's independent queries, as functions returning part of
+    its context. ``products.async_views`` runs them concurrently.
+    """
+    # Get date range for filtering (last 30 days)
+    end_date = timezone.now()
+    start_date = end_date - timedelta(days=30)
+
+    def totals():
         # Basic statistics
-        context['total_products'] = Product.objects.count()
-        context['total_stock'] = Product.objects.aggregate(total=Sum('stock'))['total'] or 0
-        context['total_categories'] = Category.objects.count()
-        context['total_customers'] = Customer.objects.count()
-        
-        # Sales data for the chart
-        sales_data = Sale.objects.filter(
-            sale_date__range=(start_date, end_date),
-            status='completed'
-        ).annotate(
-            date=TruncDate('sale_date')
-        ).values('date').annotate(
-            amount=Sum('total_amount')
-        ).order_by('date')
-        
+        return {
+            'total_products': Product.objects.count(),
+            'total_stock': Product.objects.aggregate(total=Sum('stock'))['total'] or 0,
+            'total_categories': Category.objects.count(),
+            'total_customers': Customer.objects.count(),
+        }
+
+    def sales():
+        # Sales data for the chart, read from the daily rollup
+        sales_data = list(DailySales.objects.filter(
+            date__gte=timezone.localdate(start_date),
+            date__lte=timezone.localdate(end_date)
+        ).order_by('date'))
+
+        data = {}
         if sales_data:
-            context['sales_data'] = True
-            context['dates'] = [sale['date'].strftime('%Y-%m-%d') for sale in sales_data]
-            context['sales_amounts'] = [float(sale['amount']) for sale in sales_data]
-        
-        # Top selling products
-        context['top_products'] = Product.objects.annotate(
-            sales_count=Count('saleitem')
-        ).order_by('-sales_count')[:5]
-        
-        # Recent sales
-        context['recent_sales'] = Sale.objects.select_related(
+            data['sales_data'] = True
+            data['dates'] = [day.date.strftime('%Y-%m-%d') for day in sales_data]
+            data['sales_amounts'] = [float(day.total_amount) for day in sales_data]
+
+        # Total sales amount for last 30 days
+        data['total_sales'] = sum(day.total_amount for day in sales_data)
+        return data
+
+    def top_products():
+        # Top selling products, from the maintained counters
+        return {'top_products': list(Product.objects.select_related(
+            'category'
+        ).filter(units_sold__gt=0).order_by('-units_sold', 'id')[:5])}
+
+    def recent_sales():
+        return {'recent_sales': list(Sale.objects.select_related(
             'customer'
-        ).order_by('-sale_date')[:5]
-        
-        # Low stock products (less than 10 items)
-        context['low_stock_products'] = Product.objects.select_related(
+        ).order_by('-sale_date')[:5])}
+
+    def low_stock_products():
+        # Same rule as the low_stock action and the low_stock events.
+        return {'low_stock_products': list(Product.objects.select_related(
             'category'
-        ).filter(stock__lt=10).order_by('stock')[:5]
-        
-        # Total sales amount for last 30 days
-        context['total_sales'] = Sale.objects.filter(
-            sale_date__range=(start_date, end_date),
-            status='completed'
-        ).aggregate(total=Sum('total_amount'))['total'] or 0
-        
-        return context
+        ).filter(stock__lte=settings.LOW_STOCK_THRESHOLD).order_by('stock')[:5])}
+
+    return [totals, sales, top_products, recent_sales, low_stock_products]
 
-class ProductListView(LoginRequiredMixin, ListView):
+class ProductListView(LoginRequiredMixin, CachedListViewMixin, CursorListViewMixin, ListView):
     model = Product
     template_name = 'products/product_list.html'
+    content_template_name = 'products/product_list_content.html'
+    cache_models = (Product, Category)
     context_object_name = 'products'
     paginate_by = 10
+    cursor_pagination_class = ProductCursorPagination
     
     def get_queryset(self):
         queryset = super().get_queryset()
@@ -84,10 +155,14 @@ class ProductListView(LoginRequiredMixin, ListView):
         if category_id:
             queryset = queryset.filter(category_id=category_id)
         if search:
-            queryset = queryset.filter(name__icontains=search)
+            queryset = search_products(queryset, search)
         
         return queryset.select_related('category')
 
+    def use_cursor_pagination(self):
+        # Keep search results in relevance order.
+        return not self.request.GET.get('search')
+
 class ProductCreateView(LoginRequiredMixin, CreateView):
     model = Product
     template_name = 'products/product_form.html'
@@ -116,18 +191,16 @@ class ProductDeleteView(LoginRequiredMixin, DeleteView):
         messages.success(request, 'Product deleted successfully.')
         return super().delete(request, *args, **kwargs)
 
-class CategoryListView(LoginRequiredMixin, ListView):
+class CategoryListView(LoginRequiredMixin, CachedListViewMixin, ListView):
     model = Category
     template_name = 'products/category_list.html'
+    content_template_name = 'products/category_list_content.html'
+    cache_models = (Category,)
     context_object_name = 'categories'
     paginate_by = 10
 
-    def get_queryset(self):
-        return super().get_queryset().annotate(
-            products_count=Count('products')
-        )
-
-class CategoryViewSet(viewsets.ModelViewSet):
+class CategoryViewSet(CursorPaginationMixin, ConditionalGetMixin, ValuesListMixin,
+                      viewsets.ModelViewSet):
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
     filter_backends = [filters.SearchFilter]
@@ -136,62 +209,90 @@ class CategoryViewSet(viewsets.ModelViewSet):
     @action(detail=True)
     def products(self, request, pk=None):
         category = self.get_object()
+        # The reverse manager already attaches ``category`` to each product.
         products = category.products.all()
-        serializer = ProductSerializer(products, many=True)
-        return Response(serializer.data)
+        return self.conditional_list_response(
+            products,
+            lambda: self.get_paginated_action_response(
+                products, ProductSerializer, ProductCursorPagination
+            ),
+            fields=ProductViewSet.last_modified_fields,
+        )
 
-class ProductViewSet(viewsets.ModelViewSet):
-    queryset = Product.objects.all()
+class ProductViewSet(CursorPaginationMixin, ConditionalGetMixin, ValuesListMixin, ExportMixin,
+                     viewsets.ModelViewSet):
+    queryset = Product.objects.select_related('category')
     serializer_class = ProductSerializer
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter]
+    # Products render their category's name.
+    last_modified_fields = ('updated_at', 'category__updated_at')
+    cursor_pagination_class = ProductCursorPagination
+    export_kind = 'products'
+    filter_backends = [DjangoFilterBackend, FullTextSearchFilter]
     filterset_fields = ['category']
     search_fields = ['name', 'description']
 
+    def use_cursor_pagination(self):
+        # Keep search results in relevance order.
+        return not self.request.query_params.get('search')
+
     @action(detail=False)
     def low_stock(self, request):
-        threshold = int(request.query_params.get('threshold', 10))
-        products = Product.objects.filter(stock__lte=threshold)
-        serializer = self.get_serializer(products, many=True)
-        return Response(serializer.data)
+        try:
+            threshold = int(request.query_params.get('threshold', settings.LOW_STOCK_THRESHOLD))
+        except ValueError:
+            raise ValidationError({'threshold': ['A valid integer is required.']})
+        products = self.get_queryset().filter(stock__lte=threshold)
+        return self.conditional_list_response(
+            products, lambda: Response(self.values_data(products))
+        )
 
-class CustomerListView(LoginRequiredMixin, ListView):
+class CustomerListView(LoginRequiredMixin, CachedListViewMixin, CursorListViewMixin, ListView):
     model = Customer
     template_name = 'products/customer_list.html'
+    content_template_name = 'products/customer_list_content.html'
+    cache_models = (Customer,)
     context_object_name = 'customers'
     paginate_by = 10
+    cursor_pagination_class = CustomerCursorPagination
 
-    def get_queryset(self):
-        return super().get_queryset().annotate(
-            total_purchases=Count('sales')
-        )
-
-class CustomerViewSet(viewsets.ModelViewSet):
+class CustomerViewSet(CursorPaginationMixin, ConditionalGetMixin, ValuesListMixin,
+                      viewsets.ModelViewSet):
     queryset = Customer.objects.all()
     serializer_class = CustomerSerializer
+    cursor_pagination_class = CustomerCursorPagination
     filter_backends = [filters.SearchFilter]
     search_fields = ['name', 'email']
 
     @action(detail=True)
     def purchase_history(self, request, pk=None):
         customer = self.get_object()
-        sales = customer.sales.all()
-        serializer = SaleSerializer(sales, many=True)
-        return Response(serializer.data)
+        sales = customer.sales.prefetch_related(sale_items_prefetch())
+        return self.get_paginated_action_response(
+            sales, SaleSerializer, SaleCursorPagination
+        )
 
-class SaleListView(LoginRequiredMixin, ListView):
+class SaleListView(LoginRequiredMixin, CachedListViewMixin, CursorListViewMixin, ListView):
     model = Sale
     template_name = 'products/sale_list.html'
+    content_template_name = 'products/sale_list_content.html'
+    cache_models = (Sale, Customer)
     context_object_name = 'sales'
     paginate_by = 10
+    cursor_pagination_class = SaleCursorPagination
 
     def get_queryset(self):
         return super().get_queryset().select_related('customer')
 
-class SaleViewSet(viewsets.ModelViewSet):
-    queryset = Sale.objects.all()
+class SaleViewSet(CursorPaginationMixin, ValuesListMixin, ExportMixin, viewsets.ModelViewSet):
+    queryset = Sale.objects.select_related('customer').prefetch_related(
+        sale_items_prefetch()
+    )
     serializer_class = SaleSerializer
+    cursor_pagination_class = SaleCursorPagination
+    export_kind = 'sales'
     filter_backends = [DjangoFilterBackend]
     filterset_fields = ['status', 'customer']
+    bulk_max_batch = 10000
 
     def create(self, request, *args, **kwargs):
         serializer = self.get_serializer(
@@ -200,28 +301,121 @@ class SaleViewSet(viewsets.ModelViewSet):
         )
         serializer.is_valid(raise_exception=True)
         self.perform_create(serializer)
+        # Reload with the related rows the response renders.
+        serializer.instance = self.get_queryset().get(pk=serializer.instance.pk)
         return Response(serializer.data)
 
+    def perform_update(self, serializer):
+        super().perform_update(serializer)
+        serializer.instance = self.get_queryset().get(pk=serializer.instance.pk)
+
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        """
+        Create a batch of sales (e.g. a POS terminal sync) in one transaction.
+        Either every sale is written or none is; the response has one entry
+        per submitted sale, in order.
+        """
+        serializer = BulkSaleSerializer(
+            data=request.data, many=True, max_length=self.bulk_max_batch
+        )
+        serializer.is_valid(raise_exception=True)
+        try:
+            sales = create_sales_bulk(serializer.validated_data)
+        except SaleValidationError as exc:
+            return Response(exc.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        results = [
+            {
+                'id': sale.id,
+                'customer': sale.customer_id,
+                'total_amount': str(sale.total_amount),
+                'status': sale.status,
+                'items': len(data['items'])
+            }
+            for sale, data in zip(sales, serializer.validated_data)
+        ]
+        return Response(results, status=status.HTTP_201_CREATED)
+
     @action(detail=False)
     def dashboard_stats(self, request):
-        total_sales = Sale.objects.filter(status='completed').aggregate(
-            total=Sum('total_amount'))['total'] or 0
-        top_products = SaleItem.objects.values(
-            'product__name').annotate(
-            total_quantity=Sum('quantity'),
-            total_sales=Sum('total_price')
-        ).order_by('-total_sales')[:5]
-        recent_sales = Sale.objects.filter(
-            status='completed').order_by('-created_at')[:5]
-
-        return Response({
-            'total_sales': total_sales,
-            'top_products': top_products,
-            'recent_sales': SaleSerializer(recent_sales, many=True).data
-        })
-
-class SaleItemViewSet(viewsets.ModelViewSet):
-    queryset = SaleItem.objects.all()
+        etag, last_modified = version_validators(request, DASHBOARD_STATS_MODELS)
+        return conditional_response(request, etag, last_modified, lambda: Response(cached_snapshot(
+            'dashboard_stats', DASHBOARD_STATS_MODELS, self.get_dashboard_stats
+        )))
+
+    def get_dashboard_stats(self):
+        data = {}
+        for part in dashboard_stats_parts(self.get_queryset()):
+            data.update(part())
+        return data
+
+def dashboard_stats_parts(sales):
+    """
+    The independent queries of ``dashboard_stats``; see ``dashboard_parts``.
+    """
+    def total_sales():
+        return {'total_sales': DailySales.objects.aggregate(
+            total=Sum('total_amount'))['total'] or 0}
+
+    def top_products():
+        return {'top_products': list(Product.objects.filter(revenue__gt=0).values(
+            product__name=F('name'),
+            total_quantity=F('units_sold'),
+            total_sales=F('revenue')
+        ).order_by('-revenue', 'id')[:5])}
+
+    def recent_sales():
+        recent = sales.filter(status='completed').order_by('-created_at')[:5]
+        return {'recent_sales': SaleSerializer(recent, many=True).data}
+
+    return [total_sales, top_products, recent_sales]
+
+class SaleItemViewSet(CursorPaginationMixin, ValuesListMixin, ExportMixin, viewsets.ModelViewSet):
+    queryset = SaleItem.objects.select_related('product')
     serializer_class = SaleItemSerializer
+    cursor_pagination_class = SaleItemCursorPagination
+    export_kind = 'sale-items'
     filter_backends = [DjangoFilterBackend]
     filterset_fields = ['sale', 'product']
+
+@api_view(['GET'])
+def sales_analytics(request):
+    """
+    Completed sales over time as dense series, optionally per category,
+    product or customer; see ``products.analytics`` for the parameters.
+    ``?source=snapshot`` computes them from the columnar sales snapshot
+    (``products.snapshot``) instead of the database.
+    """
+    query = analytics.parse_query(request.query_params)
+    source = request.query_params.get('source') or 'database'
+    if source == 'snapshot':
+        try:
+            sales_snapshot = snapshot.SalesSnapshot()
+        except snapshot.SnapshotMissing as exc:
+            raise ValidationError({'source': [str(exc)]})
+        etag = make_etag(
+            request, sales_snapshot.meta['rows'], sales_snapshot.meta['updated_at'], query['start'], query['end']
+        )
+        return conditional_response(
+            request, etag, None, lambda: Response(snapshot.sales_series(**query, snapshot=sales_snapshot))
+        )
+    if source != 'database':
+        raise ValidationError({'source': ['Must be one of: database, snapshot.']})
+    # The default window moves with the clock, so the ETag covers the
+    # resolved range as well as the data versions.
+    etag = make_etag(
+        request, *get_data_versions(*analytics.source_models(query)), query['start'], query['end']
+    )
+    return conditional_response(
+        request, etag, None, lambda: Response(analytics.cached_sales_series(query))
+    )
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def task_stats(request):
+    """
+    Background task queue depth and wait/run times. Thread pool figures
+    are for the process that serves the request.
+    """
+    return Response(tasks.stats())
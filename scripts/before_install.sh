@@ -11,4 +11,8 @@ python manage.py check --database default
 echo "Running database migrations..."
 python manage.py migrate --noinput
 
+# Create the cache table (no-op unless CACHE_URL uses the database backend)
+echo "Creating cache table..."
+python manage.py createcachetable
+
 echo "Before install tasks completed"